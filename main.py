@@ -1,10 +1,13 @@
 import sys
 import os
+import multiprocessing
 from pathlib import Path
-from PySide6.QtWidgets import QApplication
-from qt_material import apply_stylesheet
 
-from src.frontend.main_windows import MainWindow
+# 界面和编译管道都在 main() 中按需导入：
+# 编译子进程 (spawn) 会重新导入本模块，不应为此加载 Qt；--profile-startup 也需要从导入开始计时
+from src.frontend.startup_profiler import StartupProfiler
+
+PROFILE_STARTUP_FLAG = "--profile-startup"
 
 
 def check_env():
@@ -13,10 +16,20 @@ def check_env():
     os.makedirs(root_dir / "data/scores_image", exist_ok=True)
 
 def main():
-    
+    # 打包后的程序需要它来启动编译子进程 (spawn)
+    multiprocessing.freeze_support()
+    # python main.py --profile-startup：打印各启动阶段和导入的耗时
+    profiler = StartupProfiler(PROFILE_STARTUP_FLAG in sys.argv)
+    argv = [arg for arg in sys.argv if arg != PROFILE_STARTUP_FLAG]
     check_env()
-    app = QApplication(sys.argv)
+
+    from PySide6.QtWidgets import QApplication
+    from qt_material import apply_stylesheet
+    profiler.mark("导入 Qt")
+
+    app = QApplication(argv)
     apply_stylesheet(app, theme='light_red.xml',css_file='custom.css')
+    profiler.mark("QApplication + 主题")
 
     extra_css = """
 /* ------------------------------------------- */
@@ -82,11 +95,16 @@ QPushButton:disabled {
 }
     """
 
+    from src.frontend.main_windows import MainWindow
+    profiler.mark("导入主窗口")
+    # 第一次编译在事件循环开始后才在后台提交，不阻塞窗口显示
     window = MainWindow()
+    profiler.mark("创建主窗口")
 
     current_style = app.styleSheet()
     app.setStyleSheet(current_style + extra_css)
 
+    profiler.watch_first_paint(window)
     window.show()
     app.exec()
 
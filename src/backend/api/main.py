@@ -0,0 +1,350 @@
+"""
+本地渲染服务：多个编辑器共用一组预热好的渲染进程 (只依赖标准库)。
+
+    python -m src.backend.api.main --host 0.0.0.0 --port 8765 --workers 4
+
+接口：
+    POST /render?format=png|svg|json&page=N&scale=S    请求体为乐谱文本 (UTF-8)
+        png / svg 返回第 N 页 (从 0 开始，默认 0)，响应头 X-Page-Count 为总页数；json 返回 AST。
+    GET  /stats     请求计数、队列状态和最近请求的延迟分位数
+    GET  /health
+
+编译和渲染在进程池中执行；内容 (格式、缩放、文本) 相同的并发请求合并为一次渲染。
+等待执行的任务放在有界队列中，队列满时返回 503 和 Retry-After，由客户端稍后重试。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from src.backend.api.render_worker import (
+    FORMAT_JSON, FORMAT_PNG, FORMAT_SVG, RENDER_FORMATS, ScoreCompileError, init_worker, render_job
+)
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# 请求体 (乐谱文本) 的大小上限
+MAX_BODY_BYTES = 1024 * 1024
+# 请求头的大小上限和空闲连接的超时 (秒)
+MAX_HEADER_BYTES = 16 * 1024
+IDLE_TIMEOUT_SECONDS = 30
+# 统计延迟分位数时保留的最近请求数
+LATENCY_WINDOW = 1024
+# 队列满时建议客户端的重试间隔 (秒)
+RETRY_AFTER_SECONDS = 1
+
+CONTENT_TYPES = {
+    FORMAT_PNG: "image/png",
+    FORMAT_SVG: "image/svg+xml",
+    FORMAT_JSON: "application/json; charset=utf-8",
+}
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 422: "Unprocessable Entity", 431: "Request Header Fields Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+@dataclass
+class RenderJob:
+    """队列中的一个渲染任务 (内容相同的请求共享同一个 future)。"""
+    key: str
+    text: str
+    output_format: str
+    scale: float
+    future: asyncio.Future
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """最近秩法求分位数 (sorted_values 已排序且非空)。"""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class RenderServer:
+    """
+    asyncio HTTP 渲染服务。
+
+    - 请求按 (格式, 缩放, 文本) 的哈希合并：同一内容已在队列或执行中时，新请求直接等待同一个结果。
+    - 不同内容的任务进入容量为 max_queue 的有界队列，由 workers 个调度协程取出交给进程池执行；
+      队列满时立即返回 503，而不是让等待时间无限增长。
+    - 工作进程内部使用 ScoreService 的编译缓存，重复提交的乐谱在进程内和磁盘上都能命中。
+    """
+    def __init__(self, workers: int, max_queue: int, score_type: str = "pipa"):
+        self.workers = max(1, workers)
+        self.score_type = score_type
+        self.queue: "asyncio.Queue[RenderJob]" = asyncio.Queue(maxsize=max(1, max_queue))
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {"requests": 0, "rendered": 0, "coalesced": 0, "rejected": 0, "failed": 0}
+        self.running = 0
+        self.started = time.time()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._dispatchers: List[asyncio.Task] = []
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=init_worker, initargs=(self.score_type,)
+        )
+        # 预先启动全部工作进程，第一个请求不必等待进程创建和字体加载
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, os.getpid) for _ in range(self.workers)))
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    # -----------------------------------------------------------
+    # 任务调度
+    # -----------------------------------------------------------
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            self.running += 1
+            try:
+                pages = await loop.run_in_executor(
+                    self.executor, render_job, job.text, job.output_format, job.scale, self.score_type
+                )
+                self.counters["rendered"] += 1
+                if not job.future.done():
+                    job.future.set_result(pages)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self.running -= 1
+                self.in_flight.pop(job.key, None)
+                self.queue.task_done()
+
+    async def render(self, text: str, output_format: str, scale: float) -> List[bytes]:
+        key = hashlib.sha256(f"{output_format}\0{scale!r}\0{text}".encode("utf-8")).hexdigest()
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait(RenderJob(key, text, output_format, scale, future))
+            except asyncio.QueueFull:
+                self.counters["rejected"] += 1
+                raise HttpError(503, "Render queue is full, retry later.",
+                                {"Retry-After": str(RETRY_AFTER_SECONDS)})
+            self.in_flight[key] = future
+        # shield：一个客户端断开不应取消其他客户端共享的结果
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        latency_ms = {}
+        if latencies:
+            for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                latency_ms[name] = round(percentile(latencies, fraction) * 1000, 2)
+            latency_ms["max"] = round(latencies[-1] * 1000, 2)
+        return {
+            **self.counters,
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "in_flight": len(self.in_flight),
+            "latency_samples": len(latencies),
+            "latency_ms": latency_ms,
+            "uptime_seconds": round(time.time() - self.started, 1),
+        }
+
+    # -----------------------------------------------------------
+    # 请求处理
+    # -----------------------------------------------------------
+
+    async def handle_render(self, query: Dict[str, List[str]], body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        output_format = query.get("format", [FORMAT_PNG])[0].lower()
+        if output_format not in RENDER_FORMATS:
+            raise HttpError(400, f"Unsupported format '{output_format}'; choose from {', '.join(RENDER_FORMATS)}.")
+        try:
+            page = int(query.get("page", ["0"])[0])
+            scale = float(query.get("scale", ["1"])[0])
+        except ValueError:
+            raise HttpError(400, "'page' must be an integer and 'scale' a number.")
+        if not 0 < scale <= 8:
+            raise HttpError(400, "'scale' must be in (0, 8].")
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            raise HttpError(400, "Request body must be UTF-8 score text.")
+        if output_format == FORMAT_JSON:
+            # AST 与缩放无关，统一缩放使相同文本的请求可以合并
+            scale = 1.0
+
+        start = time.perf_counter()
+        try:
+            pages = await self.render(text, output_format, scale)
+        except ScoreCompileError as e:
+            self.counters["failed"] += 1
+            raise HttpError(422, str(e))
+        except BrokenProcessPool:
+            self.counters["failed"] += 1
+            raise HttpError(500, "Render worker pool is broken; restart the server.")
+        except HttpError:
+            raise
+        except Exception as e:
+            self.counters["failed"] += 1
+            raise HttpError(500, f"{type(e).__name__}: {e}")
+        # 只统计渲染完成 (包括合并) 的请求：被 503 拒绝的请求立即返回，会拉低延迟分位数
+        self.latencies.append(time.perf_counter() - start)
+
+        if not pages:
+            raise HttpError(422, "The score produced no pages.")
+        if not 0 <= page < len(pages):
+            raise HttpError(404, f"Page {page} out of range (0..{len(pages) - 1}).")
+        headers = {"Content-Type": CONTENT_TYPES[output_format], "X-Page-Count": str(len(pages))}
+        return 200, headers, pages[page]
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        url = urlsplit(target)
+        if url.path == "/render":
+            if method != "POST":
+                raise HttpError(405, "Use POST /render.", {"Allow": "POST"})
+            self.counters["requests"] += 1
+            return await self.handle_render(parse_qs(url.query), body)
+        if url.path in ("/stats", "/health"):
+            if method != "GET":
+                raise HttpError(405, f"Use GET {url.path}.", {"Allow": "GET"})
+            payload = self.stats() if url.path == "/stats" else {"status": "ok"}
+            return 200, {"Content-Type": "application/json"}, json.dumps(payload).encode("utf-8")
+        raise HttpError(404, f"No route for {url.path}.")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """HTTP/1.1 连接：支持 keep-alive，按顺序处理同一连接上的请求。"""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT_SECONDS)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 431, {}, b"Request headers too large.\n", keep_alive=False)
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {}, b"Malformed request line.\n", keep_alive=False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                try:
+                    length = int(headers.get("content-length", "0"))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY_BYTES:
+                    status = 400 if length < 0 else 413
+                    message = f"Body must be at most {MAX_BODY_BYTES} bytes.\n" if status == 413 else "Bad Content-Length.\n"
+                    await self._respond(writer, status, {}, message.encode("utf-8"), keep_alive=False)
+                    break
+                try:
+                    body = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                try:
+                    status, response_headers, payload = await self.dispatch(method.upper(), target, body)
+                except HttpError as e:
+                    status, response_headers, payload = e.status, e.headers, f"{e.message}\n".encode("utf-8")
+                await self._respond(writer, status, response_headers, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, headers: Dict[str, str], body: bytes, keep_alive: bool):
+        headers = {"Content-Type": "text/plain; charset=utf-8", **headers}
+        headers["Content-Length"] = str(len(body))
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+
+async def serve(args: argparse.Namespace):
+    server = RenderServer(args.workers, args.max_queue, args.score_type)
+    await server.start()
+    listener = await asyncio.start_server(
+        server.handle_connection, args.host, args.port, limit=MAX_HEADER_BYTES
+    )
+    address = ", ".join(str(sock.getsockname()) for sock in listener.sockets)
+    print(f"Render server listening on {address} with {server.workers} worker(s), queue {server.queue.maxsize}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    workers = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(
+        prog="python -m src.backend.api.main",
+        description="本地乐谱渲染服务 (PNG / SVG / AST JSON)。",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"监听地址 (默认 {DEFAULT_HOST}，局域网共享时用 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口 (默认 {DEFAULT_PORT})")
+    parser.add_argument("--workers", type=int, default=workers, help="渲染进程数 (默认为 CPU 核数)")
+    parser.add_argument("--max-queue", type=int, default=None,
+                        help="等待执行的任务数上限，超过时返回 503 (默认为渲染进程数的 4 倍)")
+    parser.add_argument("--score-type", default="pipa", help="乐谱类型 (默认 pipa)")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    if args.max_queue is None:
+        args.max_queue = max(1, args.workers) * 4
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+渲染服务的工作进程：每个进程一个预热好的 ScoreService，在进程池中执行编译和渲染。
+"""
+import contextlib
+import io
+import json
+from typing import List
+
+
+# 支持的输出格式
+FORMAT_PNG = "png"
+FORMAT_SVG = "svg"
+FORMAT_JSON = "json"
+RENDER_FORMATS = (FORMAT_PNG, FORMAT_SVG, FORMAT_JSON)
+
+
+class ScoreCompileError(Exception):
+    """乐谱文本无法编译 (解析或排版失败)，对应 HTTP 422。"""
+
+
+# 每个工作进程一个 ScoreService (由 init_worker 创建)
+_service = None
+
+
+def init_worker(score_type: str = "pipa"):
+    """工作进程初始化：创建 ScoreService，预热 Parser 和渲染字体。"""
+    global _service
+    from src.backend.app.compile_cache import persistent_compile_cache
+    from src.backend.app.services import ScoreService
+    from src.scorelang.renderers.pipa_image_renderer import warm_up_fonts
+
+    _service = ScoreService(persistent_compile_cache())
+    with contextlib.redirect_stdout(io.StringIO()):
+        _service._get_parser(score_type)
+        warm_up_fonts(background=False)
+
+
+def render_job(text: str, output_format: str, scale: float, score_type: str = "pipa") -> List[bytes]:
+    """
+    编译乐谱文本并渲染全部页面，返回每页的字节 (png / svg)；json 格式返回只含一项的 AST JSON。
+    编译失败时抛出 ScoreCompileError。
+    """
+    from src.scorelang.core.pipeline_context import PipelineContext
+
+    # 编译管道会打印大量调试信息，服务中丢弃
+    with contextlib.redirect_stdout(io.StringIO()):
+        context = PipelineContext()
+        context.set_raw_text(text)
+        try:
+            context = _service.process_score(context, score_type)
+        except RuntimeError as e:
+            raise ScoreCompileError(str(e))
+
+        if output_format == FORMAT_JSON:
+            return [json.dumps(context.node.to_dict(), ensure_ascii=False).encode("utf-8")]
+        if output_format == FORMAT_SVG:
+            return [page.encode("utf-8") for page in _service.render_svg_pages(context, score_type)]
+        return _service.render_png_pages(context, score_type, scale=scale)
@@ -0,0 +1,222 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+# 默认的磁盘缓存目录：与 data/scores_saved 等一样位于运行目录下
+# (打包后程序自身所在的目录可能是只读的)，创建仓库时解析为绝对路径
+DEFAULT_ARTIFACT_STORE_DIR = Path("data") / ".cache"
+# 磁盘缓存的默认容量上限 (字节)
+DEFAULT_ARTIFACT_STORE_BYTES = 1024 * 1024 * 1024
+# 垃圾回收时删到容量上限的这个比例以下，避免每次写入都触发回收
+GC_LOW_WATER_RATIO = 0.8
+# 回收锁超过这个时间 (秒) 仍未释放，视为持锁进程已退出
+GC_LOCK_STALE_SECONDS = 60
+
+GC_LOCK_NAME = ".gc.lock"
+OBJECT_SUFFIX = ".pkl"
+IMAGE_SUFFIX = ".page"
+TEMP_PREFIX = ".tmp-"
+
+
+class ArtifactStore:
+    """
+    内容寻址的磁盘编译产物仓库：root/<阶段>/<键前两位>/<键><后缀>。
+
+    - 写入：先写同目录下的临时文件再 os.replace，读者永远看不到写了一半的文件；
+      同一个键的内容由上游哈希唯一确定，多个进程同时写同一个键也是安全的。
+    - 读取：命中时更新文件的修改时间作为 LRU 依据；文件在读取前被其他进程回收时按未命中处理。
+    - 回收：写入量累计到一定程度后检查总大小，超过 max_bytes 时按修改时间删除最旧的条目，
+      同一时刻只有一个进程 (持有 .gc.lock) 执行回收。
+    write_behind=True 时编码和写盘在后台线程中进行；排队的写入达到 max_pending_writes 时，
+    新的写入等待队列腾出位置 (与 BackgroundPageWriter 相同的背压方式)。
+    """
+    def __init__(
+        self,
+        root: Path = DEFAULT_ARTIFACT_STORE_DIR,
+        max_bytes: int = DEFAULT_ARTIFACT_STORE_BYTES,
+        write_behind: bool = True,
+        max_pending_writes: int = 16
+    ):
+        # 相对路径按创建时的运行目录解析，之后切换运行目录不影响仓库位置
+        self.root = Path.cwd() / root
+        self.max_bytes = max_bytes
+        self.write_behind = write_behind
+        self._pending = threading.BoundedSemaphore(max_pending_writes)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # 本进程自上次回收以来写入的字节数 (None 表示尚未检查过磁盘上的总大小)
+        self._written_since_gc: Optional[int] = None
+
+    def _path(self, stage: str, key: str, suffix: str) -> Path:
+        return self.root / stage / key[:2] / f"{key}{suffix}"
+
+    # -----------------------------------------------------------
+    # 读取
+    # -----------------------------------------------------------
+
+    def _read(self, path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def get_bytes(self, stage: str, key: str) -> Optional[bytes]:
+        return self._read(self._path(stage, key, OBJECT_SUFFIX))
+
+    def get_image(self, stage: str, key: str):
+        """读取一页光栅化结果，未命中或文件损坏时返回 None。"""
+        data = self._read(self._path(stage, key, IMAGE_SUFFIX))
+        if data is None:
+            return None
+        try:
+            from PIL import Image
+            mode, size, pixels = pickle.loads(data)
+            return Image.frombytes(mode, size, zlib.decompress(pixels))
+        except Exception as e:
+            print(f"Warning: Discarding unreadable cached page {key}: {e}")
+            self._remove(self._path(stage, key, IMAGE_SUFFIX))
+            return None
+
+    # -----------------------------------------------------------
+    # 写入
+    # -----------------------------------------------------------
+
+    def put_bytes(self, stage: str, key: str, data: bytes):
+        self._submit(self._path(stage, key, OBJECT_SUFFIX), lambda: data)
+
+    def put_image(self, stage: str, key: str, image):
+        """保存一页 (调用方保证之后不再修改 image)；像素用快速的 zlib 压缩，编码也在后台进行。"""
+        def encode() -> bytes:
+            return pickle.dumps((image.mode, image.size, zlib.compress(image.tobytes(), 1)))
+        self._submit(self._path(stage, key, IMAGE_SUFFIX), encode)
+
+    def _submit(self, path: Path, encode):
+        if path.exists():
+            return
+        if not self.write_behind:
+            self._write(path, encode)
+            return
+        self._pending.acquire()
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-store")
+        future = self._executor.submit(self._write, path, encode)
+        future.add_done_callback(lambda _: self._pending.release())
+
+    def _write(self, path: Path, encode):
+        try:
+            data = encode()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=TEMP_PREFIX)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                self._remove(Path(tmp_path))
+                raise
+        except Exception as e:
+            print(f"Warning: Failed to write cache entry {path}: {e}")
+            return
+
+        if self._written_since_gc is None:
+            self._written_since_gc = self.max_bytes
+        else:
+            self._written_since_gc += len(data)
+        # 写入量累计到容量余量 (上限与低水位之差) 时才扫描目录，避免每次写入都遍历
+        if self._written_since_gc >= self.max_bytes * (1 - GC_LOW_WATER_RATIO):
+            self.gc()
+
+    def flush(self):
+        """等待所有后台写入完成 (批处理结束时调用，保证结果落盘)。"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    # -----------------------------------------------------------
+    # 回收
+    # -----------------------------------------------------------
+
+    @staticmethod
+    def _remove(path: Path):
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for dirpath, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                path = Path(dirpath) / file_name
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                if file_name.startswith(TEMP_PREFIX):
+                    # 写入进程中途退出留下的临时文件
+                    if time.time() - stat.st_mtime > GC_LOCK_STALE_SECONDS:
+                        self._remove(path)
+                    continue
+                if file_name.endswith((OBJECT_SUFFIX, IMAGE_SUFFIX)):
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _acquire_gc_lock(self) -> Optional[Path]:
+        lock_path = self.root / GC_LOCK_NAME
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                stale = time.time() - lock_path.stat().st_mtime > GC_LOCK_STALE_SECONDS
+            except OSError:
+                stale = False
+            if stale:
+                self._remove(lock_path)
+            return None
+        except OSError:
+            return None
+        os.close(fd)
+        return lock_path
+
+    def gc(self) -> int:
+        """总大小超过 max_bytes 时删除最久未使用的条目，返回删除的字节数；其他进程正在回收时直接返回 0。"""
+        lock_path = self._acquire_gc_lock()
+        if lock_path is None:
+            return 0
+        removed = 0
+        try:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                target = self.max_bytes * GC_LOW_WATER_RATIO
+                for _, size, path in sorted(entries):
+                    if total <= target:
+                        break
+                    self._remove(path)
+                    total -= size
+                    removed += size
+            self._written_since_gc = 0
+        finally:
+            self._remove(lock_path)
+        return removed
+
+    def clear(self):
+        """删除所有条目。"""
+        self.flush()
+        for _, _, path in self._entries():
+            self._remove(path)
@@ -0,0 +1,212 @@
+"""
+批量编译命令行：把目录下的所有乐谱文件编译为图片和/或 JSON AST。
+
+    python -m src.backend.app.batch data/scores_saved --out data/scores_image --formats image,json --workers 4
+
+每个工作进程启动时预热 Parser 和渲染字体，之后逐个处理分配到的文件；
+输出每个文件的耗时和最终的吞吐量汇总，有文件失败时以非零状态码退出。
+
+输出保留输入文件的相对路径：input_dir/a/b.score 的页面写入 out/a/b/，JSON 写入 out/a/b.json
+(不用乐谱标题命名，同名乐谱或不同子目录下的同名文件不会互相覆盖)。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+
+DEFAULT_INPUT_DIR = Path("data") / "scores_saved"
+DEFAULT_OUTPUT_DIR = Path("data") / "scores_image"
+SUPPORTED_FORMATS = ("image", "json")
+
+
+@dataclass
+class BatchResult:
+    """一个文件的编译结果 (在工作进程中生成，回传给主进程)。"""
+    path: str
+    ok: bool
+    seconds: float
+    pages: int = 0
+    outputs: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+# 每个工作进程一个 ScoreService (由 _init_worker 创建)
+_service = None
+_verbose = False
+
+
+def _init_worker(score_type: str, use_cache: bool, verbose: bool):
+    """工作进程初始化：创建 ScoreService，预热 Parser 和渲染字体。"""
+    global _service, _verbose
+    from src.backend.app.compile_cache import persistent_compile_cache
+    from src.backend.app.services import ScoreService
+    from src.scorelang.renderers.pipa_image_renderer import warm_up_fonts
+
+    _verbose = verbose
+    _service = ScoreService(compile_cache=persistent_compile_cache() if use_cache else None)
+    _service._get_parser(score_type)
+    warm_up_fonts(background=False)
+
+
+def output_name(path: Path, input_dir: Path) -> Path:
+    """文件的输出位置 (相对输出目录、不含扩展名)：保留相对 input_dir 的子目录。"""
+    return path.relative_to(input_dir).with_suffix("")
+
+
+def compile_file(path: str, score_type: str, output_dir: str, formats: Sequence[str], name: str) -> BatchResult:
+    """编译一个乐谱文件 (在工作进程中调用)，输出写入 output_dir/name/ 和 output_dir/name.json。"""
+    from src.scorelang.core.pipeline_context import PipelineContext
+
+    start = time.perf_counter()
+    target = Path(output_dir) / name
+    outputs = []
+    pages = 0
+    # 编译管道会打印大量调试信息，批处理时默认丢弃
+    log = contextlib.nullcontext() if _verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with log:
+            context = PipelineContext()
+            context.set_raw_text(Path(path).read_text(encoding="utf-8"))
+            context = _service.process_score(context, score_type)
+            pages = len(context.render_artifact.get("png", []))
+
+            if "json" in formats:
+                json_path = target.parent / f"{target.name}.json"
+                json_path.parent.mkdir(parents=True, exist_ok=True)
+                json_path.write_text(
+                    json.dumps(context.node.to_dict(), ensure_ascii=False, indent=2), encoding="utf-8"
+                )
+                outputs.append(str(json_path))
+            if "image" in formats:
+                image_dir = _service.render_score(
+                    context, score_type, "image", str(target.parent), folder_name=target.name
+                )
+                if not image_dir:
+                    raise RuntimeError("No pages were written.")
+                outputs.append(image_dir)
+    except Exception as e:
+        return BatchResult(path, False, time.perf_counter() - start, pages, outputs, f"{type(e).__name__}: {e}")
+    finally:
+        # 下一个文件开始前让编译缓存的后台写入落盘
+        if _service.compile_cache is not None:
+            _service.compile_cache.flush()
+
+    return BatchResult(path, True, time.perf_counter() - start, pages, outputs)
+
+
+def find_scores(input_dir: Path, pattern: str) -> List[Path]:
+    return sorted(path for path in input_dir.rglob(pattern) if path.is_file())
+
+
+def parse_formats(value: str) -> List[str]:
+    formats = [f.strip().lower() for f in value.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in SUPPORTED_FORMATS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(
+            f"unsupported format(s) {', '.join(unknown) or '(none)'}; choose from {', '.join(SUPPORTED_FORMATS)}"
+        )
+    return formats
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.backend.app.batch",
+        description="批量编译乐谱文件为图片和/或 JSON AST。",
+    )
+    parser.add_argument("input_dir", nargs="?", type=Path, default=DEFAULT_INPUT_DIR,
+                        help=f"乐谱文件所在目录 (递归查找，默认 {DEFAULT_INPUT_DIR})")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUTPUT_DIR,
+                        help=f"输出目录 (默认 {DEFAULT_OUTPUT_DIR})")
+    parser.add_argument("--formats", type=parse_formats, default=["image"],
+                        help="输出格式，逗号分隔：image, json (默认 image)")
+    parser.add_argument("--pattern", default="*.score", help="文件名匹配模式 (默认 *.score)")
+    parser.add_argument("--score-type", default="pipa", help="乐谱类型 (默认 pipa)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="工作进程数 (默认为 CPU 核数)")
+    parser.add_argument("--no-cache", action="store_true", help="不使用编译缓存 (内存和 data/.cache)")
+    parser.add_argument("--verbose", action="store_true", help="保留编译管道的调试输出")
+    return parser
+
+
+def find_collisions(files: Sequence[Path], input_dir: Path) -> Dict[Path, List[Path]]:
+    """输出位置相同的文件 (同一目录下只有扩展名不同)：{输出位置: [文件]}。"""
+    names: Dict[Path, List[Path]] = {}
+    for path in files:
+        names.setdefault(output_name(path, input_dir), []).append(path)
+    return {name: paths for name, paths in names.items() if len(paths) > 1}
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """
+    执行批处理，返回进程退出码：0 全部成功，1 有文件失败 (包括输出位置冲突)，2 没有找到输入文件。
+    """
+    files = find_scores(args.input_dir, args.pattern)
+    if not files:
+        print(f"No files matching '{args.pattern}' under {args.input_dir}.", file=sys.stderr)
+        return 2
+
+    collisions = find_collisions(files, args.input_dir)
+    if collisions:
+        # 编译前就失败，不写出任何结果 (否则后完成的文件会覆盖先完成的)
+        print("Some files would be written to the same output:", file=sys.stderr)
+        for name, paths in collisions.items():
+            print(f"  {args.out / name}: {', '.join(str(path) for path in paths)}", file=sys.stderr)
+        return 1
+
+    workers = max(1, min(args.workers, len(files)))
+    print(f"Compiling {len(files)} file(s) with {workers} worker(s) -> {args.out} ({', '.join(args.formats)})")
+
+    results: List[BatchResult] = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(args.score_type, not args.no_cache, args.verbose),
+    ) as executor:
+        futures = [
+            executor.submit(
+                compile_file, str(path), args.score_type, str(args.out), args.formats,
+                str(output_name(path, args.input_dir))
+            )
+            for path in files
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            status = "ok  " if result.ok else "FAIL"
+            print(f"[{done:>{len(str(len(files)))}}/{len(files)}] {status} {result.seconds:7.2f}s "
+                  f"{result.pages:4d} page(s)  {result.path}")
+            if not result.ok:
+                print(f"    {result.error}", file=sys.stderr)
+    wall = time.perf_counter() - start
+
+    failed = [r for r in results if not r.ok]
+    busy = sum(r.seconds for r in results)
+    pages = sum(r.pages for r in results)
+    print(
+        f"\n{len(results) - len(failed)}/{len(results)} succeeded in {wall:.2f}s: "
+        f"{len(results) / wall:.2f} files/s, {pages / wall:.2f} pages/s, "
+        f"worker utilisation {busy / (wall * workers):.0%}"
+    )
+    if failed:
+        print(f"{len(failed)} file(s) failed:", file=sys.stderr)
+        for result in failed:
+            print(f"  {result.path}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    return run_batch(build_arg_parser().parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Hashable, Optional, Tuple
+
+from src.backend.app.artifact_store import DEFAULT_ARTIFACT_STORE_DIR, ArtifactStore
+
+
+# 编译管道的缓存版本：解析/Pass 的输出格式或行为变化时递增，旧条目随之失效
+PIPELINE_VERSION = 2
+# 内存缓存的默认容量 (字节)
+DEFAULT_COMPILE_CACHE_BYTES = 256 * 1024 * 1024
+# 界面使用的缓存的默认容量 (字节)：预览页面已由 PageProvider 在自己的预算内保存，这里只放编译阶段
+DEFAULT_PREVIEW_CACHE_BYTES = 32 * 1024 * 1024
+
+# 缓存的管道阶段
+STAGE_TOKENS = "tokens"
+STAGE_AST = "ast"
+STAGE_PASS = "pass"         # 每个 Visitor Pass 之后的 AST + Render List
+STAGE_PAGES = "pages"       # 光栅化后的页面
+
+ALL_STAGES = frozenset({STAGE_TOKENS, STAGE_AST, STAGE_PASS, STAGE_PAGES})
+# 界面缓存的阶段 (不保存光栅化页面)
+PREVIEW_STAGES = frozenset({STAGE_TOKENS, STAGE_AST, STAGE_PASS})
+# 同时写入磁盘仓库的阶段 (Token 重新扫描很便宜，只放在内存中)
+PERSISTENT_STAGES = frozenset({STAGE_AST, STAGE_PASS, STAGE_PAGES})
+
+
+def digest(*parts: Any) -> str:
+    """把若干部分 (字符串/字节/可 JSON 序列化的对象) 合成一个内容哈希。"""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def config_fingerprint(score_type: str) -> str:
+    """影响编译结果的配置和代码：词法/语义映射表 (pipa_map.toml)、默认布局配置和编译管道的源码哈希。"""
+    from src.scorelang.config.layout_config import PipaLayoutConfig
+    from src.scorelang.core.source_digest import PIPELINE_SOURCE_DIRS, source_digest
+
+    config_dir = Path(__file__).resolve().parent.parent.parent / "scorelang" / "config"
+    try:
+        map_bytes = (config_dir / f"{score_type}_map.toml").read_bytes()
+    except OSError:
+        map_bytes = b""
+    return digest(
+        PIPELINE_VERSION, source_digest(*PIPELINE_SOURCE_DIRS), score_type, map_bytes, asdict(PipaLayoutConfig())
+    )
+
+
+class CompileCache:
+    """
+    编译管道的多级内容寻址缓存 (内存 LRU，按字节数淘汰)。
+
+    每一级的键是其上游输入内容的哈希加上配置和管道版本，因此只要某一级的输入没变，
+    这一级及其后的结果都可以复用 (例如只改了一页的内容时，其余页面的光栅化结果直接命中)。
+    对象以 pickle 字节保存、页面以副本保存，调用方修改取出的结果不会影响缓存。
+
+    提供 store (ArtifactStore) 时作为第二级：内存未命中再查磁盘，写入时 persistent_stages
+    中的阶段同时写入磁盘，重启程序或其他进程 (批处理、编译子进程) 都能复用。
+    不在 stages 中的阶段既不查找也不保存 (例如界面的缓存不保存页面)。
+    """
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_COMPILE_CACHE_BYTES,
+        store: Optional[ArtifactStore] = None,
+        persistent_stages: FrozenSet[str] = PERSISTENT_STAGES,
+        stages: FrozenSet[str] = ALL_STAGES
+    ):
+        self.max_bytes = max_bytes
+        self.store = store
+        self.persistent_stages = persistent_stages
+        self.stages = stages
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[str, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.disk_hits: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各阶段的命中 (其中 disk_hits 来自磁盘仓库) / 未命中次数。"""
+        stages = sorted(set(self.hits) | set(self.misses))
+        return {
+            stage: {
+                "hits": self.hits.get(stage, 0),
+                "disk_hits": self.disk_hits.get(stage, 0),
+                "misses": self.misses.get(stage, 0),
+            }
+            for stage in stages
+        }
+
+    def _persistent(self, stage: str) -> bool:
+        return self.store is not None and stage in self.persistent_stages
+
+    # -----------------------------------------------------------
+    # 条目存取
+    # -----------------------------------------------------------
+
+    def _lookup(self, stage: str, key: Hashable) -> Optional[Tuple[str, Any, int]]:
+        if stage not in self.stages:
+            return None
+        with self._lock:
+            entry = self._entries.get((stage, key))
+            if entry is not None:
+                self._entries.move_to_end((stage, key))
+                self.hits[stage] = self.hits.get(stage, 0) + 1
+                return entry
+
+        # 内存未命中时查磁盘仓库，命中后放回内存
+        if self._persistent(stage):
+            if stage == STAGE_PAGES:
+                image = self.store.get_image(stage, key)
+                if image is not None:
+                    entry = ("image", image, image.width * image.height * len(image.getbands()))
+            else:
+                data = self.store.get_bytes(stage, key)
+                if data is not None:
+                    entry = ("pickle", data, len(data))
+            if entry is not None:
+                self._store(stage, key, *entry)
+                with self._lock:
+                    self.hits[stage] = self.hits.get(stage, 0) + 1
+                    self.disk_hits[stage] = self.disk_hits.get(stage, 0) + 1
+                return entry
+
+        with self._lock:
+            self.misses[stage] = self.misses.get(stage, 0) + 1
+        return None
+
+    def _store(self, stage: str, key: Hashable, kind: str, payload: Any, size: int):
+        if stage not in self.stages or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop((stage, key), None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[(stage, key)] = (kind, payload, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def get(self, stage: str, key: Hashable) -> Optional[Any]:
+        """取出一个对象 (反序列化出的新副本)；未命中返回 None。"""
+        entry = self._lookup(stage, key)
+        if entry is None:
+            return None
+        return pickle.loads(entry[1])
+
+    def put(self, stage: str, key: Hashable, value: Any) -> bytes:
+        """保存一个对象，返回其 pickle 字节 (可用于计算下一级的键)。"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._store(stage, key, "pickle", data, len(data))
+        if self._persistent(stage) and stage in self.stages:
+            self.store.put_bytes(stage, key, data)
+        return data
+
+    def get_image(self, key: Hashable):
+        """取出一页光栅化结果 (PIL.Image 副本)；未命中返回 None。"""
+        entry = self._lookup(STAGE_PAGES, key)
+        if entry is None:
+            return None
+        return entry[1].copy()
+
+    def put_image(self, key: Hashable, image):
+        if STAGE_PAGES not in self.stages:
+            return
+        size = image.width * image.height * len(image.getbands())
+        image = image.copy()
+        self._store(STAGE_PAGES, key, "image", image, size)
+        if self._persistent(STAGE_PAGES):
+            # 缓存中的副本不会再被修改，可以直接交给后台写入
+            self.store.put_image(STAGE_PAGES, key, image)
+
+    def flush(self):
+        """等待磁盘仓库的后台写入完成。"""
+        if self.store is not None:
+            self.store.flush()
+
+
+# 进程内共享的默认缓存 (线程安全)，只在内存中：ScoreService() 不会在未要求时读写磁盘
+DEFAULT_COMPILE_CACHE = CompileCache()
+
+
+def persistent_compile_cache(root: Path = DEFAULT_ARTIFACT_STORE_DIR) -> CompileCache:
+    """以 root (默认为运行目录下的 data/.cache) 作为磁盘仓库的缓存，供批处理和渲染服务的工作进程使用。"""
+    return CompileCache(store=ArtifactStore(root))
+
+
+def preview_compile_cache(
+    max_bytes: int = DEFAULT_PREVIEW_CACHE_BYTES,
+    store: Optional[ArtifactStore] = None
+) -> CompileCache:
+    """
+    界面 (预览和保存) 使用的缓存：容量较小且不保存光栅化页面，页面的内存占用只由
+    PageProvider 的预算决定。默认只在内存中，需要跨次启动复用 AST / Pass 结果时传入 store。
+    """
+    return CompileCache(max_bytes, store=store, stages=PREVIEW_STAGES)
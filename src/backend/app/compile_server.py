@@ -0,0 +1,202 @@
+import sys
+from collections import OrderedDict
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 可以直接包装为 QImage 的页面模式；其他模式先转为 RGBA
+TRANSFER_MODES = ("RGB", "RGBA", "L")
+# 保留最近几次结果的 Render List 作为差分基准
+MAX_BASELINES = 4
+
+
+def create_page_block(size: int) -> SharedMemory:
+    """
+    创建一块共享内存用于传递页面像素。所有权随即交给接收方 (由它 unlink)，
+    因此不让本进程的 resource_tracker 跟踪，避免退出时被重复清理。
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(create=True, size=size, track=False)
+    block = SharedMemory(create=True, size=size)
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def attach_page_block(name: str) -> SharedMemory:
+    """
+    接收方附加到页面共享内存，之后必须调用一次 unlink()。
+    (3.13 之前附加也会登记到 resource_tracker，unlink() 会同时注销，两者正好抵消。)
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    return SharedMemory(name=name)
+
+
+def discard_page_block(name: str):
+    """unlink 一块不会再被使用的页面共享内存 (已被清理时忽略)。"""
+    try:
+        block = attach_page_block(name)
+    except FileNotFoundError:
+        return
+    block.unlink()
+    block.close()
+
+
+class CompileServer:
+    """
+    常驻的编译子进程：解析器、布局配置、字体和字形图集在进程内保持预热。
+
+    通过管道接收请求，编译并光栅化请求的预览页面：
+    {"generation", "text", "scale", "page_index", "radius", "decoded", "baseline"}。
+    只光栅化当前页前后 radius 页以及接收方已经解码的页面 decoded (页码列表)，其余页面由接收方
+    从 Render List 按需绘制。baseline 为接收方那些已解码页面所属的 generation：子进程保留最近几次
+    结果的 Render List，据此只传输变化的像素；找不到基准 (或比例不同) 时整页传输。
+
+    回复 {"generation", "text", "scale", "pages", "shm", "layout_config", "artifact", "error"}，
+    layout_config / artifact (Render List) 供接收方按需绘制其余页面和导出时复用，无需重新编译。
+    pages 中每项为 {"index", "size", "mode", "offset", "regions"}，像素都存放在本次回复共用的一块
+    共享内存 shm 中：
+    - 整页传输的页面：offset 为整页像素的起始偏移，regions 为空；
+    - 差分更新的已解码页面：offset 为 None，regions 为 [(脏矩形, 偏移)]；内容没有变化时 regions 为空。
+    共享内存由接收方负责 unlink。排队的请求只处理最新的一个 (更早的已经过期)。
+    """
+    def __init__(self, conn: Connection):
+        # 编译管道只在子进程中导入；GUI 进程导入本模块只用到 serve / attach_page_block
+        from src.backend.app.compile_cache import preview_compile_cache
+        from src.backend.app.services import ScoreService
+        self.conn = conn
+        # 与界面相同的小容量缓存：只缓存编译中间产物，不保存页面图像
+        self.service = ScoreService(preview_compile_cache())
+        # 最近几次结果的 (Render List, 比例)，按 generation 保存，作为差分基准
+        self._baselines: "OrderedDict[int, Tuple[List[Any], float]]" = OrderedDict()
+
+    def warm_up(self):
+        from src.scorelang.renderers.pipa_image_renderer import warm_up_fonts
+        warm_up_fonts(background=False)
+
+    def _latest_request(self) -> Optional[Dict[str, Any]]:
+        """阻塞等待请求；管道中已有更新的请求时只保留最新的一个。"""
+        request = self.conn.recv()
+        while request is not None and self.conn.poll():
+            request = self.conn.recv()
+        return request
+
+    @staticmethod
+    def _transfer(image):
+        return image if image.mode in TRANSFER_MODES else image.convert("RGBA")
+
+    def _render(self, context, request: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[bytes]]:
+        """
+        光栅化请求的页面，返回 (pages, 像素块列表)；pages 中的偏移按像素块依次拼接计算。
+        """
+        scale = request["scale"]
+        renderer = self.service.image_renderer(context, "pipa", scale=scale)
+        artifact = context.render_artifact.get("png") or []
+        previous_artifact, previous_scale = self._baselines.get(request.get("baseline"), (None, None))
+        if previous_scale != scale:
+            previous_artifact = None
+
+        current = min(request.get("page_index", 0), len(artifact) - 1)
+        radius = request.get("radius", 0)
+        decoded = set(request.get("decoded", ()))
+        wanted = decoded | set(range(current - radius, current + radius + 1))
+
+        pages = []
+        chunks: List[bytes] = []
+        offset = 0
+        for page_index in sorted(index for index in wanted if 0 <= index < len(artifact)):
+            page_commands = artifact[page_index]
+            dirty = None
+            if page_index in decoded and previous_artifact is not None and page_index < len(previous_artifact):
+                dirty = renderer.page_dirty_rects(previous_artifact[page_index], page_commands, page_index)
+            entry = {"index": page_index, "size": None, "mode": None, "offset": None, "regions": []}
+            if dirty is None:
+                page = self._transfer(renderer.render_page(page_commands, page_index))
+                entry["size"], entry["mode"], entry["offset"] = page.size, page.mode, offset
+                chunks.append(page.tobytes())
+                offset += len(chunks[-1])
+            else:
+                for rect, region in zip(dirty, renderer.render_regions(page_commands, dirty, page_index)):
+                    region = self._transfer(region)
+                    entry["mode"] = region.mode
+                    entry["regions"].append((rect, offset))
+                    chunks.append(region.tobytes())
+                    offset += len(chunks[-1])
+            pages.append(entry)
+        return pages, chunks
+
+    @staticmethod
+    def _share(chunks: List[bytes]) -> Optional[str]:
+        """把像素块依次写入一块新的共享内存，返回其名字 (没有像素时为 None)。"""
+        size = sum(len(chunk) for chunk in chunks)
+        if not size:
+            return None
+        block = create_page_block(size)
+        try:
+            offset = 0
+            for chunk in chunks:
+                block.buf[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+        except Exception:
+            # 回复发不出去：共享内存没有接收方，在这里清理
+            block.close()
+            block.unlink()
+            raise
+        block.close()
+        return block.name
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        reply = {
+            "generation": request["generation"],
+            "text": request["text"],
+            "scale": request["scale"],
+            "pages": [],
+            "shm": None,
+            "layout_config": None,
+            "artifact": None,
+            "error": None,
+        }
+
+        from src.scorelang.core.pipeline_context import PipelineContext
+        context = PipelineContext()
+        context.set_raw_text(request["text"])
+        try:
+            context = self.service.process_score(context, "pipa")
+        except Exception as e:
+            reply["error"] = ("parse", str(e))
+            return reply
+
+        try:
+            reply["pages"], chunks = self._render(context, request)
+            reply["shm"] = self._share(chunks)
+        except Exception as e:
+            reply["error"] = ("render", str(e))
+            return reply
+
+        artifact = context.render_artifact.get("png", [])
+        self._baselines[request["generation"]] = (artifact, request["scale"])
+        while len(self._baselines) > MAX_BASELINES:
+            self._baselines.popitem(last=False)
+        reply["layout_config"] = context.layout_config
+        reply["artifact"] = artifact
+        return reply
+
+    def serve_forever(self):
+        self.warm_up()
+        self.conn.send({"ready": True})
+        while True:
+            try:
+                request = self._latest_request()
+            except EOFError:
+                break
+            if request is None: # 关闭请求
+                break
+            self.conn.send(self.handle(request))
+        self.conn.close()
+
+
+def serve(conn: Connection):
+    """子进程入口 (multiprocessing 的 target)。"""
+    CompileServer(conn).serve_forever()
@@ -1,11 +1,16 @@
 # app/services.py
 
-from typing import Any, Dict, Optional
+import io
+from typing import Any, Dict, List, Optional
 from pathlib import Path
 from src.scorelang.core.parser_factory import ParserFactory
 from src.scorelang.core.visitor_manager import VisitorManager
 from src.scorelang.ast_score.nodes import ScoreDocumentNode
 from src.scorelang.core.pipeline_context import PipelineContext
+from src.backend.app.compile_cache import (
+    DEFAULT_COMPILE_CACHE, STAGE_AST, STAGE_PASS, STAGE_TOKENS,
+    CompileCache, config_fingerprint, digest
+)
 
 
 ROOT_PATH = str(Path(__file__).parent.parent.parent.parent / "new_system_test.png")
@@ -16,10 +21,20 @@ class ScoreService:
     它负责编排 Parser, VisitorManager 和 RendererFactory (隐式)。
     """
     
-    def __init__(self):
+    def __init__(self, compile_cache: Optional[CompileCache] = DEFAULT_COMPILE_CACHE):
         # 初始化时加载配置，以便后续使用
         self.visitor_manager = VisitorManager
         self.context = PipelineContext()
+        # 多级编译缓存 (Token / AST / 每个 Pass 之后的结果 / 光栅化页面)；None 表示每次完整编译
+        self.compile_cache = compile_cache
+        # 复用的 Parser (按乐谱类型)，避免每次重新加载词法配置；parse 每次都会重置其状态
+        self._parsers: Dict[str, Any] = {}
+
+    def _get_parser(self, score_type: str):
+        parser = self._parsers.get(score_type)
+        if parser is None:
+            parser = self._parsers[score_type] = ParserFactory.get_parser(score_type)
+        return parser
 
     def process_score(self, score_context: PipelineContext, score_type: str) -> ScoreDocumentNode:
         """
@@ -28,6 +43,10 @@ class ScoreService:
         self.context = score_context
         score_type = score_type.lower()
         
+        # 流式导出 (page_sink) 需要排版过程本身，不走缓存
+        if self.compile_cache is not None and self.context.page_sink is None:
+            return self._process_score_cached(score_type)
+        
         # --- 1. 解析阶段 ---
         try:
             parser = ParserFactory.get_parser(score_type)
@@ -51,34 +70,245 @@ class ScoreService:
         # 返回上下文
         return self.context
 
-    def render_score(self, context, score_type: str, format: str, save_dir: str = ROOT_PATH) -> Any:
+    def _process_score_cached(self, score_type: str) -> PipelineContext:
+        """
+        带多级缓存的 process_score。每一级的键由上游内容哈希、配置和管道版本组成：
+        Token ← 原始文本；AST ← Token 内容 (不含行号，只增删空行时仍命中)；
+        第 i 个 Pass 的结果 ← 第 i-1 级的键 + Pass 路径。
+        从最后一个命中的 Pass 恢复，只运行其后的 Pass。
+        """
+        cache = self.compile_cache
+        config_key = config_fingerprint(score_type)
+        score_text = self.context.raw_score_text
+
+        # --- 1. 解析阶段 ---
+        try:
+            tokens_key = digest(config_key, STAGE_TOKENS, score_text)
+            tokens = cache.get(STAGE_TOKENS, tokens_key)
+            if tokens is None:
+                tokens = self._get_parser(score_type).lexer.tokenize(score_text)
+                cache.put(STAGE_TOKENS, tokens_key, tokens)
+
+            token_content = [[t["type"], t.get("semantic"), t["value"], t.get("extra")] for t in tokens]
+            ast_key = digest(config_key, STAGE_AST, token_content)
+        except Exception as e:
+            raise RuntimeError(f"Parsing failed for {score_type} score: {e}")
+
+        visitor_paths = VisitorManager.visitor_paths(score_type)
+        pass_keys = []
+        upstream_key = ast_key
+        for visitor_path in visitor_paths:
+            upstream_key = digest(upstream_key, STAGE_PASS, visitor_path)
+            pass_keys.append(upstream_key)
+
+        # --- 2. 从最后一个命中的 Pass 结果恢复 ---
+        start = 0
+        for index in range(len(pass_keys) - 1, -1, -1):
+            snapshot = cache.get(STAGE_PASS, pass_keys[index])
+            if snapshot is not None:
+                self.context.node = snapshot["node"]
+                self.context.layout_config = snapshot["layout_config"]
+                self.context.render_artifact = snapshot["render_artifact"]
+                start = index + 1
+                break
+        else:
+            try:
+                ast_root = cache.get(STAGE_AST, ast_key)
+                if ast_root is None:
+                    ast_root = self._get_parser(score_type).parse_tokens(tokens)
+                    cache.put(STAGE_AST, ast_key, ast_root)
+            except Exception as e:
+                raise RuntimeError(f"Parsing failed for {score_type} score: {e}")
+            self.context.node = ast_root
+
+        # --- 3. 运行未命中的 Pass，并缓存每个 Pass 之后的结果 ---
+        for visitor_path, pass_key in zip(visitor_paths[start:], pass_keys[start:]):
+            VisitorManager.run_pass(self.context, visitor_path)
+            cache.put(STAGE_PASS, pass_key, {
+                "node": self.context.node,
+                "layout_config": self.context.layout_config,
+                "render_artifact": self.context.render_artifact,
+            })
+
+        return self.context
+
+    def read_header(self, score_text: str, score_type: str) -> Dict[str, Optional[str]]:
         """
-        渲染方法：查找正确的 Renderer，生成最终格式的输出。
+        只解析文件头，返回 title / mode / source / transcriber / proofreader / date。
+        不运行 Visitor 和排版，用于保存时取乐谱名和浏览已保存的乐谱。
         """
         score_type = score_type.lower()
-        format = format.lower()
-        
+        parser = self._get_parser(score_type)
+        try:
+            return parser.parse_header(score_text)
+        except Exception as e:
+            raise RuntimeError(f"Header parsing failed for {score_type} score: {e}")
+
+    def index_scores(self, score_dir: str, score_type: str, pattern: str = "*.score") -> List[Dict[str, Optional[str]]]:
+        """读取目录下所有乐谱文件的文件头，每项附带 "path" 字段；无法读取的文件跳过。"""
+        index = []
+        for path in sorted(Path(score_dir).glob(pattern)):
+            try:
+                header = self.read_header(path.read_text(encoding="utf-8"), score_type)
+            except (OSError, UnicodeDecodeError, RuntimeError) as e:
+                print(f"Warning: Skipping unreadable score {path}: {e}")
+                continue
+            header["path"] = str(path)
+            index.append(header)
+        return index
+
+    def _get_renderer_class(self, score_type: str, format: str):
+        """按乐谱类型和输出格式查找 Renderer 类。"""
         # renderer_path = self.pipeline_config.get(score_type, {}).get('renderers', {}).get(format)
 
         # if not renderer_path:
         #     raise ValueError(f"Unsupported rendering format '{format}' for score type '{score_type}'.")
 
-        # --- 动态加载和运行 Renderer ---
+        # 实际项目中，这里会使用反射 (importlib)
+        # 占位：假设我们只关心 TextRenderer
+        if format == 'image':
+            from src.scorelang.renderers.pipa_image_renderer import PipaImageRenderer
+            return PipaImageRenderer
+        if format == 'svg':
+            from src.scorelang.renderers.pipa_svg_renderer import PipaSVGRenderer
+            return PipaSVGRenderer
+        if format == 'pdf':
+            from src.scorelang.renderers.pipa_pdf_renderer import PipaPDFRenderer
+            return PipaPDFRenderer
+        # 模拟动态加载失败
+        # raise NotImplementedError(f"Renderer for {renderer_path} not implemented.")
+        raise NotImplementedError(f"Renderer not implemented.")
+
+    def render_pages(self, context, score_type: str, **renderer_options) -> List[Any]:
+        """
+        内存渲染：返回每页的 PIL.Image，不写磁盘 (用于界面预览)。
+        需要落盘时再调用 render_score(..., pages=...) 导出。
+        """
+        score_type = score_type.lower()
+        if self.compile_cache is not None:
+            renderer_options.setdefault("raster_cache", self.compile_cache)
         try:
-            # 实际项目中，这里会使用反射 (importlib)
-            # 占位：假设我们只关心 TextRenderer
-            if format == 'image':
-                from src.scorelang.renderers.pipa_image_renderer import PipaImageRenderer
-                RendererClass = PipaImageRenderer
-            else:
-                 # 模拟动态加载失败
-                # raise NotImplementedError(f"Renderer for {renderer_path} not implemented.")
-                raise NotImplementedError(f"Renderer not implemented.")
-            
+            RendererClass = self._get_renderer_class(score_type, 'image')
+            renderer = RendererClass(context, **renderer_options)
+            return renderer.render_pages()
+        except (ImportError, AttributeError, NotImplementedError) as e:
+            raise RuntimeError(f"Failed to load or run renderer: {e}")
+
+    def image_renderer(self, context, score_type: str, **renderer_options):
+        """
+        创建 image Renderer 实例，供界面预览按页光栅化 (render_page) 和差分重绘
+        (page_dirty_rects / render_regions) 使用。不接入光栅化缓存：预览页面由界面自己缓存。
+        """
+        try:
+            RendererClass = self._get_renderer_class(score_type.lower(), 'image')
+            return RendererClass(context, **renderer_options)
+        except (ImportError, AttributeError, NotImplementedError) as e:
+            raise RuntimeError(f"Failed to load or run renderer: {e}")
+
+    def render_png_pages(self, context, score_type: str, **renderer_options) -> List[bytes]:
+        """内存渲染并按输出配置编码：返回每页的 PNG 字节 (用于 HTTP 渲染服务等不落盘的场景)。"""
+        score_type = score_type.lower()
+        if self.compile_cache is not None:
+            renderer_options.setdefault("raster_cache", self.compile_cache)
+        try:
+            RendererClass = self._get_renderer_class(score_type, 'image')
+            renderer = RendererClass(context, **renderer_options)
+            encoded = []
+            for page in renderer.render_pages():
+                buffer = io.BytesIO()
+                renderer.encode_page(page, buffer)
+                encoded.append(buffer.getvalue())
+            return encoded
+        except (ImportError, AttributeError, NotImplementedError) as e:
+            raise RuntimeError(f"Failed to load or run renderer: {e}")
+
+    def render_svg_pages(self, context, score_type: str) -> List[str]:
+        """返回每页的 SVG 文档字符串 (不落盘)。"""
+        score_type = score_type.lower()
+        try:
+            RendererClass = self._get_renderer_class(score_type, 'svg')
             renderer = RendererClass(context)
-            renderer.render(save_dir)
-            return
+            pages = []
+            for page_commands in context.render_artifact.get("png", []):
+                out = io.StringIO()
+                renderer.render_page(page_commands, out)
+                pages.append(out.getvalue())
+            return pages
+        except (ImportError, AttributeError, NotImplementedError) as e:
+            raise RuntimeError(f"Failed to load or run renderer: {e}")
+
+    def render_pages_diff(
+            self,
+            context,
+            score_type: str,
+            previous_artifact: List[Any],
+            previous_pages: List[Any],
+            in_place: bool = True,
+            **renderer_options
+        ) -> List[Any]:
+        """
+        差分内存渲染：以上一次的 Render List 和页面图像为基准，只重绘变化的区域。
+        in_place 为 True 时 previous_pages 被原地更新；为 False 时只复制需要重绘的页面，
+        基准页面保持不变。返回每页的 (PIL.Image, 脏矩形列表)。
+        """
+        score_type = score_type.lower()
+        try:
+            RendererClass = self._get_renderer_class(score_type, 'image')
+            renderer = RendererClass(context, **renderer_options)
+            return renderer.render_pages_diff(previous_artifact, previous_pages, in_place)
+        except (ImportError, AttributeError, NotImplementedError) as e:
+            raise RuntimeError(f"Failed to load or run renderer: {e}")
+
+    def render_score(
+            self, 
+            context, 
+            score_type: str, 
+            format: str, 
+            save_dir: str = ROOT_PATH, 
+            pages: Optional[List[Any]] = None, 
+            scales: Optional[List[float]] = None,
+            **renderer_options
+        ) -> Any:
+        """
+        渲染方法：查找正确的 Renderer，生成最终格式的输出并写入 save_dir。
+        pages: render_pages() 已得到的页面图像，传入时只做编码导出，不重新光栅化。
+        scales: 仅 image 格式，一次遍历输出多个分辨率，此时返回 {比例: 目录}。
+        renderer_options 原样传给 Renderer 的构造函数 (例如 use_unit_sprites=True)。
+        返回 Renderer 实际写入的目录。
+        """
+        score_type = score_type.lower()
+        format = format.lower()
+        if format == 'image' and self.compile_cache is not None:
+            renderer_options.setdefault("raster_cache", self.compile_cache)
+
+        # --- 动态加载和运行 Renderer ---
+        try:
+            RendererClass = self._get_renderer_class(score_type, format)
+            renderer = RendererClass(context, **renderer_options)
+            if scales is not None:
+                return renderer.render_scales(save_dir, scales)
+            if pages is not None:
+                return renderer.render(save_dir, pages=pages)
+            return renderer.render(save_dir)
             
         except (ImportError, AttributeError, NotImplementedError) as e:
             #raise RuntimeError(f"Failed to load or run renderer '{renderer_path}': {e}")
-            raise RuntimeError(f"Failed to load or run renderer: {e}")
\ No newline at end of file
+            raise RuntimeError(f"Failed to load or run renderer: {e}")
+
+    def export_pdf(self, score_context: PipelineContext, score_type: str, pdf_path: str, **renderer_options) -> str:
+        """
+        流式 PDF 导出：从原始文本开始跑完整管道，Layout Pass 每排完一页
+        就立即光栅化并追加到 PDF，峰值内存约为一页，与乐谱长度无关。
+        """
+        score_type = score_type.lower()
+        RendererClass = self._get_renderer_class(score_type, 'pdf')
+        renderer = RendererClass(score_context, **renderer_options)
+
+        with renderer.open_writer(pdf_path) as writer:
+            score_context.page_sink = renderer.page_sink(writer)
+            try:
+                self.process_score(score_context, score_type)
+            finally:
+                score_context.page_sink = None
+
+        return pdf_path
@@ -0,0 +1,256 @@
+import multiprocessing
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from PIL import Image
+from PySide6.QtCore import QObject, QThreadPool, QTimer, Signal
+from PySide6.QtGui import QImage
+
+from src.backend.app.compile_server import attach_page_block, discard_page_block, serve
+from src.frontend.compile_worker import DEFAULT_DEBOUNCE_MS, CompileResult, CompileSignals, ExportJob, page_loader
+from src.frontend.page_provider import DEFAULT_PREFETCH_RADIUS
+from src.frontend.qt_image import buffer_to_qimage, patch_qimage, pixel_size
+
+
+class _ReplySignals(QObject):
+    reply = Signal(object)
+    stopped = Signal()
+
+
+class CompileServerClient(QObject):
+    """
+    常驻编译子进程的 GUI 端代理，接口与 CompileController 相同
+    (schedule / compile_now / cancel / page_loader / export / shutdown，
+    result_ready / compile_failed / export_finished / export_failed 信号)。
+
+    编译和光栅化都在子进程中进行，GUI 进程不与渲染争用解释器锁；
+    子进程只传回当前页附近和界面已解码的页面 (已解码的页面只传脏区域，协议见 CompileServer)，
+    其余页面由 page_loader 从回复中的 Render List 按需绘制，与进程内编译一样受 PageProvider 的内存预算限制。
+    回复由后台线程读取，再以信号投递回 GUI 线程。
+    导出在本进程的单线程线程池中进行 (复用回复中的 Render List)，不占用子进程的预览编译。
+    """
+    result_ready = Signal(object)        # CompileResult
+    compile_failed = Signal(int, str, str)
+    export_finished = Signal(int, str)
+    export_failed = Signal(int, str)
+
+    def __init__(
+        self,
+        parent: Optional[QObject] = None,
+        debounce_ms: int = DEFAULT_DEBOUNCE_MS,
+        compile_cache: Optional[Any] = None      # CompileCache
+    ):
+        super().__init__(parent)
+        self.generation = 0
+        self._pending: Optional[Dict[str, Any]] = None
+        self._send_lock = threading.Lock()
+        # 提交时取得 (当前页码, 已解码的页面)，由界面提供 (见 PageProvider.snapshot)
+        self.baseline_pages: Callable[[], Tuple[int, Dict[int, QImage]]] = lambda: (0, {})
+        # 最新请求提交时界面已解码的页面 (差分基准)，以及它们所属结果的 generation
+        self._baseline: Dict[int, QImage] = {}
+        self._displayed_generation: Optional[int] = None
+        # 按需绘制其余页面和导出用的 ScoreService，第一次使用时才导入编译管道
+        self._compile_cache = compile_cache
+        self._service = None
+        self._export_id = 0
+        self.signals = CompileSignals()
+        self.signals.exported.connect(self.export_finished)
+        self.signals.export_failed.connect(self.export_failed)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+
+        # spawn：子进程不继承 Qt 状态，只导入编译/渲染模块
+        mp_context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = mp_context.Pipe()
+        self._process = mp_context.Process(target=serve, args=(child_conn,), daemon=True, name="score-compile-server")
+        self._process.start()
+        child_conn.close()
+        # 不等待子进程预热完成：在此之前发出的请求会在管道中排队
+        self.ready = False
+
+        self._signals = _ReplySignals()
+        self._signals.reply.connect(self._on_reply)
+        self._signals.stopped.connect(self._on_stopped)
+        self._reader = threading.Thread(target=self._read_replies, daemon=True, name="score-compile-reader")
+        self._reader.start()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self._submit_pending)
+
+    @property
+    def service(self):
+        if self._service is None:
+            from src.backend.app.compile_cache import preview_compile_cache
+            from src.backend.app.services import ScoreService
+            self._service = ScoreService(self._compile_cache if self._compile_cache is not None else preview_compile_cache())
+        return self._service
+
+    # -----------------------------------------------------------
+    # 请求
+    # -----------------------------------------------------------
+
+    def schedule(self, text: str, scale: float):
+        """记录最新的文本并 (重新) 开始防抖计时。"""
+        self._pending = {"text": text, "scale": scale}
+        self._timer.start()
+
+    def compile_now(self, text: str, scale: float) -> int:
+        self._timer.stop()
+        self._pending = {"text": text, "scale": scale}
+        return self._submit_pending()
+
+    def cancel(self):
+        self._timer.stop()
+        self._pending = None
+        self.generation += 1
+
+    def _submit_pending(self) -> int:
+        if self._pending is None:
+            return self.generation
+        request, self._pending = self._pending, None
+
+        self.generation += 1
+        page_index, self._baseline = self.baseline_pages()
+        request.update({
+            "generation": self.generation,
+            "page_index": page_index,
+            "radius": DEFAULT_PREFETCH_RADIUS,
+            "decoded": sorted(self._baseline),
+            "baseline": self._displayed_generation,
+        })
+        try:
+            with self._send_lock:
+                self._conn.send(request)
+        except (OSError, ValueError) as e:
+            self.compile_failed.emit(self.generation, "server", f"编译进程已退出: {e}")
+        return self.generation
+
+    # -----------------------------------------------------------
+    # 回复
+    # -----------------------------------------------------------
+
+    def _read_replies(self):
+        """后台线程：阻塞读取子进程的回复并投递到 GUI 线程。"""
+        while True:
+            try:
+                reply = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            self._signals.reply.emit(reply)
+        self._signals.stopped.emit()
+
+    def _apply_pages(self, reply: Dict[str, Any]) -> Dict[int, QImage]:
+        """
+        由回复中的页面得到 {页码: QImage}：整页从共享内存复制出来，差分页面复制基准页后写入脏区域
+        (基准页面可能仍在显示，不能原地修改)。共享内存在这里关闭并 unlink。
+        """
+        if reply["shm"] is None:
+            block = None
+            pixels = b""
+        else:
+            block = attach_page_block(reply["shm"])
+            block.unlink()
+            pixels = block.buf
+        try:
+            decoded: Dict[int, QImage] = {}
+            for entry in reply["pages"]:
+                page_index = entry["index"]
+                if entry["offset"] is not None:
+                    width, height = entry["size"]
+                    length = width * height * pixel_size(entry["mode"])
+                    data = bytes(pixels[entry["offset"]:entry["offset"] + length])
+                    decoded[page_index] = buffer_to_qimage(data, width, height, entry["mode"])
+                    continue
+                image = self._baseline.get(page_index)
+                if image is None:
+                    raise ValueError(f"page {page_index + 1} does not match the diff baseline")
+                if entry["regions"]:
+                    rects = [rect for rect, _ in entry["regions"]]
+                    regions = []
+                    for (left, top, right, bottom), offset in entry["regions"]:
+                        size = (right - left, bottom - top)
+                        length = size[0] * size[1] * pixel_size(entry["mode"])
+                        regions.append(Image.frombytes(entry["mode"], size, bytes(pixels[offset:offset + length])))
+                    image = patch_qimage(image, rects, regions)
+                    if image is None:
+                        raise ValueError(f"page {page_index + 1} does not match the diff baseline")
+                decoded[page_index] = image
+            return decoded
+        finally:
+            if block is not None:
+                del pixels
+                block.close()
+
+    def _reply_context(self, reply: Dict[str, Any]):
+        """由回复中的布局配置和 Render List 组装 PipelineContext，按需绘制和导出时无需重新编译。"""
+        from src.scorelang.core.pipeline_context import PipelineContext
+        context = PipelineContext()
+        context.set_raw_text(reply["text"])
+        context.layout_config = reply["layout_config"]
+        context.render_artifact = {"png": reply["artifact"]}
+        return context
+
+    def _on_reply(self, reply: Dict[str, Any]):
+        if reply.get("ready"):
+            self.ready = True
+            return
+        if reply["generation"] != self.generation:
+            # 过期的回复：丢弃其共享内存
+            if reply.get("shm") is not None:
+                discard_page_block(reply["shm"])
+            return
+
+        if reply["error"] is not None:
+            stage, message = reply["error"]
+            self.compile_failed.emit(reply["generation"], stage, message)
+            return
+
+        if not reply["artifact"]:
+            self.compile_failed.emit(reply["generation"], "render", "没有生成任何乐谱页面。")
+            return
+        try:
+            decoded = self._apply_pages(reply)
+        except Exception as e:
+            # 下一次请求不带差分基准，子进程整页传输
+            self._displayed_generation = None
+            self.compile_failed.emit(reply["generation"], "render", f"无法读取编译进程传回的页面: {e}")
+            return
+
+        self._displayed_generation = reply["generation"]
+        self.result_ready.emit(CompileResult(
+            generation=reply["generation"],
+            text=reply["text"],
+            context=self._reply_context(reply),
+            scale=reply["scale"],
+            decoded=decoded,
+        ))
+
+    def page_loader(self, result: CompileResult) -> Callable[[int], QImage]:
+        return page_loader(self.service, result)
+
+    def export(self, text: str, context, save_dir: str) -> int:
+        """提交一次图片导出 (context 见 ExportJob)，返回导出编号。"""
+        self._export_id += 1
+        self.pool.start(ExportJob(self.service, self.signals, self._export_id, text, context, save_dir))
+        return self._export_id
+
+    def _on_stopped(self):
+        """子进程意外退出时提示 (正常关闭时退出码为 0)。"""
+        if self._process.exitcode not in (0, None):
+            self.compile_failed.emit(self.generation, "server", f"编译进程已退出 (exit code {self._process.exitcode})")
+
+    def shutdown(self):
+        """通知子进程退出并等待其结束 (同时等待正在进行的导出)。"""
+        self.cancel()
+        self.pool.waitForDone()
+        try:
+            with self._send_lock:
+                self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
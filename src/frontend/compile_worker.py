@@ -0,0 +1,283 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal
+from PySide6.QtGui import QImage
+
+from src.frontend.qt_image import patch_qimage, pil_to_qimage
+
+
+
+# 停止输入多久之后才开始编译 (毫秒)
+DEFAULT_DEBOUNCE_MS = 300
+
+
+@dataclass
+class CompileRequest:
+    """
+    一次预览编译的输入；previous 为提交时正在显示的结果，decoded 为界面当时已解码的页面
+    {页码: QImage}，两者一起作为差分重绘的基准。page_index 为当前浏览的页码。
+    """
+    generation: int
+    text: str
+    scale: float
+    previous: Optional["CompileResult"] = None
+    decoded: Dict[int, QImage] = field(default_factory=dict)
+    page_index: int = 0
+
+
+@dataclass
+class CompileResult:
+    """
+    一次预览编译的输出。结果不保存整套页面：context 中的 Render List 用于按需光栅化，
+    decoded 只包含已经更新好的页面 (界面此前解码过的页面和当前页；编译子进程的结果还包括相邻页面)。
+    """
+    generation: int
+    text: str
+    context: Optional[Any]              # PipelineContext
+    scale: float
+    decoded: Dict[int, QImage] = field(default_factory=dict)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.context.render_artifact.get("png") or []) if self.context is not None else 0
+
+
+class CompileSignals(QObject):
+    """QRunnable 不是 QObject，信号挂在这个辅助对象上，跨线程投递回 GUI 线程。"""
+    finished = Signal(object)           # CompileResult
+    failed = Signal(int, str, str)      # generation, 阶段 ("parse" / "render"), 错误信息
+    exported = Signal(int, str)         # 导出编号, 写入的目录
+    export_failed = Signal(int, str)    # 导出编号, 错误信息
+
+
+class CompileJob(QRunnable):
+    """
+    在线程池中执行一次编译 + 预览渲染。
+    每个阶段开始前检查 generation 是否仍是最新的，过期的请求直接放弃，不再占用 CPU。
+    """
+    def __init__(self, controller: "CompileController", request: CompileRequest):
+        super().__init__()
+        self.controller = controller
+        self.request = request
+        self.signals = controller.signals
+
+    def _is_stale(self) -> bool:
+        return self.request.generation != self.controller.generation
+
+    def run(self):
+        request = self.request
+        service = self.controller.service
+        if self._is_stale():
+            return
+
+        # 1. 编译
+        from src.scorelang.core.pipeline_context import PipelineContext
+        context = PipelineContext()
+        context.set_raw_text(request.text)
+        try:
+            context = service.process_score(context, "pipa")
+        except Exception as e:
+            self.signals.failed.emit(request.generation, "parse", str(e))
+            return
+        if self._is_stale():
+            return
+
+        # 2. 只光栅化界面已经解码过的页面 (差分重绘) 和当前页，其余页面浏览时再按需绘制
+        try:
+            decoded = self._render_decoded(context)
+        except Exception as e:
+            self.signals.failed.emit(request.generation, "render", str(e))
+            return
+        if decoded is None:
+            return
+
+        self.signals.finished.emit(CompileResult(
+            generation=request.generation,
+            text=request.text,
+            context=context,
+            scale=request.scale,
+            decoded=decoded,
+        ))
+
+    def _render_decoded(self, context) -> Optional[Dict[int, QImage]]:
+        """
+        更新基准中已解码的页面：内容不变的页面原样复用，有变化的页面复制后只重绘脏区域
+        (基准页面可能仍在显示，不能原地修改)。请求过期时返回 None。
+        """
+        request = self.request
+        previous = request.previous
+        renderer = self.controller.service.image_renderer(context, "pipa", scale=request.scale)
+        artifact = context.render_artifact.get("png") or []
+
+        decoded: Dict[int, QImage] = {}
+        if previous is not None and previous.context is not None and previous.scale == request.scale:
+            previous_artifact = previous.context.render_artifact.get("png") or []
+            for page_index, image in sorted(request.decoded.items()):
+                if page_index >= len(artifact) or page_index >= len(previous_artifact):
+                    continue
+                if self._is_stale():
+                    return None
+                page_commands = artifact[page_index]
+                dirty = renderer.page_dirty_rects(previous_artifact[page_index], page_commands, page_index)
+                if dirty is not None:
+                    image = patch_qimage(image, dirty, renderer.render_regions(page_commands, dirty, page_index))
+                if dirty is None or image is None:
+                    image = pil_to_qimage(renderer.render_page(page_commands, page_index))
+                decoded[page_index] = image
+
+        current = min(request.page_index, len(artifact) - 1)
+        if current >= 0 and current not in decoded:
+            decoded[current] = pil_to_qimage(renderer.render_page(artifact[current], current))
+        return decoded
+
+
+class ExportJob(QRunnable):
+    """
+    在线程池中以原始分辨率导出乐谱图片 (预览页面是按显示尺寸缩小光栅化的，不能用于导出)。
+    context 为与 text 一致的编译结果时直接复用其 Render List，为 None 时先重新编译。
+    """
+    def __init__(self, service, signals: CompileSignals, export_id: int, text: str, context, save_dir: str):
+        super().__init__()
+        self.service = service
+        self.signals = signals
+        self.export_id = export_id
+        self.text = text
+        self.context = context
+        self.save_dir = save_dir
+
+    def run(self):
+        try:
+            context = self.context
+            if context is None:
+                from src.scorelang.core.pipeline_context import PipelineContext
+                context = PipelineContext()
+                context.set_raw_text(self.text)
+                context = self.service.process_score(context, "pipa")
+            image_dir = self.service.render_score(context, "pipa", "image", self.save_dir)
+        except Exception as e:
+            self.signals.export_failed.emit(self.export_id, str(e))
+            return
+        self.signals.exported.emit(self.export_id, image_dir)
+
+
+def page_loader(service, result: CompileResult) -> Callable[[int], QImage]:
+    """
+    返回 PageProvider 用的 load(index)：从结果的 Render List 光栅化一页并转为 QImage。
+    Renderer 在绘制时保存画布状态，加锁后可以同时在 GUI 线程和预取线程中调用。
+    """
+    renderer = service.image_renderer(result.context, "pipa", scale=result.scale)
+    artifact = result.context.render_artifact.get("png") or []
+    lock = threading.Lock()
+
+    def load(page_index: int) -> QImage:
+        with lock:
+            page = renderer.render_page(artifact[page_index], page_index)
+        return pil_to_qimage(page)
+    return load
+
+
+class CompileController(QObject):
+    """
+    防抖的后台编译调度器。
+
+    - schedule(): 文本变化时调用，停止输入 debounce_ms 后才提交编译。
+    - compile_now(): 立即提交 (例如点击“生成乐谱”)。
+    - 每次提交都会递增 generation；结果通过 result_ready / compile_failed 信号回到 GUI 线程，
+      其中 generation 已过期的结果被丢弃。
+    - 差分重绘的基准是最近一次通过 result_ready 交出 (即正在显示) 的结果及界面已解码的页面，
+      在提交时而不是 schedule() 时读取：防抖期间才送达的结果也会被用作基准。
+    - export(): 导出图片也提交到同一个线程池，完成后通过 export_finished / export_failed 信号通知。
+    线程池只有一个线程，同一时间最多一个编译或导出在运行，排队中的过期编译任务会在开始前放弃。
+    """
+    result_ready = Signal(object)        # CompileResult
+    compile_failed = Signal(int, str, str)
+    export_finished = Signal(int, str)
+    export_failed = Signal(int, str)
+
+    def __init__(
+        self,
+        parent: Optional[QObject] = None,
+        debounce_ms: int = DEFAULT_DEBOUNCE_MS,
+        compile_cache: Optional[Any] = None      # CompileCache
+    ):
+        super().__init__(parent)
+        # 独立的 ScoreService：不与 GUI 线程上的导出共享状态 (CompileCache 本身是线程安全的)
+        # (编译管道在这里才导入，界面可以先显示出来)；未指定缓存时使用界面的小容量缓存
+        from src.backend.app.compile_cache import preview_compile_cache
+        from src.backend.app.services import ScoreService
+        self.service = ScoreService(compile_cache if compile_cache is not None else preview_compile_cache())
+        self.generation = 0
+        self.signals = CompileSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self.signals.exported.connect(self.export_finished)
+        self.signals.export_failed.connect(self.export_failed)
+        self._export_id = 0
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        # 提交时取得 (当前页码, 已解码的页面)，由界面提供 (见 PageProvider.snapshot)
+        self.baseline_pages: Callable[[], Tuple[int, Dict[int, QImage]]] = lambda: (0, {})
+
+        self._pending: Optional[Tuple[str, float]] = None
+        # 最近一次交给 GUI 的结果 (差分重绘的基准)
+        self._displayed: Optional[CompileResult] = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self._submit_pending)
+
+    def schedule(self, text: str, scale: float):
+        """记录最新的文本并 (重新) 开始防抖计时。"""
+        self._pending = (text, scale)
+        self._timer.start()
+
+    def compile_now(self, text: str, scale: float) -> int:
+        """跳过防抖立即提交，返回本次请求的 generation。"""
+        self._timer.stop()
+        self._pending = (text, scale)
+        return self._submit_pending()
+
+    def cancel(self):
+        """作废所有排队中和进行中的请求。"""
+        self._timer.stop()
+        self._pending = None
+        self.generation += 1
+
+    def _submit_pending(self) -> int:
+        if self._pending is None:
+            return self.generation
+        text, scale = self._pending
+        self._pending = None
+
+        self.generation += 1
+        page_index, decoded = self.baseline_pages()
+        self.pool.start(CompileJob(self, CompileRequest(
+            self.generation, text, scale, self._displayed, decoded, page_index
+        )))
+        return self.generation
+
+    def _on_finished(self, result: CompileResult):
+        if result.generation == self.generation:
+            self._displayed = result
+            self.result_ready.emit(result)
+
+    def _on_failed(self, generation: int, stage: str, message: str):
+        if generation == self.generation:
+            self.compile_failed.emit(generation, stage, message)
+
+    def page_loader(self, result: CompileResult) -> Callable[[int], QImage]:
+        return page_loader(self.service, result)
+
+    def export(self, text: str, context, save_dir: str) -> int:
+        """提交一次图片导出 (context 见 ExportJob)，返回导出编号。"""
+        self._export_id += 1
+        self.pool.start(ExportJob(self.service, self.signals, self._export_id, text, context, save_dir))
+        return self._export_id
+
+    def shutdown(self):
+        """窗口关闭时调用：作废剩余请求并等待正在运行的编译和导出结束。"""
+        self.cancel()
+        self.pool.waitForDone()
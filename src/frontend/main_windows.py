@@ -1,14 +1,22 @@
+import math
 import sys
 from PySide6.QtWidgets import QMainWindow, QApplication, QMessageBox, QFileDialog
 from PySide6.QtGui import QPixmap
-from PySide6.QtCore import Qt, QSize
+from PySide6.QtCore import Qt, QSize, QTimer
 from pathlib import Path
+from typing import Optional
 
 
 from src.frontend import Ui_main_windows 
 from src.frontend.scalable_image_label import ScalableImageLabel 
-from src.backend.app.services import ScoreService
-from src.scorelang.core.pipeline_context import PipelineContext
+from src.frontend.compile_worker import CompileController, CompileResult
+from src.frontend.compile_server_client import CompileServerClient
+from src.frontend.page_provider import PageProvider
+from src.scorelang.config.layout_config import PipaLayoutConfig
+
+# 预览光栅化比例的上下限：不低于 1/4 (保证谱字可辨)，不超过原始分辨率
+MIN_PREVIEW_SCALE = 0.25
+MAX_PREVIEW_SCALE = 1.0
 
 sample_score_text_2 = (
 """# 乐谱数字化小测试
@@ -60,7 +68,7 @@ sample_score_text_2 = (
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, use_compile_server: bool = True, compile_cache_bytes: Optional[int] = None):
         super().__init__()
         
         # 1. 初始化 UI
@@ -68,8 +76,11 @@ class MainWindow(QMainWindow):
         self.ui.setupUi(self)
         
         self.setWindowTitle("乐谱数字化平台")
-        self.service = ScoreService()
-        self.context = PipelineContext()
+        # 编译管道在第一次保存/导出时才导入 (见 service 属性)，窗口可以先显示出来
+        self._service = None
+        # 预览和保存共用的编译缓存 (不保存页面)，容量默认为 DEFAULT_PREVIEW_CACHE_BYTES
+        self._compile_cache = None
+        self._compile_cache_bytes = compile_cache_bytes
         self.ui.text_input.setPlaceholderText("在此输入唐代琵琶谱文本，点击“生成乐谱”按钮开始处理...")
         self.ui.text_input.setPlainText(sample_score_text_2)
         self.ui.text_input.setReadOnly(False)
@@ -108,18 +119,31 @@ class MainWindow(QMainWindow):
 
 
         # 3. 业务数据初始化
-        # 示例图片路径，请替换为您的资源路径或模拟数据
-        self.image_paths = []
+        # 预览页面 (按需解码为 QImage，内存占用受预算限制)，预览不再经过磁盘
+        self.pages = PageProvider(0, lambda page_index: None)
         self.current_index = 0
-        
+        # 最近一次生成的结果 (CompileResult)：保存时复用其 context 无需重新编译
+        # (差分重绘的基准由编译器在提交请求时自行取用)
+        self._last_render: CompileResult = None
+        # 由“生成乐谱”按钮触发的请求，失败时弹窗提示；输入时的自动编译只在状态栏提示
+        self._manual_generation = -1
+        # 后台导出中的 {导出编号: 乐谱文本的保存路径}
+        self._exports = {}
+
+        # 后台编译：输入停止一段时间后自动编译，结果通过信号回到 GUI 线程
+        # 优先使用常驻编译子进程；无法启动时退回到进程内的线程池
+        # 编译器在事件循环开始后才创建，第一次编译不会推迟窗口的显示
+        self._use_compile_server = use_compile_server
+        self.compiler = None
         
         # 初始化显示
         self.update_image_display()
         self.update_navigation_buttons()
 
-        self.start_digitization()
+        QTimer.singleShot(0, self.start_digitization)
         
         # 4. 信号槽连接
+        self.ui.text_input.textChanged.connect(self._schedule_compile)
         self.ui.btn_generate.clicked.connect(self.start_digitization)
         self.ui.btn_input.clicked.connect(self.input_score)
         self.ui.btn_save.clicked.connect(self.save_score)
@@ -132,34 +156,36 @@ class MainWindow(QMainWindow):
 
     def update_image_display(self):
         """根据当前索引更新显示的图片"""
-        if not self.image_paths:
+        if not len(self.pages):
             self.image_display.setText("数字化结果图片序列为空")
             return
         
-        path = self.image_paths[self.current_index]
+        page_number = self.current_index + 1
         try:
-            pixmap = QPixmap(path) 
+            image = self.pages.page(self.current_index)
             
-            if pixmap.isNull():
+            if image.isNull():
                  # 替换为占位图或错误信息
-                self.image_display.setText(f"图片文件未找到: {path}")
+                self.image_display.setText(f"第 {page_number} 页图像为空")
                 return
             
             # 使用自定义 ScalableImageLabel 的方法来设置图片并触发缩放
+            # (同一次生成的同一页缩放结果会被缓存，来回翻页不再重新缩放)
             if isinstance(self.image_display, ScalableImageLabel):
-                self.image_display.set_score_pixmap(pixmap)
+                generation = self._last_render.generation if self._last_render is not None else None
+                self.image_display.set_score_image(image, page_key=(generation, self.current_index))
             else:
                  # 降级处理
-                self.image_display.setPixmap(pixmap)
+                self.image_display.setPixmap(QPixmap.fromImage(image))
 
         except Exception as e:
-            self.image_display.setText(f"图片加载失败: {path}\n错误: {e}")
+            self.image_display.setText(f"第 {page_number} 页图片加载失败\n错误: {e}")
             
         self.update_navigation_buttons()
 
     def update_navigation_buttons(self):
         """更新翻页按钮的可用状态"""
-        count = len(self.image_paths)
+        count = len(self.pages)
         
         # 假设翻页按钮命名为 prev_button 和 next_button
         self.ui.btn_prev.setEnabled(self.current_index > 0)
@@ -170,51 +196,141 @@ class MainWindow(QMainWindow):
     def navigate_image(self, step: int):
         """翻页逻辑"""
         new_index = self.current_index + step
-        if 0 <= new_index < len(self.image_paths):
+        if 0 <= new_index < len(self.pages):
             self.current_index = new_index
             self.update_image_display()
 
+    def preview_scale(self) -> float:
+        """
+        预览光栅化比例：让页面恰好铺满图片显示区域 (考虑高 DPI 屏幕的设备像素比)，
+        多余的像素只会在显示时被缩小丢弃。导出始终使用原始分辨率。
+        """
+        page_width, page_height = PipaLayoutConfig().page_dimensions
+        ratio = self.image_display.devicePixelRatioF()
+        area = self.image_display.size()
+        scale = min(area.width() * ratio / page_width, area.height() * ratio / page_height)
+        # 取两位小数，窗口尺寸的细微变化不会改变字形图集的缓存键
+        scale = math.ceil(scale * 20) / 20
+        return min(MAX_PREVIEW_SCALE, max(MIN_PREVIEW_SCALE, scale))
+
+    @property
+    def service(self):
+        """保存/导出用的 ScoreService，第一次使用时才导入编译管道。"""
+        if self._service is None:
+            from src.backend.app.services import ScoreService
+            self._service = ScoreService(self.compile_cache)
+        return self._service
+
+    @property
+    def compile_cache(self):
+        if self._compile_cache is None:
+            from src.backend.app.compile_cache import DEFAULT_PREVIEW_CACHE_BYTES, preview_compile_cache
+            self._compile_cache = preview_compile_cache(self._compile_cache_bytes or DEFAULT_PREVIEW_CACHE_BYTES)
+        return self._compile_cache
+
+    def _create_compiler(self, use_compile_server: bool):
+        compiler = None
+        if use_compile_server:
+            try:
+                compiler = CompileServerClient(self, compile_cache=self.compile_cache)
+            except Exception as e:
+                print(f"Warning: Compile server unavailable, compiling in-process: {e}")
+        if compiler is None:
+            # 进程内编译：后台线程预热渲染字体，第一次预览不再卡在 ImageFont.truetype 上
+            from src.scorelang.renderers.pipa_image_renderer import warm_up_fonts
+            warm_up_fonts(background=True)
+            compiler = CompileController(self, compile_cache=self.compile_cache)
+        # 差分重绘的基准页面：提交编译时界面已经解码的页面
+        compiler.baseline_pages = lambda: self.pages.snapshot()
+        return compiler
+
+    def _ensure_compiler(self):
+        if self.compiler is None:
+            self.compiler = self._create_compiler(self._use_compile_server)
+            self.compiler.result_ready.connect(self._apply_compile_result)
+            self.compiler.compile_failed.connect(self._on_compile_failed)
+            self.compiler.export_finished.connect(self._on_export_finished)
+            self.compiler.export_failed.connect(self._on_export_failed)
+        return self.compiler
+
     def start_digitization(self):
-        """点击数字化按钮后的处理逻辑"""
+        """点击数字化按钮后的处理逻辑：立即提交后台编译 (不阻塞界面)。"""
         input_text = self.ui.text_input.toPlainText()
         if not input_text.strip():
             QMessageBox.warning(self, "输入错误", "请输入乐谱文本后再进行数字化生成。")
             return
-            
-        # QMessageBox.information(self, "数字化", f"开始处理以下文本:\n{input_text[:50]}...")
-        
-        # 1. 处理乐谱逻辑
-        context: PipelineContext = PipelineContext()
-        context.set_raw_text(input_text)
-        try:
-            context = self.service.process_score(context,"pipa")
-        except Exception as e:
-            QMessageBox.critical(self, "处理错误", f"乐谱文本处理失败\n错误: {e}")
-            return
 
-        # 2. 提取乐谱名
-        score_dict = context.node.to_dict()
-        score_name = score_dict.get('title', 'untitled_score')
-
-        
-        # 3. 确定项目根目录和保存路径
+        self.statusBar().showMessage("正在生成乐谱...")
+        self._manual_generation = self._ensure_compiler().compile_now(input_text, self.preview_scale())
 
+    def _schedule_compile(self):
+        """文本变化时调用：防抖后在后台重新编译预览。"""
+        input_text = self.ui.text_input.toPlainText()
+        if not input_text.strip():
+            return
+        self._ensure_compiler().schedule(input_text, self.preview_scale())
 
-        self.service.render_score(context,"pipa","image",str(self.image_save_root))
+    def _page_provider(self, result: CompileResult) -> PageProvider:
+        """
+        为编译结果创建按需解码的页面集合。
+        结果只带 Render List 和编译器已更新好的页面，其余页面被浏览时才光栅化。
+        """
+        pages = PageProvider(result.page_count, self.compiler.page_loader(result))
+        for page_index, image in result.decoded.items():
+            pages.insert(page_index, image)
+        return pages
 
-        final_score_dir = self.image_save_root / score_name
-        self.image_paths = []
-        for image_path in sorted(final_score_dir.glob("page_*.png")):
-            # 将 Path 对象转换为字符串，以便 PySide6 的 QPixmap() 使用
-            self.image_paths.append(str(image_path))
-            
+    def _apply_compile_result(self, result: CompileResult):
+        """在 GUI 线程中接收后台编译结果 (已解码的页面在编译线程中只重绘了脏区域)。"""
         # 检查是否生成了图片
-        if not self.image_paths:
-            QMessageBox.warning(self, "渲染失败", f"未在目录 {final_score_dir} 中找到生成的乐谱图片。")
+        if not result.page_count:
+            self._on_compile_failed(result.generation, "render", "没有生成任何乐谱页面。")
             return
-        
-        self.current_index = 0
+
+        # 旧页面集合的预取必须先停下，新集合会从中取用已解码的页面
+        self.pages.close()
+        pages = self._page_provider(result)
+
+        # 同一份乐谱的增量修改保持当前页码
+        previous = self._last_render
+        same_score = previous is not None and result.page_count == previous.page_count
+        self._last_render = result
+        self.pages = pages
+        if isinstance(self.image_display, ScalableImageLabel):
+            self.image_display.clear_scaled_cache()
+
+        if not same_score or self.current_index >= len(self.pages):
+            self.current_index = 0
         self.update_image_display()
+        self.statusBar().showMessage(f"已生成 {len(self.pages)} 页", 3000)
+
+    def _on_compile_failed(self, generation: int, stage: str, message: str):
+        """编译失败：按钮触发的请求弹窗提示，输入时的自动编译只在状态栏显示。"""
+        title, text = {
+            "parse": ("处理错误", "乐谱文本处理失败"),
+            "render": ("渲染错误", "乐谱渲染失败"),
+        }.get(stage, ("错误", "乐谱生成失败"))
+        if generation == self._manual_generation:
+            self.statusBar().clearMessage()
+            QMessageBox.critical(self, title, f"{text}\n错误: {message}")
+        else:
+            self.statusBar().showMessage(f"{text}: {message}")
+
+    def closeEvent(self, event):
+        self.pages.close()
+        if self.compiler is not None:
+            self.compiler.shutdown()
+        super().closeEvent(event)
+
+    def _on_export_finished(self, export_id: int, image_dir: str):
+        save_path = self._exports.pop(export_id, None)
+        self.statusBar().clearMessage()
+        QMessageBox.information(self, "保存成功", f"乐谱已保存到:\n{save_path}\n图片已导出到:\n{image_dir}")
+
+    def _on_export_failed(self, export_id: int, message: str):
+        save_path = self._exports.pop(export_id, None)
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "导出失败", f"乐谱已保存到:\n{save_path}\n但导出图片失败: {message}")
 
     def input_score(self):
         """
@@ -263,18 +379,10 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "保存失败", "当前文本输入框内容为空，无法保存。")
             return
             
-        # 2. 运行生成逻辑以获取 score_name (必须先运行，因为 score_name 依赖 context)
-        
-        # 警告：这里我们只运行获取 score_name 必要的业务逻辑，不渲染图片
-        # 理论上，您应该封装一个方法专门用于解析文本获取 context，而不是调用 start_digitization
-
+        # 2. 只解析文件头获取 score_name (不运行完整的编译管道)
         try:
-            # 简化操作：假设您的 service.process_score 可以在不影响 UI 的情况下运行
-            context = PipelineContext()
-            context.set_raw_text(content)
-            context = self.service.process_score(context,"pipa")
-            score_dict = context.node.to_dict()
-            score_name = score_dict.get('title', 'untitled_score')
+            header = self.service.read_header(content, "pipa")
+            score_name = header.get('title') or 'untitled_score'
         
         except Exception as e:
             QMessageBox.critical(self, "解析错误", f"无法从文本中解析出乐谱名称，保存失败。\n错误: {e}")
@@ -288,10 +396,18 @@ class MainWindow(QMainWindow):
         try:
             with open(save_path, 'w', encoding='utf-8') as f:
                 f.write(content)
-            
-            QMessageBox.information(self, "保存成功", f"乐谱已保存到:\n{save_path}")
 
         except Exception as e:
             QMessageBox.critical(self, "保存失败", f"写入文件失败: {e}")
+            return
+
+        # 5. 在后台以原始分辨率导出乐谱图片，完成后弹窗提示 (见 _on_export_finished)
+        # 文本与最近一次生成的一致时直接复用其 Render List (编译子进程的结果也带有)，否则在后台重新编译
+        context = None
+        if self._last_render is not None and self._last_render.text == content:
+            context = self._last_render.context
+        export_id = self._ensure_compiler().export(content, context, str(self.image_save_root))
+        self._exports[export_id] = save_path
+        self.statusBar().showMessage("正在导出图片...")
 
 
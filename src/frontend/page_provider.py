@@ -0,0 +1,148 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from PySide6.QtCore import QRunnable, QThreadPool
+from PySide6.QtGui import QImage
+
+
+# 已解码页面占用内存的默认上限 (字节)
+DEFAULT_PAGE_MEMORY_BUDGET = 256 * 1024 * 1024
+# 当前页前后各预取几页
+DEFAULT_PREFETCH_RADIUS = 1
+
+_prefetch_pool: Optional[QThreadPool] = None
+
+
+def prefetch_pool() -> QThreadPool:
+    """所有 PageProvider 共用的单线程预取线程池 (同一时间只有一个页面集合在使用)。"""
+    global _prefetch_pool
+    if _prefetch_pool is None:
+        _prefetch_pool = QThreadPool()
+        _prefetch_pool.setMaxThreadCount(1)
+    return _prefetch_pool
+
+
+class PrefetchJob(QRunnable):
+    """在后台线程中解码一页；开始前如果该页已不在当前页附近或已被解码则放弃。"""
+    def __init__(self, provider: "PageProvider", index: int):
+        super().__init__()
+        self.provider = provider
+        self.index = index
+
+    def run(self):
+        provider = self.provider
+        if not provider._wants(self.index):
+            return
+        try:
+            image = provider._load(self.index)
+        except Exception:
+            # 预取失败不影响界面，真正显示该页时会同步重试并报告错误
+            return
+        provider._store(self.index, image)
+
+
+class PageProvider:
+    """
+    预览页面的按需解码器。
+
+    - page(index) 只解码当前页，并在后台线程中预取前后 prefetch_radius 页。
+    - 已解码的 QImage 按 LRU 保存，总字节数超过 memory_budget 时淘汰最久未使用的页面
+      (当前页除外)，内存占用由预算而不是乐谱页数决定。
+    load(index) 负责把一页解码为 QImage (例如从 Render List 光栅化)，会在 GUI 线程或预取线程中调用，
+    必须是线程安全的。页面集合本身不保存其他形式的页面。
+    """
+    def __init__(
+        self,
+        page_count: int,
+        load: Callable[[int], QImage],
+        memory_budget: int = DEFAULT_PAGE_MEMORY_BUDGET,
+        prefetch_radius: int = DEFAULT_PREFETCH_RADIUS,
+        pool: Optional[QThreadPool] = None
+    ):
+        self.page_count = page_count
+        self.memory_budget = memory_budget
+        self.prefetch_radius = prefetch_radius
+        self._load = load
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[int, QImage]" = OrderedDict()
+        self._cached_bytes = 0
+        self._current = 0
+        self._closed = False
+
+        self.pool = pool if pool is not None else prefetch_pool()
+
+    def __len__(self) -> int:
+        return self.page_count
+
+    @property
+    def cached_bytes(self) -> int:
+        return self._cached_bytes
+
+    def page(self, index: int) -> QImage:
+        """返回第 index 页 (必要时在当前线程中同步解码)，并预取相邻页面。"""
+        if not 0 <= index < self.page_count:
+            raise IndexError(f"page index {index} out of range (0..{self.page_count - 1})")
+        self._current = index
+        with self._lock:
+            image = self._cache.get(index)
+            if image is not None:
+                self._cache.move_to_end(index)
+        if image is None:
+            image = self._load(index)
+            self._store(index, image)
+
+        self._prefetch(index)
+        return image
+
+    def peek(self, index: int) -> Optional[QImage]:
+        """返回已解码的页面，未解码时返回 None (不触发解码)。"""
+        with self._lock:
+            return self._cache.get(index)
+
+    def snapshot(self) -> Tuple[int, Dict[int, QImage]]:
+        """返回 (当前页码, 当前已解码的 {页码: QImage})，作为下一次差分重绘的基准。"""
+        with self._lock:
+            return self._current, dict(self._cache)
+
+    def insert(self, index: int, image: QImage):
+        """放入一页已经解码好的页面 (例如由上一次的页面差分更新而来)。"""
+        self._store(index, image)
+
+    def _wants(self, index: int) -> bool:
+        if self._closed or abs(index - self._current) > self.prefetch_radius:
+            return False
+        with self._lock:
+            return index not in self._cache
+
+    def _prefetch(self, index: int):
+        # 之前排队但尚未开始的预取都已过时
+        self.pool.clear()
+        for offset in range(1, self.prefetch_radius + 1):
+            for neighbour in (index + offset, index - offset):
+                if 0 <= neighbour < self.page_count and self._wants(neighbour):
+                    self.pool.start(PrefetchJob(self, neighbour))
+
+    def _store(self, index: int, image: QImage):
+        with self._lock:
+            old = self._cache.pop(index, None)
+            if old is not None:
+                self._cached_bytes -= old.sizeInBytes()
+            self._cache[index] = image
+            self._cached_bytes += image.sizeInBytes()
+            self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用的页面直到不超过预算；当前页始终保留。"""
+        for index in list(self._cache):
+            if self._cached_bytes <= self.memory_budget:
+                break
+            if index == self._current:
+                continue
+            self._cached_bytes -= self._cache.pop(index).sizeInBytes()
+
+    def close(self):
+        """放弃排队中的预取并等待进行中的解码结束 (替换为新的页面集合前调用)。"""
+        self._closed = True
+        self.pool.clear()
+        self.pool.waitForDone()
@@ -0,0 +1,71 @@
+from typing import Optional
+
+from PySide6.QtGui import QImage
+
+
+# PIL 模式 -> (QImage 格式, 每像素字节数)
+_PIL_TO_QIMAGE_FORMAT = {
+    "RGB": (QImage.Format.Format_RGB888, 3),
+    "RGBA": (QImage.Format.Format_RGBA8888, 4),
+    "L": (QImage.Format.Format_Grayscale8, 1),
+}
+
+
+def buffer_to_qimage(data, width: int, height: int, mode: str = "RGBA") -> QImage:
+    """
+    将原始像素缓冲区包装为 QImage，不复制像素。
+    QImage 并不拥有这块内存，因此把缓冲区挂在 QImage 对象上，保证其生命周期不短于 QImage。
+    """
+    qformat, bytes_per_pixel = _PIL_TO_QIMAGE_FORMAT[mode]
+    qimage = QImage(data, width, height, width * bytes_per_pixel, qformat)
+    qimage._buffer = data
+    return qimage
+
+
+def pixel_size(mode: str) -> int:
+    """PIL 模式对应的 QImage 每像素字节数。"""
+    return _PIL_TO_QIMAGE_FORMAT[mode][1]
+
+
+def write_region(buffer, stride: int, pixel_bytes: int, rect, data):
+    """把矩形 rect (left, top, right, bottom) 的紧凑像素 data 逐行写入每行 stride 字节的整页缓冲区。"""
+    left, top, right, bottom = rect
+    row_bytes = (right - left) * pixel_bytes
+    for row in range(bottom - top):
+        start = (top + row) * stride + left * pixel_bytes
+        buffer[start:start + row_bytes] = data[row * row_bytes:(row + 1) * row_bytes]
+
+
+def pil_to_qimage(image) -> QImage:
+    """
+    把内存中的 PIL.Image 页面转为 QImage (不经过 PNG 编解码)。
+    QImage 直接包装 tobytes() 得到的唯一一份像素 (不再复制)；
+    之后用 patch_qimage 更新时会复制出新的缓冲区，这份像素不会被修改。
+    """
+    if image.mode not in _PIL_TO_QIMAGE_FORMAT:
+        image = image.convert("RGBA")
+    return buffer_to_qimage(image.tobytes(), image.width, image.height, image.mode)
+
+
+def patch_qimage(qimage: QImage, rects, regions) -> Optional[QImage]:
+    """
+    复制 qimage 的像素缓冲区，把 regions (与 rects 一一对应的 PIL 小图) 写入各矩形 (left, top, right, bottom)，
+    返回新的 QImage，原图不变 (可能仍在显示或被其他线程读取)。
+    qimage 不是由 pil_to_qimage 创建或格式不匹配时返回 None，调用方应整页重新转换。
+    """
+    buffer = getattr(qimage, "_buffer", None)
+    if not isinstance(buffer, (bytes, bytearray)):
+        return None
+    patched = None
+    for rect, region in zip(rects, regions):
+        if region.mode not in _PIL_TO_QIMAGE_FORMAT:
+            region = region.convert("RGBA")
+        qformat, pixel_bytes = _PIL_TO_QIMAGE_FORMAT[region.mode]
+        if qimage.format() != qformat:
+            return None
+        if patched is None:
+            patched = bytearray(buffer)
+        write_region(patched, qimage.width() * pixel_bytes, pixel_bytes, rect, region.tobytes())
+    if patched is None:
+        return qimage
+    return buffer_to_qimage(patched, qimage.width(), qimage.height(), region.mode)
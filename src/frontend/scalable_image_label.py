@@ -1,43 +1,100 @@
 # scalable_image_label.py (或直接放在 main_windows.py 顶部)
 
+from collections import OrderedDict
+from typing import Hashable, Optional
+
 from PySide6.QtWidgets import QLabel
-from PySide6.QtGui import QPixmap
-from PySide6.QtCore import Qt, QSize
+from PySide6.QtGui import QImage, QPixmap
+from PySide6.QtCore import Qt, QSize, QTimer
+
+# 缩放结果缓存的条目数 (页面 x 尺寸)
+SCALED_CACHE_SIZE = 12
+# 停止拖动多久之后做一次平滑缩放 (毫秒)
+SMOOTH_RESCALE_DELAY_MS = 150
 
 class ScalableImageLabel(QLabel):
     """
     一个自定义的 QLabel，用于在尺寸变化时自动等比例缩放图片。
+
+    - 拖动分隔条等连续尺寸变化时先用 FastTransformation 快速缩放，
+      停止变化 SMOOTH_RESCALE_DELAY_MS 后再做一次 SmoothTransformation。
+    - 平滑缩放的结果按 (页面键, 宽, 高) 放入 LRU 缓存，来回翻页时无需重新缩放。
     """
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self._current_pixmap = QPixmap() 
+        # 尚未转换为 QPixmap 的原始页面 (缓存命中时不需要转换)
+        self._source_image: Optional[QImage] = None
+        self._page_key: Optional[Hashable] = None
+        self._scaled_cache: "OrderedDict[tuple, QPixmap]" = OrderedDict()
 
-    def set_score_pixmap(self, pixmap: QPixmap):
-        """设置新的原始图片，并触发缩放更新"""
+        self._smooth_timer = QTimer(self)
+        self._smooth_timer.setSingleShot(True)
+        self._smooth_timer.setInterval(SMOOTH_RESCALE_DELAY_MS)
+        self._smooth_timer.timeout.connect(lambda: self.update_scaled_image(smooth=True))
+
+    def set_score_pixmap(self, pixmap: QPixmap, page_key: Optional[Hashable] = None):
+        """设置新的原始图片，并触发缩放更新。page_key 唯一标识页面内容，用于缓存缩放结果。"""
         self._current_pixmap = pixmap
+        self._source_image = None
+        self._page_key = page_key
         self.update_scaled_image() 
 
+    def set_score_image(self, image: QImage, page_key: Optional[Hashable] = None):
+        """以 QImage 设置页面；只有缓存未命中时才转换为 QPixmap。"""
+        self._current_pixmap = QPixmap()
+        self._source_image = image
+        self._page_key = page_key
+        self.update_scaled_image()
+
+    def clear_scaled_cache(self):
+        """页面内容整体更新 (重新生成乐谱) 时清空缩放缓存。"""
+        self._scaled_cache.clear()
+
+    def _has_source(self) -> bool:
+        return self._source_image is not None or not self._current_pixmap.isNull()
+
+    def _source_pixmap(self) -> QPixmap:
+        if self._current_pixmap.isNull() and self._source_image is not None:
+            self._current_pixmap = QPixmap.fromImage(self._source_image)
+        return self._current_pixmap
+
     def resizeEvent(self, event):
-        """当控件尺寸变化时自动触发缩放"""
+        """尺寸变化时先快速缩放，停止变化后再平滑缩放"""
         super().resizeEvent(event)
-        self.update_scaled_image()
+        self.update_scaled_image(smooth=False)
+        self._smooth_timer.start()
 
-    def update_scaled_image(self):
-        """执行等比例缩放操作"""
-        if self._current_pixmap.isNull():
+    def update_scaled_image(self, smooth: bool = True):
+        """执行等比例缩放操作；smooth=False 用于连续尺寸变化期间的快速预览。"""
+        if not self._has_source():
             self.setText("乐谱图片显示区域")
             return
         
         # 1. 获取 QLabel 的当前可用尺寸
         label_size = self.size()
+        cache_key = None
+        if self._page_key is not None:
+            cache_key = (self._page_key, label_size.width(), label_size.height())
+            cached = self._scaled_cache.get(cache_key)
+            if cached is not None:
+                self._scaled_cache.move_to_end(cache_key)
+                self.setPixmap(cached)
+                return
         
-        # 2. 缩放图片，保持宽高比，并平滑处理
-        scaled_pixmap = self._current_pixmap.scaled(
+        # 2. 缩放图片，保持宽高比
+        scaled_pixmap = self._source_pixmap().scaled(
             label_size,
             Qt.AspectRatioMode.KeepAspectRatio, # 保持宽高比
-            Qt.TransformationMode.SmoothTransformation
+            Qt.TransformationMode.SmoothTransformation if smooth else Qt.TransformationMode.FastTransformation
         )
+
+        # 只缓存平滑缩放的结果
+        if smooth and cache_key is not None:
+            self._scaled_cache[cache_key] = scaled_pixmap
+            while len(self._scaled_cache) > SCALED_CACHE_SIZE:
+                self._scaled_cache.popitem(last=False)
         
         # 3. 设置到 QLabel
         self.setPixmap(scaled_pixmap)
@@ -47,7 +104,7 @@ class ScalableImageLabel(QLabel):
         覆盖此方法，明确告诉布局管理器，这个标签可以缩小到 1x1 像素。
         """
         # 如果没有图片，返回一个默认值，或者返回最小允许尺寸
-        if self._current_pixmap.isNull():
+        if not self._has_source():
              # 返回 QWidget 的默认最小尺寸提示
              return super().minimumSizeHint()
 
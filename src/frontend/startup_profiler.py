@@ -0,0 +1,76 @@
+import cProfile
+import io
+import pstats
+import sys
+import time
+from typing import List, Optional, Tuple
+
+
+class StartupProfiler:
+    """
+    启动耗时分析 (python main.py --profile-startup)。
+
+    - mark(label) 记录一个启动阶段的结束，报告中列出每个阶段的耗时以及该阶段新导入的顶层包。
+    - watch_first_paint(window) 在窗口第一次绘制时结束分析并打印报告，
+      其中附带 cProfile 按累计耗时排序的前 top 个函数 (模块导入显示为 <frozen importlib._bootstrap>)。
+    未启用时所有方法都是空操作。
+    """
+    def __init__(self, enabled: bool, top: int = 30, stream=None):
+        self.enabled = enabled
+        self.top = top
+        self.stream = stream or sys.stderr
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._known_modules = set(sys.modules)
+        self._phases: List[Tuple[str, float, List[str]]] = []
+        self._profile: Optional[cProfile.Profile] = None
+        self._paint_watcher = None
+        if enabled:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def mark(self, label: str):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        modules = set(sys.modules)
+        packages = sorted({name.split(".")[0] for name in modules - self._known_modules})
+        self._known_modules = modules
+        self._phases.append((label, now - self._last, packages))
+        self._last = now
+
+    def watch_first_paint(self, window):
+        """窗口第一次收到 Paint 事件时调用 finish()。"""
+        if not self.enabled:
+            return
+        from PySide6.QtCore import QEvent, QObject
+
+        profiler = self
+
+        class _FirstPaintWatcher(QObject):
+            def eventFilter(self, obj, event):
+                if event.type() == QEvent.Type.Paint:
+                    obj.removeEventFilter(self)
+                    profiler.finish("首次绘制")
+                return False
+
+        self._paint_watcher = _FirstPaintWatcher(window)
+        window.installEventFilter(self._paint_watcher)
+
+    def finish(self, label: str = "完成"):
+        if not self.enabled or self._profile is None:
+            return
+        self.mark(label)
+        self._profile.disable()
+
+        out = self.stream
+        total = self._last - self._start
+        print(f"\n=== 启动耗时: {total * 1000:.1f} ms ===", file=out)
+        for phase, seconds, packages in self._phases:
+            imported = f"  导入: {', '.join(packages)}" if packages else ""
+            print(f"{phase:<24} {seconds * 1000:8.1f} ms{imported}", file=out)
+
+        buffer = io.StringIO()
+        pstats.Stats(self._profile, stream=buffer).sort_stats("cumulative").print_stats(self.top)
+        print(buffer.getvalue(), file=out)
+        self._profile = None
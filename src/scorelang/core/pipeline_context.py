@@ -1,6 +1,6 @@
 # src/scorelang/pipeline_context.py
 
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional
 from ..ast_score.nodes import ScoreDocumentNode
 # 假设这些依赖类已在其他模块定义
 
@@ -42,6 +42,10 @@ class PipelineContext:
         # 用于存储管道中所有 Pass 的通用日志和警告信息
         self.log_messages: List[str] = []
 
+        # 可选的页面接收器：设置后 Layout Pass 每排完一页就交给它，
+        # 而不是把所有页的命令都保存在 render_artifact 中 (用于流式导出)
+        self.page_sink: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+
     # --- 辅助方法 (可选，但推荐) ---
 
     def add_render_artifact(self, data_type: str, artifact_data: RenderArtifact):
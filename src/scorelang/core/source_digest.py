@@ -0,0 +1,32 @@
+import hashlib
+from functools import lru_cache
+from pathlib import Path
+
+
+# src/scorelang 包目录
+SCORELANG_DIR = Path(__file__).resolve().parent.parent
+# 决定编译结果 (Token / AST / Pass 之后的 Render List) 的子包
+PIPELINE_SOURCE_DIRS = ("ast_score", "common", "config", "core", "lexer", "parsers", "visitors")
+# 决定光栅化结果的子包
+RENDERER_SOURCE_DIRS = ("renderers",)
+
+
+@lru_cache(maxsize=None)
+def source_digest(*dirs: str) -> str:
+    """
+    src/scorelang 下若干子包全部源码 (.py 及配置文件) 的内容哈希，每个进程只计算一次。
+    与手动递增的 PIPELINE_VERSION / RENDERER_VERSION 一起放进缓存键：
+    修改了代码却忘记递增版本号时，旧的缓存条目同样失效。
+    """
+    h = hashlib.sha256()
+    for dir_name in dirs:
+        for path in sorted((SCORELANG_DIR / dir_name).rglob("*")):
+            if not path.is_file() or "__pycache__" in path.parts:
+                continue
+            data = path.read_bytes()
+            name = path.relative_to(SCORELANG_DIR).as_posix().encode("utf-8")
+            h.update(len(name).to_bytes(8, "little"))
+            h.update(name)
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+    return h.hexdigest()
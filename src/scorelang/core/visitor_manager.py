@@ -1,5 +1,5 @@
 import importlib
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 from ..ast_score.nodes import ScoreDocumentNode
 from ..core.pipeline_context import PipelineContext
@@ -14,7 +14,8 @@ PIPELINE_CONFIG: Dict[str, Any] = {
             "src.scorelang.visitors.pipa_layout_pass.PipaLayoutPass", # 占位
         ],
         "renderers": {
-            #"svg": "scorelang.renderers.pipa_svg_renderer.PipaSVGRenderer",
+            "svg": "src.scorelang.renderers.pipa_svg_renderer.PipaSVGRenderer",
+            "pdf": "src.scorelang.renderers.pipa_pdf_renderer.PipaPDFRenderer",
             "text": "src.scorelang.renderers.pipa_text_renderer.PipaTextRenderer",
         }
     }
@@ -28,6 +29,43 @@ class VisitorManager:
     这个管理器将整个编译管道的编排逻辑从 ScoreService 中分离出来。
     """
     
+    @staticmethod
+    def visitor_paths(score_type: str) -> List[str]:
+        """返回该乐谱类型按顺序执行的 Visitor 类完全限定路径。"""
+        score_config = PIPELINE_CONFIG.get(score_type.lower())
+        if score_config is None:
+            return []
+        return score_config.get('visitors', [])
+
+    @staticmethod
+    def run_pass(context: PipelineContext, visitor_path: str) -> PipelineContext:
+        """
+        加载并运行单个 Visitor Pass (原地修改 context.node / context.render_artifact)。
+        ScoreService 逐个调用它，以便按 Pass 缓存中间结果。
+        """
+        try:
+            # 1. 解析路径：将 'module.submodule.ClassName' 拆分为路径和类名
+            module_path, class_name = visitor_path.rsplit('.', 1)
+            
+            # 2. 动态导入模块
+            module = importlib.import_module(module_path)
+            
+            # 3. 获取 Visitor 类对象
+            VisitorClass = getattr(module, class_name)
+
+            # TODO: 这里将配置字典作为参数传递给 Visitor 的 __init__ 方法
+            # 5. 实例化并运行 Visitor Pass
+            visitor_instance: BaseVisitor = VisitorClass(context)
+            print(f"   -> Executing Pass: {class_name}...")
+            node = context.node
+            # Visitor Pass 在原地 (in-place) 修改 ast_root
+            visitor_instance.visit(node)
+            
+        except Exception as e:
+            # 捕获任何加载或执行错误，并抛出清晰的运行时错误
+            raise RuntimeError(f"Pipeline failed at Visitor Pass '{visitor_path}'. Error: {e}")
+        return context
+
     @staticmethod
     def run_pipeline(context: PipelineContext, score_type: str) -> ScoreDocumentNode:
         """
@@ -41,11 +79,9 @@ class VisitorManager:
         Returns:
             经过所有 Pass 转换后的 AST 根节点。
         """
-        context = context
         score_type = score_type.lower()
         # 从配置中获取 Visitor 类的完全限定路径列表
-        score_config = PIPELINE_CONFIG.get(score_type)
-        visitor_paths: list = score_config.get('visitors', [])
+        visitor_paths = VisitorManager.visitor_paths(score_type)
         
         if not visitor_paths:
             print(f"Warning: No Visitors defined for score type '{score_type}'. Skipping pipeline run.")
@@ -54,27 +90,7 @@ class VisitorManager:
         print(f"--- Running Visitor Pipeline for {score_type} ({len(visitor_paths)} Passes) ---")
 
         for visitor_path in visitor_paths:
-            try:
-                # 1. 解析路径：将 'module.submodule.ClassName' 拆分为路径和类名
-                module_path, class_name = visitor_path.rsplit('.', 1)
-                
-                # 2. 动态导入模块
-                module = importlib.import_module(module_path)
-                
-                # 3. 获取 Visitor 类对象
-                VisitorClass = getattr(module, class_name)
-
-                # TODO: 这里将配置字典作为参数传递给 Visitor 的 __init__ 方法
-                # 5. 实例化并运行 Visitor Pass
-                visitor_instance: BaseVisitor = VisitorClass(context)
-                print(f"   -> Executing Pass: {class_name}...")
-                node = context.node
-                # Visitor Pass 在原地 (in-place) 修改 ast_root
-                visitor_instance.visit(node)
-                
-            except Exception as e:
-                # 捕获任何加载或执行错误，并抛出清晰的运行时错误
-                raise RuntimeError(f"Pipeline failed at Visitor Pass '{visitor_path}'. Error: {e}")
+            VisitorManager.run_pass(context, visitor_path)
 
         print("--- Visitor Pipeline Completed ---")
         return context
\ No newline at end of file
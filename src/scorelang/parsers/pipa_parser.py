@@ -1,5 +1,6 @@
+import re
 from pathlib import Path
-from typing import Dict, List, Callable,Union
+from typing import Dict, List, Callable, Optional, Union
 import toml
 
 # 假设的导入路径
@@ -11,6 +12,12 @@ from ..ast_score.nodes import (
 )
 
 
+# 文件头 (标题/调式/元数据) 在第一个 { 谱字块或 ## 乐部行之前结束
+HEADER_END_PATTERN = re.compile(r"^[ \t]*(\{|##)", re.MULTILINE)
+# 文件头中可以出现的文档字段
+HEADER_FIELDS = ("title", "mode", "source", "transcriber", "proofreader", "date")
+
+
 class PipaParser(BaseParser):
     
     def __init__(self):
@@ -56,8 +63,10 @@ class PipaParser(BaseParser):
     # --- 主要解析入口 ---
 
     def parse(self, text: str) -> ScoreDocumentNode:
-        tokens = self.lexer.tokenize(text)
-        
+        return self.parse_tokens(self.lexer.tokenize(text))
+
+    def parse_tokens(self, tokens: List[Dict]) -> ScoreDocumentNode:
+        """由 Lexer 输出的 Token 序列构建 AST (编译缓存命中 Token 阶段时直接从这里开始)。"""
         # 重置状态
         self.score_document = ScoreDocumentNode()
         self.current_section = None
@@ -76,7 +85,22 @@ class PipaParser(BaseParser):
         
         return self.score_document
 
+    def parse_header(self, text: str) -> Dict[str, Optional[str]]:
+        """
+        只解析文件头：词法扫描在第一个 { 或 ## 行之前停止，不构建乐部/谱字，也不运行 Visitor。
+        返回 HEADER_FIELDS 中各字段 (元数据字段名按 document_meta_map 映射)，用于保存文件名和乐谱索引。
+        """
+        match = HEADER_END_PATTERN.search(text)
+        header_text = text[:match.start()] if match else text
+
+        self.score_document = ScoreDocumentNode()
+        self.current_section = None
+        self.current_unit = None
+        for token in self.lexer.tokenize(header_text):
+            if token.get("semantic") in ("document_meta", "mode"):
+                self._dispatch_map[token["semantic"]](token)
 
+        return {field: getattr(self.score_document, field) for field in HEADER_FIELDS}
 
 
 
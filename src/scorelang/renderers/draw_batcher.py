@@ -0,0 +1,56 @@
+from typing import Callable, Dict, Hashable, List, Set, Tuple
+
+from .glyph_atlas import GlyphEntry
+
+
+# 重叠检测的网格边长 (像素)：字形包围盒按网格登记，只和同格中的字形比较
+BATCH_GRID_CELL = 64
+
+
+class GlyphBatcher:
+    """
+    按 (字体类型, 字号, 颜色) 分组的字形绘制队列。
+
+    字形先进入各自分组的队列，flush() 时逐组连续绘制，避免在不同墨色/字体之间来回切换。
+    为保证输出与按布局顺序逐字绘制完全一致：新字形的包围盒与其他分组中尚未绘制的字形重叠时，
+    先把所有队列画完再入队。因此队列中不同分组的字形互不重叠，它们的绘制先后不影响像素；
+    同一分组内仍保持原有顺序。
+    """
+    def __init__(self, paste: Callable[[GlyphEntry, int, int], None]):
+        self._paste = paste
+        self._groups: Dict[Hashable, List[Tuple[GlyphEntry, int, int]]] = {}
+        self._occupied: Dict[Tuple[int, int], Set[Hashable]] = {}
+
+    @staticmethod
+    def _cells(glyph: GlyphEntry, x: int, y: int) -> List[Tuple[int, int]]:
+        """字形包围盒覆盖的网格 (与 GlyphEntry.paste_onto 相同的定位方式)。"""
+        width, height = glyph.mask.size
+        if width == 0 or height == 0:
+            return []
+        left = x + glyph.offset[0]
+        top = y + glyph.offset[1]
+        return [
+            (cx, cy)
+            for cx in range(left // BATCH_GRID_CELL, (left + width - 1) // BATCH_GRID_CELL + 1)
+            for cy in range(top // BATCH_GRID_CELL, (top + height - 1) // BATCH_GRID_CELL + 1)
+        ]
+
+    def add(self, key: Hashable, glyph: GlyphEntry, x: int, y: int):
+        """把字形加入 key 分组的队列；(x, y) 为画布上的整数锚点坐标。"""
+        cells = self._cells(glyph, x, y)
+        for cell in cells:
+            if any(other != key for other in self._occupied.get(cell, ())):
+                self.flush()
+                break
+
+        self._groups.setdefault(key, []).append((glyph, x, y))
+        for cell in cells:
+            self._occupied.setdefault(cell, set()).add(key)
+
+    def flush(self):
+        """按分组依次绘制所有排队的字形并清空队列。"""
+        for queued in self._groups.values():
+            for glyph, x, y in queued:
+                self._paste(glyph, x, y)
+        self._groups.clear()
+        self._occupied.clear()
@@ -0,0 +1,65 @@
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import ImageFont
+
+
+# 注册表键：(字体文件路径, 整数字号)
+FontKey = Tuple[str, int]
+
+
+class FontRegistry:
+    """
+    进程级共享的字体注册表 (线程安全)。
+
+    ImageFont.truetype 每次都会从磁盘读取并解析字体文件；
+    所有 Renderer 实例都从这里取字体，同一 (路径, 字号) 在进程内只加载一次。
+    """
+    def __init__(self):
+        self._fonts: Dict[FontKey, ImageFont.FreeTypeFont] = {}
+        self._lock = threading.Lock()
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._fonts)
+
+    def get(self, path: str, size: float) -> ImageFont.FreeTypeFont:
+        """获取字体；未加载时加载并缓存。加载失败时退回 Pillow 默认字体。"""
+        # Pillow 需要整数大小
+        key = (path, int(size))
+        font = self._fonts.get(key)
+        if font is not None:
+            return font
+
+        with self._lock:
+            # 双重检查：等待锁期间可能已被预热线程加载
+            font = self._fonts.get(key)
+            if font is None:
+                try:
+                    font = ImageFont.truetype(path, key[1])
+                except IOError:
+                    print(f"Warning: Font {path} not found. Using default.")
+                    font = ImageFont.load_default()
+                self._fonts[key] = font
+        return font
+
+    def warm_up(self, specs: Iterable[FontKey]):
+        """同步加载一组 (路径, 字号)。"""
+        for path, size in specs:
+            self.get(path, size)
+
+    def warm_up_in_background(self, specs: Iterable[FontKey]) -> threading.Thread:
+        """在后台守护线程中预热字体，避免第一次预览时卡在字体加载上。"""
+        specs = list(specs)
+        thread = threading.Thread(target=self.warm_up, args=(specs,), name="font-warm-up", daemon=True)
+        thread.start()
+        self._warm_up_thread = thread
+        return thread
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+
+
+# 进程内唯一的字体注册表
+FONT_REGISTRY = FontRegistry()
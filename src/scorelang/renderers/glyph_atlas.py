@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont, PngImagePlugin
+
+
+# 图集键：(字符, 字体类型, 字号, 颜色, 锚点)
+GlyphKey = Tuple[str, str, float, str, str]
+
+
+@dataclass
+class GlyphEntry:
+    """
+    一个预光栅化的字形：'L' 模式的灰度遮罩 + 相对锚点的左上角偏移。
+    """
+    mask: Image.Image
+    offset: Tuple[int, int]
+    color: str
+    _inks: Dict[str, Any] = field(default_factory=dict, repr=False)
+    _derived: Dict[Hashable, Any] = field(default_factory=dict, repr=False)
+
+    def ink_for(self, mode: str):
+        """返回颜色在指定画布模式下的像素值 (按模式缓存)。"""
+        ink = self._inks.get(mode)
+        if ink is None:
+            ink = ImageColor.getcolor(self.color, mode)
+            self._inks[mode] = ink
+        return ink
+
+    def derived(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """缓存由本字形派生的数据 (例如调色板量化后的遮罩)，随字形一起被 LRU 淘汰。"""
+        value = self._derived.get(key)
+        if value is None:
+            value = build()
+            self._derived[key] = value
+        return value
+
+    def paste_onto(self, canvas: Image.Image, x: int, y: int):
+        """
+        将字形合成到画布上，(x, y) 为锚点的整数像素坐标。
+        遮罩在锚点 (0, 0) 处光栅化，因此与 ImageDraw.text 在同一整数坐标处的输出逐像素一致；
+        ImageDraw.text 在小数坐标处会按亚像素偏移重新光栅化，结果不同，调用方需先取整 (见 to_canvas)。
+        """
+        box = (x + self.offset[0], y + self.offset[1])
+        canvas.paste(self.ink_for(canvas.mode), box, self.mask)
+
+
+class GlyphAtlas:
+    """
+    字形图集：每个字形只交给 FreeType 光栅化一次，之后以 Image.paste 贴图。
+
+    - 内存中按 LRU 淘汰，最多保留 max_entries 个字形。
+    - 可选的 cache_dir 会把遮罩以 PNG 形式持久化到磁盘，跨进程复用。
+    """
+    def __init__(self, max_entries: int = 4096, cache_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[GlyphKey, GlyphEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(
+        self,
+        text: str,
+        font_type: str,
+        size: float,
+        color: str,
+        anchor: str,
+        font: ImageFont.FreeTypeFont
+    ) -> GlyphEntry:
+        """查找字形，未命中时光栅化 (或从磁盘读取) 并放入图集。"""
+        key = (text, font_type, size, color, anchor)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        mask, offset = self._load_or_rasterize(text, anchor, font)
+        entry = GlyphEntry(mask=mask, offset=offset, color=color)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    # -----------------------------------------------------------
+    # 光栅化与磁盘缓存
+    # -----------------------------------------------------------
+
+    @staticmethod
+    def _rasterize(text: str, anchor: str, font: ImageFont.FreeTypeFont) -> Tuple[Image.Image, Tuple[int, int]]:
+        """在锚点 (0, 0) 处光栅化字形，返回遮罩和左上角偏移。"""
+        left, top, right, bottom = font.getbbox(text, anchor=anchor)
+        left, top = int(left), int(top)
+        width = max(int(right) - left, 1)
+        height = max(int(bottom) - top, 1)
+
+        mask = Image.new('L', (width, height), 0)
+        ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font, anchor=anchor)
+        return mask, (left, top)
+
+    def _disk_path(self, text: str, anchor: str, font: ImageFont.FreeTypeFont) -> Optional[str]:
+        """磁盘缓存文件名：字体文件 (路径/大小/修改时间)、字号、字符和锚点的摘要。"""
+        font_path = getattr(font, 'path', None)
+        if not self.cache_dir or not isinstance(font_path, str):
+            return None
+        try:
+            stat = os.stat(font_path)
+        except OSError:
+            return None
+        raw = f"{font_path}|{stat.st_size}|{stat.st_mtime_ns}|{font.size}|{anchor}|{text}"
+        digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.png")
+
+    def _load_or_rasterize(self, text: str, anchor: str, font: ImageFont.FreeTypeFont) -> Tuple[Image.Image, Tuple[int, int]]:
+        disk_path = self._disk_path(text, anchor, font)
+
+        if disk_path and os.path.exists(disk_path):
+            try:
+                with Image.open(disk_path) as cached:
+                    cached.load()
+                    offset = tuple(int(v) for v in cached.text["offset"].split(','))
+                    return cached.convert('L'), offset
+            except Exception as e:
+                print(f"Warning: Glyph cache file {disk_path} is unreadable, re-rasterizing: {e}")
+
+        mask, offset = self._rasterize(text, anchor, font)
+
+        if disk_path:
+            info = PngImagePlugin.PngInfo()
+            info.add_text("offset", f"{offset[0]},{offset[1]}")
+            tmp_path = f"{disk_path}.{os.getpid()}.tmp"
+            try:
+                mask.save(tmp_path, 'PNG', pnginfo=info)
+                os.replace(tmp_path, disk_path)
+            except OSError as e:
+                print(f"Warning: Failed to write glyph cache {disk_path}: {e}")
+        return mask, offset
@@ -0,0 +1,102 @@
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from .glyph_atlas import GlyphEntry
+from .output_profiles import IndexedPalette
+
+# numpy 为可选依赖，只有选择 numpy 合成后端时才导入 (导入本身就要几十毫秒，不拖慢启动)
+np = None
+
+
+def require_numpy():
+    """选择 numpy 合成后端前调用：导入 numpy，未安装时给出明确的错误。"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("The 'numpy' compositor requires numpy. Install it with 'pip install numpy'.")
+        np = numpy
+
+
+class NumpyCanvas:
+    """
+    以 numpy uint8 数组保存的页面画布，字形遮罩用向量化的 alpha 混合合成，
+    光栅化结束后才通过 to_image() 转为 PIL.Image。
+
+    混合公式与 Pillow 的 Image.paste(颜色, 位置, 遮罩) 相同 (带舍入的整数除以 255)，
+    因此输出与 Pillow 合成逐字节一致。支持 'RGB'、'L' 以及带 IndexedPalette 的 'P' 画布。
+
+    它比默认的 Pillow 合成慢：字形遮罩大多很小，逐字形的数组切片和类型转换开销超过了向量化的收益。
+    在 README 示例加长后的 4 页乐谱上 (导出尺寸，字形图集已预热)，每页耗时约为
+    RGB 6.2 → 11.3 ms (1.8 倍)、灰度 3.7 → 6.5 ms (1.7 倍)、调色板 4.0 → 5.3 ms (1.3 倍)。
+    因此只作为可选后端 (compositor="numpy") 保留，默认仍为 Pillow。
+    """
+    def __init__(self, mode: str, size: Tuple[int, int], palette: Optional[IndexedPalette] = None):
+        require_numpy()
+        self.mode = mode
+        self.size = size
+        self.palette = palette
+
+        width, height = size
+        if mode == 'RGB':
+            self.pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+        elif mode == 'L':
+            self.pixels = np.full((height, width), 255, dtype=np.uint8)
+        elif mode == 'P' and palette is not None:
+            # 调色板索引 0 为白色背景
+            self.pixels = np.zeros((height, width), dtype=np.uint8)
+        else:
+            raise ValueError(f"NumpyCanvas does not support canvas mode '{mode}'.")
+
+    def _clip(self, glyph: GlyphEntry, x: int, y: int):
+        """计算字形在画布上的可见区域，返回 (画布切片, 遮罩切片)；完全在画布外时返回 None。"""
+        mask_width, mask_height = glyph.mask.size
+        # 与 GlyphEntry.paste_onto 相同的定位方式
+        left = x + glyph.offset[0]
+        top = y + glyph.offset[1]
+
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + mask_width, self.size[0]), min(top + mask_height, self.size[1])
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return (
+            (slice(y0, y1), slice(x0, x1)),
+            (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left)),
+        )
+
+    def paste_glyph(self, glyph: GlyphEntry, x: int, y: int):
+        """把字形合成到整数锚点 (x, y)。"""
+        clipped = self._clip(glyph, x, y)
+        if clipped is None:
+            return
+        region_box, mask_box = clipped
+        region = self.pixels[region_box]
+
+        if self.mode == 'P':
+            # 调色板索引不能混合：按量化后的二值遮罩直接写入索引
+            indices, cover = glyph.derived(
+                ('numpy',) + self.palette.cache_key,
+                lambda: tuple(np.asarray(image) for image in self.palette.quantize(glyph))
+            )
+            cover = cover[mask_box] > 0
+            region[cover] = indices[mask_box][cover]
+            return
+
+        mask = glyph.derived(('numpy', 'mask'), lambda: np.asarray(glyph.mask, dtype=np.uint32))[mask_box]
+        if self.mode == 'RGB':
+            mask = mask[..., None]
+        ink = np.asarray(glyph.ink_for(self.mode), dtype=np.uint32)
+
+        # Pillow 的 BLEND + DIV255：(dst * (255 - m) + ink * m + 128) 再做带舍入的除以 255
+        blended = region.astype(np.uint32) * (255 - mask) + ink * mask + 128
+        region[...] = ((blended >> 8) + blended) >> 8
+
+    def to_image(self) -> Image.Image:
+        """转为 PIL.Image (复制一次像素数据)。"""
+        if self.mode == 'P':
+            image = Image.frombytes('P', self.size, self.pixels.tobytes())
+            image.putpalette(self.palette.palette)
+            return image
+        return Image.fromarray(self.pixels)
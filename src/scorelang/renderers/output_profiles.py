@@ -0,0 +1,77 @@
+from typing import Any, Dict, List, Optional
+
+from PIL import Image, ImageColor
+
+from .glyph_atlas import GlyphEntry
+
+
+# --- 输出配置 (画布模式 + PNG 编码参数) ---
+# canvas_mode:   渲染时使用的画布模式 ('RGB' 每像素 4 字节，'P'/'L' 每像素 1 字节)
+# save_mode:     保存前转换到的模式 (None 表示保持画布模式)
+# palette_size:  'P' 模式调色板的颜色数 (白色背景 + 各墨色的抗锯齿色阶)
+# compress_level / optimize: 传给 Pillow PNG 编码器的 zlib 级别与 optimize 开关
+OUTPUT_PROFILES: Dict[str, Dict[str, Any]] = {
+    "rgb":     {"canvas_mode": "RGB", "save_mode": None, "palette_size": None, "compress_level": 6, "optimize": False},
+    "palette": {"canvas_mode": "P",   "save_mode": None, "palette_size": 16,   "compress_level": 9, "optimize": False},
+    "gray":    {"canvas_mode": "L",   "save_mode": None, "palette_size": None, "compress_level": 9, "optimize": False},
+    "mono":    {"canvas_mode": "L",   "save_mode": "1",  "palette_size": None, "compress_level": 9, "optimize": False},
+}
+
+
+def resolve_output_profile(name: str, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """按名称取出输出配置，并用 overrides 覆盖其中的参数 (例如 {"compress_level": 1})。"""
+    if name not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile '{name}'. Available: {', '.join(OUTPUT_PROFILES)}")
+    profile = dict(OUTPUT_PROFILES[name])
+    for key, value in (overrides or {}).items():
+        if key not in profile:
+            raise ValueError(f"Unknown output profile option '{key}'.")
+        profile[key] = value
+    return profile
+
+
+class IndexedPalette:
+    """
+    'P' 模式画布的固定调色板：索引 0 为白色背景，每种墨色占若干级由浅到深的色阶。
+
+    调色板索引不能做 alpha 混合，所以字形遮罩会先量化到色阶，
+    再以二值遮罩把索引图贴到画布上，从而在 4~16 色内保留抗锯齿边缘。
+    """
+    def __init__(self, colors: List[str], palette_size: int = 16):
+        self.colors = list(dict.fromkeys(colors))
+        # 至少每种颜色一级；颜色数超出 palette_size 时以颜色完整为先
+        self.levels = max(1, (palette_size - 1) // len(self.colors))
+
+        # 字形量化结果的缓存键：调色板内容相同即可复用
+        self.cache_key = ('palette', tuple(self.colors), self.levels)
+
+        self.palette: List[int] = [255, 255, 255]
+        self._first_index: Dict[str, int] = {}
+        for color in self.colors:
+            rgb = ImageColor.getrgb(color)[:3]
+            self._first_index[color] = len(self.palette) // 3
+            for level in range(1, self.levels + 1):
+                t = level / self.levels
+                self.palette.extend(round(255 + (c - 255) * t) for c in rgb)
+
+    def new_canvas(self, size) -> Image.Image:
+        canvas = Image.new('P', size, 0)
+        canvas.putpalette(self.palette)
+        return canvas
+
+    def quantize(self, glyph: GlyphEntry):
+        """把字形遮罩量化为 (索引图, 二值遮罩)，结果缓存在字形上。"""
+        first_index = self._first_index[glyph.color]
+        levels = [round(m * self.levels / 255) for m in range(256)]
+        index_lut = [first_index + level - 1 if level else 0 for level in levels]
+        mask_lut = [255 if level else 0 for level in levels]
+
+        indices = glyph.mask.point(index_lut)
+        index_image = Image.frombytes('P', indices.size, indices.tobytes())
+        return index_image, glyph.mask.point(mask_lut)
+
+    def paste_glyph(self, canvas: Image.Image, glyph: GlyphEntry, x: int, y: int):
+        """与 GlyphEntry.paste_onto 相同的定位方式，把字形贴到 'P' 画布的整数锚点 (x, y) 上。"""
+        index_image, mask = glyph.derived(self.cache_key, lambda: self.quantize(glyph))
+        box = (x + glyph.offset[0], y + glyph.offset[1])
+        canvas.paste(index_image, box, mask)
@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from PIL import Image
+
+
+# 一页的写出结果：(页码索引, 文件路径, 异常或 None)
+PageWriteResult = Tuple[int, str, Optional[BaseException]]
+
+
+class BackgroundPageWriter:
+    """
+    页面输出阶段：把光栅化完成的画布交给 I/O 线程池做 PNG 编码和写盘，
+    渲染循环随即开始下一页，编码与光栅化重叠进行。
+
+    - 待写页面数有上限 (max_pending)，达到上限时 submit() 阻塞，
+      避免渲染远快于写盘时画布在内存中堆积。
+    - 每页的错误单独记录，某一页失败不影响其他页面。
+    - workers=0 时退化为在调用线程中同步写出。
+
+    提交后画布归写出阶段所有，调用方不能再修改它。
+    """
+    def __init__(
+        self,
+        encode: Callable[[Image.Image, str], None],
+        workers: int = 2,
+        max_pending: int = 4
+    ):
+        self.encode = encode
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[threading.BoundedSemaphore] = None
+        if workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="page-writer")
+            self._slots = threading.BoundedSemaphore(max(1, max_pending))
+
+        self._jobs: List[Tuple[int, str, Future]] = []
+        self._results: List[PageWriteResult] = []
+
+    def _write(self, image: Image.Image, path: str):
+        try:
+            self.encode(image, path)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def submit(self, page_index: int, image: Image.Image, path: str):
+        """提交一页；队列已满时阻塞到有页面写完为止。"""
+        if self._executor is None:
+            try:
+                self.encode(image, path)
+                self._results.append((page_index, path, None))
+            except Exception as e:
+                self._results.append((page_index, path, e))
+            return
+
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._write, image, path)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._jobs.append((page_index, path, future))
+
+    def close(self) -> List[PageWriteResult]:
+        """等待所有页面写完，按提交顺序返回每页的结果。"""
+        for page_index, path, future in self._jobs:
+            self._results.append((page_index, path, future.exception()))
+        self._jobs.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        results, self._results = self._results, []
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
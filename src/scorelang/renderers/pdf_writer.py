@@ -0,0 +1,144 @@
+import os
+import zlib
+from typing import Dict, List
+
+from PIL import Image
+
+
+class StreamingPdfWriter:
+    """
+    增量写出的多页 PDF：每加入一页就把该页的图像、内容流和页面对象写入文件，
+    调用方随即可以释放这一页；页面树、目录和交叉引用表在 close() 时写出。
+    因此无论乐谱多长，内存中最多只保留一页。
+
+    内容先写入同目录下的临时文件，close() 写完文件尾后才用 os.replace 放到 path；
+    中途出错时 abort() (或 with 块中抛出异常) 删除临时文件，path 上原有的文件保持不变。
+    """
+    # 对象编号 1、2 预留给目录 (Catalog) 和页面树 (Pages)，它们在最后写出
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, path: str, dpi: float = 200, compress_level: int = 6):
+        self.path = path
+        self.dpi = dpi
+        self.compress_level = compress_level
+
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._position = 0
+        self._offsets: Dict[int, int] = {}
+        self._page_ids: List[int] = []
+        self._next_id = 3
+
+        # 文件头；第二行的高位字节告诉读取方这是二进制文件
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_ids)
+
+    # -----------------------------------------------------------
+    # 底层写出
+    # -----------------------------------------------------------
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._position += len(data)
+
+    def _allocate_id(self) -> int:
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id: int, body: str):
+        self._offsets[obj_id] = self._position
+        self._write(f"{obj_id} 0 obj\n{body}\nendobj\n".encode('latin-1'))
+
+    def _write_stream(self, obj_id: int, entries: str, data: bytes):
+        self._offsets[obj_id] = self._position
+        self._write(f"{obj_id} 0 obj\n<< {entries} /Length {len(data)} >>\nstream\n".encode('latin-1'))
+        self._write(data)
+        self._write(b"\nendstream\nendobj\n")
+
+    # -----------------------------------------------------------
+    # 公共接口
+    # -----------------------------------------------------------
+
+    def add_image_page(self, image: Image.Image):
+        """把一页光栅图像作为整页图片写入 PDF (Flate 无损压缩)，页面尺寸按 dpi 换算为点。"""
+        if image.mode == '1':
+            image = image.convert('L')
+        if image.mode == 'L':
+            color_space = "/DeviceGray"
+        else:
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            color_space = "/DeviceRGB"
+
+        width_pt = image.width * 72.0 / self.dpi
+        height_pt = image.height * 72.0 / self.dpi
+        # 先压缩再分配对象编号：压缩失败时不会留下没有写出的对象
+        pixels = zlib.compress(image.tobytes(), self.compress_level)
+
+        image_id = self._allocate_id()
+        content_id = self._allocate_id()
+        page_id = self._allocate_id()
+
+        self._write_stream(
+            image_id,
+            f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+            f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /FlateDecode",
+            pixels
+        )
+        content = f"q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im0 Do Q".encode('latin-1')
+        self._write_stream(content_id, "", content)
+        self._write_object(
+            page_id,
+            f"<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        self._page_ids.append(page_id)
+        self._file.flush()
+
+    def close(self):
+        """写出页面树、目录、交叉引用表和文件尾，关闭文件并移动到 path。"""
+        if self._file.closed:
+            return
+        try:
+            self._finish()
+        except BaseException:
+            self.abort()
+            raise
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """放弃导出：关闭并删除临时文件，不改动 path。"""
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+    def _finish(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(self.PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>")
+        self._write_object(self.CATALOG_ID, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>")
+
+        xref_position = self._position
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            lines.append(f"{self._offsets[obj_id]:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {size} /Root {self.CATALOG_ID} 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+        self._write("".join(lines).encode('latin-1'))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
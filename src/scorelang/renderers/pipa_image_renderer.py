@@ -1,43 +1,145 @@
+import hashlib
+import json
 import math
 import os
-from typing import List, Dict, Any, Tuple, Optional
-from PIL import Image, ImageDraw, ImageFont # 导入 Pillow 核心模块
+import re
+from collections import Counter
+from dataclasses import asdict
+from typing import List, Dict, Any, Tuple, Optional, Union
+from PIL import Image, ImageFont # 导入 Pillow 核心模块
 
 # 假设 PipaLayoutConfig 路径和结构已知
 from ..config.layout_config import PipaLayoutConfig # 使用你更新后的类名
 from ..core.pipeline_context import PipelineContext
+from ..core.source_digest import RENDERER_SOURCE_DIRS, source_digest
+from .draw_batcher import GlyphBatcher
+from .font_registry import FONT_REGISTRY
+from .glyph_atlas import GlyphAtlas, GlyphEntry
+from .numpy_canvas import NumpyCanvas, require_numpy
+from .output_profiles import IndexedPalette, resolve_output_profile
+from .page_writer import BackgroundPageWriter
+from .render_utils import TEMP_STYLES_MAP, command_glyphs, resolve_style, score_folder_name
+from .unit_sprite_cache import UnitSpriteCache
 
-# --- 临时配置替代品 (同上，用于快速验证) ---
-TEMP_STYLES_MAP = {
-    "DOCUMENT_TITLE": {"font_size_key": "title_size", "color": "darkblue", "font_type": "title", "font_path_key": "text"},
-    "SECTION_TITLE":  {"font_size_key": "title_size", "color": "darkblue", "font_type": "title", "font_path_key": "text"},
-    "MODE":           {"font_size_key": "mode_size", "color": "gray", "font_type": "mode", "font_path_key": "text"},
-    "MAIN_CHAR":      {"font_size_key": "main_char_size", "color": "black", "font_type": "main_char", "font_path_key": "score"},
-    "SMALL_MODIFIER": {"font_size_key": "small_char_size", "color": "black", "font_type": "small_char", "font_path_key": "score"},
-    "TEXT_BLOCK":     {"font_size_key": "textunit_size", "color": "black", "font_type": "textunit", "font_path_key": "text"},
-    "DOT_MARKER":     {"font_size_key": "main_char_size", "color": "red", "font_type": "main_char", "font_path_key": "score"},
-    "CIRCLE_MARKER":  {"font_size_key": "main_char_size", "color": "red", "font_type": "main_char", "font_path_key": "score"},
-    "LINE_MARKER":    {"font_size_key": "small_char_size", "color": "red", "font_type": "small_char", "font_path_key": "score"},
-    "CHECK_MARKER":   {"font_size_key": "small_char_size", "color": "red", "font_type": "small_char", "font_path_key": "score"},
-    "BAI_MARKER":     {"font_size_key": "small_char_size", "color": "red", "font_type": "small_char", "font_path_key": "score"},
+# 进程内共享的默认字形图集：ScoreService 每次渲染都会新建 Renderer，图集在实例之间复用
+DEFAULT_GLYPH_ATLAS = GlyphAtlas()
+DEFAULT_UNIT_SPRITE_CACHE = UnitSpriteCache()
+
+# 页面缓存清单：与 page_NNN.png 放在同一目录，记录每页内容哈希
+PAGE_MANIFEST_NAME = "manifest.json"
+PAGE_FILE_PATTERN = re.compile(r"^page_(\d+)\.png$")
+# 渲染逻辑发生不兼容变化时递增，使旧的页面缓存全部失效
+RENDERER_VERSION = 2
+
+# 展开后的单个字形：(字符, 字体类型, 字号, 颜色, x, y)，字号与坐标均为布局坐标系中的值
+DecodedGlyph = Tuple[str, str, float, str, float, float]
+# 画布上的矩形区域：(left, top, right, bottom)，right/bottom 不含
+Rect = Tuple[int, int, int, int]
+# 差分重绘的脏区域面积超过整页的这一比例时，直接整页重绘更划算
+DIFF_FULL_REDRAW_RATIO = 0.5
+
+# 可以合成为单元贴图的命令类型 (单字形命令)
+SPRITE_COMMAND_TYPES = {
+    "MAIN_CHAR", "SMALL_MODIFIER",
+    "DOT_MARKER", "CIRCLE_MARKER", "LINE_MARKER", "CHECK_MARKER", "BAI_MARKER",
 }
 
 
+def to_canvas(value: float, scale: float) -> int:
+    """
+    把布局坐标换算为画布上的整数像素坐标 (四舍五入)。
+    所有绘制路径只在这里取整一次，字形贴图的结果与 ImageDraw.text 在同一整数坐标处绘制的结果逐像素一致。
+    """
+    return math.floor(value * scale + 0.5)
+
+
+def font_specs(config: PipaLayoutConfig) -> List[Tuple[str, int]]:
+    """根据 TEMP_STYLES_MAP 和 PipaLayoutConfig 列出渲染需要的所有 (字体路径, 字号)。"""
+    specs = []
+    for style in TEMP_STYLES_MAP.values():
+        size = getattr(config, style.get('font_size_key', 'main_char_size'), config.main_char_size)
+        spec = (config.get_font_path(style.get('font_type', 'title')), int(size))
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def warm_up_fonts(config: Optional[PipaLayoutConfig] = None, background: bool = True):
+    """
+    应用启动时调用：把渲染用到的字体预先载入进程级 FONT_REGISTRY。
+    background=True 时在后台线程中加载，返回该线程。
+    """
+    config = config if config is not None else PipaLayoutConfig()
+    specs = font_specs(config)
+    if background:
+        return FONT_REGISTRY.warm_up_in_background(specs)
+    FONT_REGISTRY.warm_up(specs)
+    return None
+
+
 class PipaImageRenderer:
     """
     基于 Render List 命令的 Pillow 图像渲染器 (快速验证版)。
     """
-    def __init__(self, context:PipelineContext):
+    def __init__(
+        self,
+        context:PipelineContext,
+        glyph_atlas: Optional[GlyphAtlas] = None,
+        use_unit_sprites: bool = False,
+        sprite_cache: Optional[UnitSpriteCache] = None,
+        use_page_cache: bool = True,
+        output_profile: str = "rgb",
+        profile_options: Optional[Dict[str, Any]] = None,
+        scale: float = 1.0,
+        encode_workers: int = 2,
+        max_pending_pages: int = 4,
+        batch_draw: bool = True,
+        compositor: str = "pillow",
+        raster_cache: Optional[Any] = None,
+        folder_name: Optional[str] = None
+    ):
         self.context = context
         self.config:PipaLayoutConfig = self.context.layout_config
         self.styles = TEMP_STYLES_MAP
         self._font_cache: Dict[Tuple[str, float], ImageFont.FreeTypeFont] = {}
+        # 字形图集：同一 (字符, 字体, 字号, 颜色, 锚点) 只光栅化一次
+        self.glyph_atlas = glyph_atlas if glyph_atlas is not None else DEFAULT_GLYPH_ATLAS
+        # 单元贴图模式：同一谱字单元只合成一次，之后每次出现只贴一次图
+        self.use_unit_sprites = use_unit_sprites
+        self.sprite_cache = sprite_cache if sprite_cache is not None else DEFAULT_UNIT_SPRITE_CACHE
+        # 页面缓存：内容哈希未变化的页面既不重新光栅化也不重写文件
+        self.use_page_cache = use_page_cache
+        # 内存中的光栅化结果缓存 (提供 get_image / put_image，例如 CompileCache)，按页面内容哈希复用
+        self.raster_cache = raster_cache
+        # 导出子目录名；None 时使用乐谱名 (见 score_folder_name)
+        self.folder_name = folder_name
+        # 分组批量绘制：按 (字体, 字号, 颜色) 分组连续绘制，输出与逐条绘制一致
+        self.batch_draw = batch_draw
+        # 合成后端："pillow" 直接在 PIL.Image 上贴图；"numpy" 在 uint8 数组上做向量化混合 (需要 numpy)，
+        # 输出与 pillow 逐字节一致但更慢 (见 numpy_canvas)，只作为可选实现保留
+        if compositor not in ("pillow", "numpy"):
+            raise ValueError(f"Unknown compositor '{compositor}'. Available: pillow, numpy")
+        if compositor == "numpy":
+            require_numpy()
+        self.compositor = compositor
+        # 导出时的后台编码：最多 max_pending_pages 页排队等待 encode_workers 个线程编码写盘 (0 为同步)
+        self.encode_workers = encode_workers
+        self.max_pending_pages = max_pending_pages
+        # 输出配置：画布模式 (RGB / P / L) 与 PNG 编码参数，见 OUTPUT_PROFILES
+        self.profile = resolve_output_profile(output_profile, profile_options)
+        self.palette: Optional[IndexedPalette] = None
+        if self.profile["canvas_mode"] == "P":
+            colors = ["black"] + [style.get('color', 'black') for style in self.styles.values()]
+            self.palette = IndexedPalette(colors, self.profile["palette_size"] or 16)
+        # 光栅化比例：预览时按显示尺寸缩小 (如 0.5)，字号、坐标和画布一起缩放；导出使用 1.0
+        if scale <= 0:
+            raise ValueError(f"Render scale must be positive, got {scale}.")
+        self.scale = scale
         
-        # 声明画布和绘图上下文
-        self.canvas: Optional[Image.Image] = None
-        self.draw: Optional[ImageDraw.ImageDraw] = None
-        self.page_width: int = int(self.config.page_dimensions[0])
-        self.page_height: int = int(self.config.page_dimensions[1])
+        # 声明画布 (字形由 GlyphBatcher 直接贴到画布上，不需要 ImageDraw 上下文)
+        self.canvas: Optional[Union[Image.Image, NumpyCanvas]] = None
+        self.page_width: int = max(1, round(self.config.page_dimensions[0] * scale))
+        self.page_height: int = max(1, round(self.config.page_dimensions[1] * scale))
         
         print("Pipa Image Renderer initialized with Render List interface.")
 
@@ -46,190 +148,486 @@ class PipaImageRenderer:
     # -----------------------------------------------------------
 
     def _get_font(self, size: float, font_type: str) -> ImageFont.FreeTypeFont:
-        """根据配置加载或从缓存中获取字体对象。"""
+        """从进程级字体注册表获取字体对象 (实例内再做一层字典缓存，省去路径计算)。"""
         key = (size, font_type)
         if key not in self._font_cache:
             font_path = self.config.get_font_path(font_type)
-            try:
-                # Pillow 需要整数大小
-                self._font_cache[key] = ImageFont.truetype(font_path, int(size))
-            except IOError:
-                print(f"Warning: Font {font_path} not found. Using default.")
-                self._font_cache[key] = ImageFont.load_default()
+            self._font_cache[key] = FONT_REGISTRY.get(font_path, size)
         return self._font_cache[key]
 
+    def _paste_glyph(
+        self,
+        canvas: Union[Image.Image, NumpyCanvas],
+        scale: float,
+        text: str,
+        x: float,
+        y: float,
+        size: float,
+        font_type: str,
+        color: str
+    ):
+        """把一个字形按 scale 换算后贴到 canvas 上 (x, y, size 为布局坐标系中的值)。"""
+        size = size * scale
+        font = self._get_font(size, font_type)
+
+        # 使用 'ra' (Right-Top/Ascender) 锚点，符合竖排排版习惯
+        glyph = self.glyph_atlas.get(text, font_type, size, color, "ra", font)
+        self._place_glyph(canvas, glyph, to_canvas(x, scale), to_canvas(y, scale))
+
+    def _place_glyph(self, canvas: Union[Image.Image, NumpyCanvas], glyph: GlyphEntry, x: int, y: int):
+        """把已取出的字形贴到画布的 (x, y) 锚点 (整数画布坐标，见 to_canvas)。"""
+        if isinstance(canvas, NumpyCanvas):
+            canvas.paste_glyph(glyph, x, y)
+        elif self.palette is not None:
+            self.palette.paste_glyph(canvas, glyph, x, y)
+        else:
+            glyph.paste_onto(canvas, x, y)
+
     def _draw_text(self, text: str, pos: List[float], size: float, font_type: str = 'text', color: str = "black"):
         """
-        绘制文本。
+        绘制文本：从字形图集取出预光栅化的遮罩，用 Image.paste 合成到画布上。
+        pos 和 size 为布局坐标系中的值，这里按 self.scale 换算到画布。
         """
-        if not self.draw: return
+        if not self.canvas: return
         # 假设 pos 是 [x, y]
-        x, y = pos[0], pos[1]
-        font = self._get_font(size, font_type)
+        self._paste_glyph(self.canvas, self.scale, text, pos[0], pos[1], size, font_type, color)
 
-        # 使用 'ra' (Right-Top/Ascender) 锚点，符合竖排排版习惯
-        self.draw.text(
-            (x, y), 
-            text, 
-            fill=color, 
-            font=font, 
-            anchor="ra" 
-        )
+    # -----------------------------------------------------------
+    # 核心命令处理和渲染入口
+    # -----------------------------------------------------------
 
-    def _get_space_metrics(self, font_type: str) -> Tuple[float, float]:
-        """根据 font_type 查找对应的空间度量 (x_space, y_space)。"""
-        if font_type == 'title':
-            return self.config.title_space
-        elif font_type == 'mode':
-            return self.config.mode_space
-        elif font_type == 'textunit': # 用于 TextBlock/普通文本
-            return self.config.textunit_space
-        elif font_type == 'main_char':
-            return self.config.main_char_space # 主字符空间
-        elif font_type == 'small_char':
-            return self.config.small_char_space # 主字符空间
-    
-    def _draw_vertical_string(
-        self, 
-        text: str, 
-        start_pos: Tuple[float, float], 
-        size: float, 
-        font_type: str,
-        color: str = 'black'
-    ) -> float:
+    def _resolve_style(self, cmd_type: str) -> Tuple[float, str, str]:
+        """根据命令类型查找 (字号, 字体类型, 颜色)。"""
+        return resolve_style(self.styles, self.config, cmd_type)
+
+    def _handle_command(self, command: Dict[str, Any]):
+        """按 Layout 给出的字形 (标题/调式已竖排、文本块已换列) 逐字绘制。"""
+        font_size, font_type, color = self._resolve_style(command['type'])
+
+        for char, x, y in command_glyphs(command):
+            self._draw_text(char, [x, y], font_size, font_type, color)
+
+    # -----------------------------------------------------------
+    # 单元贴图模式
+    # -----------------------------------------------------------
+
+    def _draw_unit_sprite(self, unit_commands: List[Dict[str, Any]]):
         """
-        将字符串中的每个字符从上到下逐个绘制（用于标题/调式）。
-        
-        返回: 最后一个字符的 Y 轴结束位置（下一个元素应开始的位置）。
+        将一个谱字单元的全部命令作为一张贴图绘制。
+        签名包含每个字形的字体/颜色以及取整后相对锚点的像素位移，因此贴图结果与逐字绘制一致。
         """
-        
-        start_x, current_y = start_pos
-        
-        # 根据 font_type 获取对应的 Y 轴空间占用
-        _, char_y_space = self._get_space_metrics(font_type)
-        
-        # 逐字符绘制
-        for char in text:
-            # 绘制当前字符
-            self._draw_text(
-                char, 
-                [start_x, current_y], 
-                size, 
-                font_type,
-                color
-            )
-            
-            # 更新 Y 轴：向下移动一个字符的 Y 空间
-            current_y += char_y_space
-        return
-    
-    def _draw_text_block(
-        self, 
-        text: str, 
-        start_pos: Tuple[float, float], 
-        font_size: float, 
-        font_type: str, 
-        dimensions: Tuple[float, float],
-        color: str
-    ):
+        anchor_x = to_canvas(unit_commands[0]['position'][0], self.scale)
+        anchor_y = to_canvas(unit_commands[0]['position'][1], self.scale)
+
+        resolved = []
+        for command in unit_commands:
+            font_size, font_type, color = self._resolve_style(command['type'])
+            x, y = to_canvas(command['position'][0], self.scale), to_canvas(command['position'][1], self.scale)
+            resolved.append((command.get('text', ''), font_type, font_size * self.scale, color, x - anchor_x, y - anchor_y))
+
+        signature = tuple(resolved)
+
+        def build():
+            glyphs = []
+            for text, font_type, font_size, color, dx, dy in resolved:
+                font = self._get_font(font_size, font_type)
+                glyph = self.glyph_atlas.get(text, font_type, font_size, color, "ra", font)
+                glyphs.append((glyph, dx, dy))
+            return glyphs
+
+        sprite = self.sprite_cache.get_or_build(signature, build)
+        sprite.paste_onto(self.canvas, anchor_x, anchor_y)
+
+    # -----------------------------------------------------------
+    # 分组批量绘制
+    # -----------------------------------------------------------
+
+    def _queue_command(self, batcher: GlyphBatcher, command: Dict[str, Any], groups: Dict[str, Tuple[Tuple[str, float, str], ImageFont.FreeTypeFont]]):
+        """把一条命令的字形放入批量队列；样式和字体按命令类型每页只查一次 (缓存在 groups 中)。"""
+        cmd_type = command['type']
+        group = groups.get(cmd_type)
+        if group is None:
+            font_size, font_type, color = self._resolve_style(cmd_type)
+            size = font_size * self.scale
+            group = groups[cmd_type] = ((font_type, size, color), self._get_font(size, font_type))
+
+        key, font = group
+        font_type, size, color = key
+        for char, x, y in command_glyphs(command):
+            glyph = self.glyph_atlas.get(char, font_type, size, color, "ra", font)
+            batcher.add(key, glyph, to_canvas(x, self.scale), to_canvas(y, self.scale))
+
+    def _render_page_commands(self, page_commands: List[Dict[str, Any]], page_index: int):
         """
-        绘制具有换行特性的竖排注释文本块。
+        绘制一页的所有命令；开启单元贴图模式时，同一 unit_id 的连续命令合并为一次贴图。
+        调色板画布和 numpy 后端无法合成 RGBA 贴图，此时逐字绘制。
+        开启 batch_draw 时，逐字绘制的命令先进入按样式分组的队列，再成组绘制。
         """
-        if not text: return
-            
-        start_x, start_y = start_pos
-        
-        # 获取空间度量 (假设 text/textunit 字体类型)
-        x_space, y_space = self._get_space_metrics(font_type)
-        
-        # dimensions: (width_available, height_available)
-        available_height = self.config.page_dimensions[1] - start_y - self.config.margin["bottom"]
-        
-        if available_height <= 0:
-            print("Warning: Not enough vertical space for text block.")
-            return
-            
-        # 计算每列最大字符数
-        max_chars_per_col = math.floor(available_height / y_space)
-        
-        if max_chars_per_col <= 0:
-            print("Warning: Max chars per column is zero, skipping text block.")
-            return
-
-        # 开始迭代绘制
-        current_x = start_x
-        current_y = start_y
-        char_count = 0
-
-        for char in text:
-            # 绘制当前字符
-            self._draw_text(char, [current_x, current_y], font_size, font_type, color)
-            
-            char_count += 1
-            current_y += y_space
-            
-            # 检查是否达到列最大字符数
-            if char_count >= max_chars_per_col:
-                current_x -= x_space # 换列：X 坐标向左移动
-                current_y = start_y  # Y 坐标回到初始位置
-                char_count = 0
+        use_sprites = self.use_unit_sprites and self.palette is None and self.compositor == "pillow"
+        batcher: Optional[GlyphBatcher] = None
+        groups: Dict[str, Tuple[Tuple[str, float, str], ImageFont.FreeTypeFont]] = {}
+        if self.batch_draw:
+            canvas = self.canvas
+            batcher = GlyphBatcher(lambda glyph, x, y: self._place_glyph(canvas, glyph, x, y))
+
+        index = 0
+        while index < len(page_commands):
+            command = page_commands[index]
+            unit_id = command.get('metadata', {}).get('unit_id')
+
+            if use_sprites and unit_id is not None and command['type'] in SPRITE_COMMAND_TYPES:
+                end = index + 1
+                while (
+                    end < len(page_commands)
+                    and page_commands[end].get('metadata', {}).get('unit_id') == unit_id
+                    and page_commands[end]['type'] in SPRITE_COMMAND_TYPES
+                ):
+                    end += 1
+                # 贴图直接画在画布上，先画完排在它之前的字形
+                if batcher is not None:
+                    batcher.flush()
+                try:
+                    self._draw_unit_sprite(page_commands[index:end])
+                except Exception as e:
+                    print(f"Error processing unit {unit_id} on page {page_index + 1}: {e}")
+                index = end
+                continue
+
+            try:
+                if batcher is not None:
+                    self._queue_command(batcher, command, groups)
+                else:
+                    self._handle_command(command)
+            except Exception as e:
+                print(f"Error processing command {command.get('type')} on page {page_index + 1}: {e}")
+            index += 1
 
+        if batcher is not None:
+            batcher.flush()
 
     # -----------------------------------------------------------
-    # 核心命令处理和渲染入口
+    # 页面内容哈希与缓存清单
     # -----------------------------------------------------------
 
-    def _handle_command(self, command: Dict[str, Any]):
-        """根据命令类型分发绘制操作。"""
-        cmd_type = command['type']
-        pos:Tuple = command['position']
-        text:str = command.get('text', '')
-        metadata:Dict = command.get('metadata', {})
-        
-        style = self.styles.get(cmd_type, {})
-        size_key = style.get('font_size_key', 'main_char_size')
-        font_type = style.get('font_type', 'title')
-        color = style.get('color', 'black')
-        
-        font_size = getattr(self.config, size_key, self.config.main_char_size)
+    def _style_fingerprint(self, scale: Optional[float] = None) -> str:
+        """影响像素输出的全部设置：样式表、布局配置、字体文件 (路径/大小/修改时间)、渲染器版本和源码哈希。"""
+        fonts = []
+        for font_type in sorted({style.get('font_type', 'title') for style in self.styles.values()}):
+            font_path = self.config.get_font_path(font_type)
+            try:
+                stat = os.stat(font_path)
+                fonts.append([font_type, font_path, stat.st_size, stat.st_mtime_ns])
+            except OSError:
+                fonts.append([font_type, font_path, None, None])
 
-         
-        if cmd_type == "TEXT_BLOCK":
-            dimensions = metadata.get('dimensions', (self.page_width, self.page_height)) # 假设 Layout Pass 提供了可用尺寸
-            self._draw_text_block(text, pos, font_size, font_type, dimensions, color)
-            return
+        settings = {
+            "version": RENDERER_VERSION,
+            "source": source_digest(*RENDERER_SOURCE_DIRS),
+            "styles": self.styles,
+            "config": asdict(self.config),
+            "fonts": fonts,
+            "profile": self.profile,
+            "scale": self.scale if scale is None else scale,
+        }
+        raw = json.dumps(settings, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
 
-        if cmd_type in ["DOCUMENT_TITLE", "SECTION_TITLE", "MODE"]:
-            self._draw_vertical_string(text, pos, font_size, font_type, color)
-            return
-        
-        self._draw_text(text, pos, font_size, font_type, color)
-       
+    @staticmethod
+    def _page_digest(page_commands: List[Dict[str, Any]], style_fingerprint: str) -> str:
+        """
+        页面内容哈希。unit_id 只是分组编号，不影响像素，因此不参与哈希
+        (前面插入一个单元不会让后面内容相同的页面失效)。
+        """
+        normalized = []
+        for command in page_commands:
+            metadata = {k: v for k, v in command.get('metadata', {}).items() if k != 'unit_id'}
+            normalized.append([command['type'], command['position'], command.get('text', ''), metadata])
+        raw = json.dumps([style_fingerprint, normalized], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _load_manifest(save_dir: str) -> Dict[str, str]:
+        """读取页面缓存清单 {文件名: 内容哈希}；不存在或损坏时返回空字典。"""
+        manifest_path = os.path.join(save_dir, PAGE_MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("pages", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    @staticmethod
+    def _write_manifest(save_dir: str, pages: Dict[str, str]):
+        manifest_path = os.path.join(save_dir, PAGE_MANIFEST_NAME)
+        tmp_path = manifest_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"pages": pages}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, manifest_path)
+        except OSError as e:
+            print(f"Warning: Failed to write page manifest {manifest_path}: {e}")
+
+    @staticmethod
+    def _remove_stale_pages(save_dir: str, page_count: int):
+        """乐谱变短后，删除页码超出当前页数的旧 page_NNN.png。"""
+        for file_name in os.listdir(save_dir):
+            match = PAGE_FILE_PATTERN.match(file_name)
+            if match and int(match.group(1)) > page_count:
+                try:
+                    os.remove(os.path.join(save_dir, file_name))
+                    print(f"Removed stale page {file_name}")
+                except OSError as e:
+                    print(f"Warning: Failed to remove stale page {file_name}: {e}")
 
-    def render(self, output_path: str) -> str:
+    # -----------------------------------------------------------
+    # 内存渲染入口
+    # -----------------------------------------------------------
+
+    def _new_canvas(self, scale: Optional[float] = None) -> Union[Image.Image, NumpyCanvas]:
+        """按输出配置和合成后端创建白底画布；scale 默认为 self.scale。"""
+        if scale is None:
+            size = (self.page_width, self.page_height)
+        else:
+            size = (
+                max(1, round(self.config.page_dimensions[0] * scale)),
+                max(1, round(self.config.page_dimensions[1] * scale))
+            )
+        if self.compositor == "numpy":
+            return NumpyCanvas(self.profile["canvas_mode"], size, self.palette)
+        if self.palette is not None:
+            return self.palette.new_canvas(size)
+        return Image.new(self.profile["canvas_mode"], size, 'white')
+
+    def encode_page(self, page_image: Image.Image, path: str):
+        """按输出配置把页面编码为 PNG (必要时先转为 1-bit 等保存模式)。"""
+        save_mode = self.profile["save_mode"]
+        if save_mode and page_image.mode != save_mode:
+            page_image = page_image.convert(save_mode, dither=Image.Dither.NONE)
+        page_image.save(
+            path,
+            'PNG',
+            compress_level=self.profile["compress_level"],
+            optimize=self.profile["optimize"]
+        )
+
+    def _page_writer(self) -> BackgroundPageWriter:
+        return BackgroundPageWriter(self.encode_page, self.encode_workers, self.max_pending_pages)
+
+    def render_page(self, page_commands: List[Dict[str, Any]], page_index: int = 0) -> Image.Image:
+        """在内存中光栅化一页，返回 PIL.Image (不写磁盘)。"""
+        # --- 初始化画布 ---
+        self.canvas = self._new_canvas()
+        print(f"Rendering Page {page_index + 1}...")
+
+        num_x = 2*self.config.margin["left"]
+        num_y = self.config.page_dimensions[1] - 0.6* self.config.margin["bottom"]
+        num_pos = (num_x,num_y)
+        # --- 遍历并处理当前页面的所有命令 ---
+        self._render_page_commands(page_commands, page_index)
+        # self.draw.text(
+        #     num_pos, 
+        #     text, 
+        #     fill="grey", 
+        #     font=font, 
+        #     anchor="ra" 
+        # )
+        if isinstance(self.canvas, NumpyCanvas):
+            return self.canvas.to_image()
+        return self.canvas
+
+    def _rasterize_page(self, page_commands: List[Dict[str, Any]], page_index: int, page_digest: Optional[str] = None) -> Image.Image:
+        """光栅化一页；设置了 raster_cache 时，内容哈希相同的页面直接取缓存中的结果。"""
+        if self.raster_cache is None:
+            return self.render_page(page_commands, page_index)
+        if page_digest is None:
+            page_digest = self._page_digest(page_commands, self._style_fingerprint())
+        page_image = self.raster_cache.get_image(page_digest)
+        if page_image is None:
+            page_image = self.render_page(page_commands, page_index)
+            self.raster_cache.put_image(page_digest, page_image)
+        return page_image
+
+    def render_pages(self) -> List[Image.Image]:
+        """
+        内存渲染入口：光栅化 Render Artifact 的所有页面并直接返回，
+        供预览使用，省去 PNG 编码、写盘和再次解码。写入磁盘请使用 render()。
+        """
+        render_artifact = self.context.render_artifact.get("png")
+        if not render_artifact:
+            print("Render Artifact is invalid or empty.")
+            return []
+        style_fingerprint = self._style_fingerprint() if self.raster_cache is not None else None
+        pages = []
+        for page_index, page_commands in enumerate(render_artifact):
+            page_digest = self._page_digest(page_commands, style_fingerprint) if style_fingerprint is not None else None
+            pages.append(self._rasterize_page(page_commands, page_index, page_digest))
+        return pages
+
+    # -----------------------------------------------------------
+    # 差分重绘 (脏矩形)
+    # -----------------------------------------------------------
+
+    def _place_decoded(self, decoded: List[DecodedGlyph]) -> List[Tuple[DecodedGlyph, GlyphEntry, int, int, Rect]]:
+        """为每个字形取出图集条目，并计算其画布锚点 (已取整) 和包围盒。"""
+        placed = []
+        for record in decoded:
+            text, font_type, size, color, x, y = record
+            size = size * self.scale
+            glyph = self.glyph_atlas.get(text, font_type, size, color, "ra", self._get_font(size, font_type))
+            anchor_x, anchor_y = to_canvas(x, self.scale), to_canvas(y, self.scale)
+            left, top = anchor_x + glyph.offset[0], anchor_y + glyph.offset[1]
+            bbox = (left, top, left + glyph.mask.size[0], top + glyph.mask.size[1])
+            placed.append((record, glyph, anchor_x, anchor_y, bbox))
+        return placed
+
+    @staticmethod
+    def _intersects(a: Rect, b: Rect) -> bool:
+        return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+    def _merge_rects(self, rects: List[Rect]) -> List[Rect]:
+        """裁剪到画布并合并相互重叠的矩形。"""
+        merged: List[Rect] = []
+        for rect in rects:
+            rect = (max(rect[0], 0), max(rect[1], 0), min(rect[2], self.page_width), min(rect[3], self.page_height))
+            if rect[0] >= rect[2] or rect[1] >= rect[3]:
+                continue
+            overlapping = [other for other in merged if self._intersects(rect, other)]
+            while overlapping:
+                for other in overlapping:
+                    merged.remove(other)
+                    rect = (min(rect[0], other[0]), min(rect[1], other[1]), max(rect[2], other[2]), max(rect[3], other[3]))
+                overlapping = [other for other in merged if self._intersects(rect, other)]
+            merged.append(rect)
+        return merged
+
+    def page_dirty_rects(
+        self,
+        old_commands: List[Dict[str, Any]],
+        new_commands: List[Dict[str, Any]],
+        page_index: int = 0
+    ) -> Optional[List[Rect]]:
+        """
+        比较新旧命令展开后的字形，返回需要重绘的脏矩形 (已裁剪到画布并合并)。
+        被删除和新增字形的包围盒都是脏的；内容没有变化时返回空列表，
+        脏区域过大、整页重绘更划算时返回 None。
+        """
+        old_placed = self._place_decoded(self._decode_page(old_commands, page_index))
+        new_placed = self._place_decoded(self._decode_page(new_commands, page_index))
+
+        # 以多重集合比较字形：只在一侧出现的字形 (删除/新增/移动/改样式) 都是脏的
+        removed = Counter(item[0] for item in old_placed) - Counter(item[0] for item in new_placed)
+        added = Counter(item[0] for item in new_placed) - Counter(item[0] for item in old_placed)
+        rects: List[Rect] = []
+        for placed, changed in ((old_placed, removed), (new_placed, added)):
+            for record, _, _, _, bbox in placed:
+                if changed[record] > 0:
+                    changed[record] -= 1
+                    rects.append(bbox)
+
+        dirty = self._merge_rects(rects)
+        dirty_area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in dirty)
+        if dirty_area > DIFF_FULL_REDRAW_RATIO * self.page_width * self.page_height:
+            return None
+        return dirty
+
+    def render_regions(self, page_commands: List[Dict[str, Any]], rects: List[Rect], page_index: int = 0) -> List[Image.Image]:
+        """
+        为每个脏矩形在一块白底小画布上重新绘制与之相交的所有字形，
+        结果与整页重绘中的对应区域逐像素一致。
+        """
+        canvas_mode = 'P' if self.palette is not None else self.profile["canvas_mode"]
+        placed = self._place_decoded(self._decode_page(page_commands, page_index))
+        regions = []
+        for rect in rects:
+            size = (rect[2] - rect[0], rect[3] - rect[1])
+            region = self.palette.new_canvas(size) if self.palette is not None else Image.new(canvas_mode, size, 'white')
+            for _, glyph, anchor_x, anchor_y, bbox in placed:
+                if self._intersects(bbox, rect):
+                    self._place_glyph(region, glyph, anchor_x - rect[0], anchor_y - rect[1])
+            regions.append(region)
+        return regions
+
+    def render_page_diff(
+        self,
+        old_commands: List[Dict[str, Any]],
+        new_commands: List[Dict[str, Any]],
+        old_image: Optional[Image.Image],
+        page_index: int = 0,
+        in_place: bool = True
+    ) -> Tuple[Image.Image, List[Rect]]:
+        """
+        差分重绘一页：只重绘 page_dirty_rects 给出的区域 (见 render_regions) 并贴回 old_image，
+        因此结果与整页重绘逐像素一致。
+        in_place 为 True 时 old_image 被原地修改；为 False 时只在确有区域需要重绘时复制一份再修改
+        (内容不变时原样返回 old_image)。脏区域过大或 old_image 与当前配置不匹配时整页重绘。
+
+        Returns:
+            (页面图像, 脏矩形列表)；内容没有变化时脏矩形列表为空。
+        """
+        full_page = [(0, 0, self.page_width, self.page_height)]
+        canvas_mode = 'P' if self.palette is not None else self.profile["canvas_mode"]
+        if old_image is None or old_image.size != (self.page_width, self.page_height) or old_image.mode != canvas_mode:
+            return self.render_page(new_commands, page_index), full_page
+
+        dirty = self.page_dirty_rects(old_commands, new_commands, page_index)
+        if dirty is None:
+            return self.render_page(new_commands, page_index), full_page
+        if not dirty:
+            return old_image, []
+
+        print(f"Repainting {len(dirty)} region(s) on page {page_index + 1}...")
+        if not in_place:
+            old_image = old_image.copy()
+        for rect, region in zip(dirty, self.render_regions(new_commands, dirty, page_index)):
+            old_image.paste(region, rect[:2])
+        return old_image, dirty
+
+    def render_pages_diff(
+        self,
+        previous_artifact: List[List[Dict[str, Any]]],
+        previous_pages: List[Image.Image],
+        in_place: bool = True
+    ) -> List[Tuple[Image.Image, List[Rect]]]:
+        """
+        对 Render Artifact 的每一页做差分重绘 (以上一次的命令列表和页面图像为基准)。
+        新增的页面整页绘制；返回每页的 (图像, 脏矩形列表)。in_place 的含义见 render_page_diff。
+        """
+        render_artifact = self.context.render_artifact.get("png")
+        if not render_artifact:
+            print("Render Artifact is invalid or empty.")
+            return []
+
+        results = []
+        for page_index, page_commands in enumerate(render_artifact):
+            if page_index < len(previous_artifact) and page_index < len(previous_pages):
+                results.append(self.render_page_diff(
+                    previous_artifact[page_index], page_commands, previous_pages[page_index], page_index, in_place
+                ))
+            else:
+                results.append((self.render_page(page_commands, page_index), [(0, 0, self.page_width, self.page_height)]))
+        return results
+
+    # -----------------------------------------------------------
+    # 导出到磁盘
+    # -----------------------------------------------------------
+
+    def render(self, output_path: str, pages: Optional[List[Image.Image]] = None) -> str:
         """
-        公共入口：接收 Render Artifact (包含 pages)，初始化画布，并遍历绘制所有命令。
+        导出入口：将所有页面以 page_NNN.png 写入 output_path/<乐谱名>/ (指定了 folder_name 时为该目录名)。
         
         Args:
-            render_artifact: Layout Pass 的最终输出。
             output_path: 图像保存路径。
+            pages: 可选，render_pages() 已经得到的页面图像；提供时直接编码保存，不再重新光栅化。
             
         Returns:
             保存图像的文件路径。
         """
-        render_artifact = self.context.render_artifact["png"]
+        render_artifact = self.context.render_artifact.get("png")
         if not render_artifact:
             print("Render Artifact is invalid or empty.")
             return ""
             
-        # 1. 确定文件夹名称（使用第一页第一个命令的 text 值）
-        first_command = render_artifact[0][0]
-        folder_name = first_command.get('text', 'untitled_score').strip()
-        
-        # 清理文件夹名中的非法字符
-        folder_name = "".join(c for c in folder_name if c.isalnum() or c in (' ', '_')).rstrip()
-        if not folder_name:
-            folder_name = 'untitled_score'
+        # 1. 确定文件夹名称（默认使用第一页第一个命令的 text 值）
+        folder_name = self.folder_name or score_folder_name(render_artifact)
 
         # 2. 构造完整的保存目录路径
         save_dir = os.path.join(output_path, folder_name)
@@ -243,46 +641,171 @@ class PipaImageRenderer:
             return ""
 
         # 4. 遍历并渲染所有页面
-        rendered_pages = []
+        style_fingerprint = self._style_fingerprint()
+        old_manifest = self._load_manifest(save_dir) if self.use_page_cache else {}
+        new_manifest: Dict[str, str] = {}
+        # 正在后台写出的页面：{文件路径: (文件名, 内容哈希)}
+        pending_digests: Dict[str, Tuple[str, str]] = {}
         
-        for page_index, page_commands in enumerate(render_artifact):
-            # --- 初始化画布 ---
-            self.canvas = Image.new('RGB', (self.page_width, self.page_height), 'white')
-            self.draw = ImageDraw.Draw(self.canvas)
-            print(f"Rendering Page {page_index + 1}...")
-
-            num_x = 2*self.config.margin["left"]
-            num_y = self.config.page_dimensions[1] - 0.6* self.config.margin["bottom"]
-            num_pos = (num_x,num_y)
-            # --- 遍历并处理当前页面的所有命令 ---
-            for command in page_commands:
-                # num = 1
-                # text = "page" + "_" + str(num)
-                # font = self._get_font(25,"text")
-                try:
-                    self._handle_command(command)
-                except Exception as e:
-                    print(f"Error processing command {command.get('type')} on page {page_index + 1}: {e}")
-            # self.draw.text(
-            #     num_pos, 
-            #     text, 
-            #     fill="grey", 
-            #     font=font, 
-            #     anchor="ra" 
-            # )
-            
-            # --- 5. 保存当前页面文件 ---
-            file_name = f"page_{page_index + 1:03d}.png" # 格式化为 page_001.png, page_002.png
-            page_save_path = os.path.join(save_dir, file_name)
+        writer = self._page_writer()
+        try:
+            for page_index, page_commands in enumerate(render_artifact):
+                file_name = f"page_{page_index + 1:03d}.png" # 格式化为 page_001.png, page_002.png
+                page_save_path = os.path.join(save_dir, file_name)
 
-            # num += 1
-            
+                # --- 内容未变化的页面直接跳过 ---
+                page_digest = self._page_digest(page_commands, style_fingerprint)
+                if old_manifest.get(file_name) == page_digest and os.path.exists(page_save_path):
+                    new_manifest[file_name] = page_digest
+                    print(f"Page {page_index + 1} unchanged, skipped.")
+                    continue
+
+                if pages is not None and page_index < len(pages):
+                    page_image = pages[page_index]
+                else:
+                    page_image = self._rasterize_page(page_commands, page_index, page_digest)
+                
+                # --- 5. 交给输出阶段编码写盘，同时继续光栅化下一页 ---
+                pending_digests[page_save_path] = (file_name, page_digest)
+                writer.submit(page_index, page_image, page_save_path)
+        finally:
+            results = writer.close()
+
+        for page_index, page_save_path, error in results:
+            if error is not None:
+                # 如果一页保存失败，不影响其他页面
+                print(f"Error saving image page {page_index + 1}: {error}")
+                continue
+            file_name, page_digest = pending_digests[page_save_path]
+            new_manifest[file_name] = page_digest
+            print(f"Saved page {page_index + 1} to {page_save_path}")
+
+        # 6. 清理多余的旧页面并更新缓存清单
+        self._remove_stale_pages(save_dir, len(render_artifact))
+        if self.use_page_cache:
+            self._write_manifest(save_dir, new_manifest)
+
+        print("--- Pipa Image Rendering Completed ---")
+        return save_dir # 返回最终保存的目录路径
+
+    # -----------------------------------------------------------
+    # 多分辨率导出
+    # -----------------------------------------------------------
+
+    @staticmethod
+    def scale_dir_name(scale: float) -> str:
+        """每个分辨率的子目录名，例如 1x、0.5x、0.25x。"""
+        return f"{scale:g}x"
+
+    def _decode_page(self, page_commands: List[Dict[str, Any]], page_index: int) -> List[DecodedGlyph]:
+        """把一页命令展开为带样式的字形列表 (样式查找只做一次，各分辨率共用)。"""
+        decoded: List[DecodedGlyph] = []
+        for command in page_commands:
             try:
-                self.canvas.save(page_save_path, 'PNG')
-                print(f"Saved page {page_index + 1} to {page_save_path}")
+                font_size, font_type, color = self._resolve_style(command['type'])
+                for char, x, y in command_glyphs(command):
+                    decoded.append((char, font_type, font_size, color, x, y))
             except Exception as e:
-                print(f"Error saving image page {page_index + 1}: {e}")
-                # 如果一页保存失败，不影响继续渲染下一页
+                print(f"Error processing command {command.get('type')} on page {page_index + 1}: {e}")
+        return decoded
 
-        print("--- Pipa Image Rendering Completed ---")
-        return save_dir # 返回最终保存的目录路径
\ No newline at end of file
+    def _rasterize_decoded(self, decoded: List[DecodedGlyph], scale: float) -> Image.Image:
+        """在 scale 对应尺寸的新画布上绘制已展开的字形。"""
+        canvas = self._new_canvas(scale)
+        if not self.batch_draw:
+            for text, font_type, size, color, x, y in decoded:
+                self._paste_glyph(canvas, scale, text, x, y, size, font_type, color)
+            return canvas.to_image() if isinstance(canvas, NumpyCanvas) else canvas
+
+        batcher = GlyphBatcher(lambda glyph, gx, gy: self._place_glyph(canvas, glyph, gx, gy))
+        for text, font_type, size, color, x, y in decoded:
+            size = size * scale
+            glyph = self.glyph_atlas.get(text, font_type, size, color, "ra", self._get_font(size, font_type))
+            batcher.add((font_type, size, color), glyph, to_canvas(x, scale), to_canvas(y, scale))
+        batcher.flush()
+        return canvas.to_image() if isinstance(canvas, NumpyCanvas) else canvas
+
+    def render_scales(self, output_path: str, scales: List[float]) -> Dict[float, str]:
+        """
+        多分辨率导出入口：一次遍历 Render Artifact，同时输出多个分辨率
+        (例如屏幕 1.0、缩略图 0.25、印刷 2.0)。
+
+        每页命令只展开一次，再分别光栅化到各分辨率的画布；字体对象在各分辨率间共用。
+        输出写入 output_path/<乐谱名>/<比例>x/page_NNN.png，每个子目录有独立的页面缓存清单。
+        多分辨率模式逐字绘制，不使用单元贴图。
+
+        Returns:
+            {比例: 保存目录}
+        """
+        render_artifact = self.context.render_artifact.get("png")
+        if not render_artifact:
+            print("Render Artifact is invalid or empty.")
+            return {}
+
+        scales = list(dict.fromkeys(scales))
+        for scale in scales:
+            if scale <= 0:
+                raise ValueError(f"Render scale must be positive, got {scale}.")
+
+        base_dir = os.path.join(output_path, self.folder_name or score_folder_name(render_artifact))
+        targets: Dict[float, Dict[str, Any]] = {}
+        for scale in scales:
+            save_dir = os.path.join(base_dir, self.scale_dir_name(scale))
+            try:
+                os.makedirs(save_dir, exist_ok=True)
+                print(f"Saving to directory: {save_dir}")
+            except OSError as e:
+                print(f"Error creating directory {save_dir}: {e}")
+                continue
+            targets[scale] = {
+                "dir": save_dir,
+                "fingerprint": self._style_fingerprint(scale),
+                "old_manifest": self._load_manifest(save_dir) if self.use_page_cache else {},
+                "new_manifest": {},
+            }
+
+        # 正在后台写出的页面：{文件路径: (目标, 文件名, 内容哈希)}
+        pending_digests: Dict[str, Tuple[Dict[str, Any], str, str]] = {}
+
+        writer = self._page_writer()
+        try:
+            for page_index, page_commands in enumerate(render_artifact):
+                file_name = f"page_{page_index + 1:03d}.png"
+
+                # --- 找出内容有变化的分辨率 ---
+                pending = []
+                for scale, target in targets.items():
+                    page_save_path = os.path.join(target["dir"], file_name)
+                    page_digest = self._page_digest(page_commands, target["fingerprint"])
+                    if target["old_manifest"].get(file_name) == page_digest and os.path.exists(page_save_path):
+                        target["new_manifest"][file_name] = page_digest
+                        continue
+                    pending.append((scale, target, page_save_path, page_digest))
+
+                if not pending:
+                    print(f"Page {page_index + 1} unchanged, skipped.")
+                    continue
+
+                # --- 展开一次，光栅化到每个需要更新的分辨率 ---
+                decoded = self._decode_page(page_commands, page_index)
+                for scale, target, page_save_path, page_digest in pending:
+                    pending_digests[page_save_path] = (target, file_name, page_digest)
+                    writer.submit(page_index, self._rasterize_decoded(decoded, scale), page_save_path)
+        finally:
+            results = writer.close()
+
+        for page_index, page_save_path, error in results:
+            if error is not None:
+                print(f"Error saving image page {page_index + 1} to {page_save_path}: {error}")
+                continue
+            target, file_name, page_digest = pending_digests[page_save_path]
+            target["new_manifest"][file_name] = page_digest
+            print(f"Saved page {page_index + 1} to {page_save_path}")
+
+        for target in targets.values():
+            self._remove_stale_pages(target["dir"], len(render_artifact))
+            if self.use_page_cache:
+                self._write_manifest(target["dir"], target["new_manifest"])
+
+        print("--- Pipa Multi-Resolution Rendering Completed ---")
+        return {scale: target["dir"] for scale, target in targets.items()}
@@ -0,0 +1,69 @@
+import os
+from typing import Any, Callable, Dict, List
+
+from ..core.pipeline_context import PipelineContext
+from .pdf_writer import StreamingPdfWriter
+from .pipa_image_renderer import PipaImageRenderer
+from .render_utils import score_folder_name
+
+
+class PipaPDFRenderer:
+    """
+    多页 PDF 导出：逐页光栅化 Render List，并立即追加到增量写出的 PDF 中。
+
+    - render(): 消费 context 中已有的 Render Artifact，一次只光栅化一页。
+    - page_sink(): 返回可挂到 context.page_sink 上的接收器，
+      Layout Pass 每排完一页就直接写入 PDF，整份乐谱的命令列表也不会留在内存中。
+    其余关键字参数 (如 output_profile) 原样传给内部使用的 PipaImageRenderer。
+    """
+    def __init__(self, context: PipelineContext, dpi: float = 200, **image_options):
+        self.context = context
+        self.dpi = dpi
+        self.image_options: Dict[str, Any] = image_options
+        self._rasterizer = None
+
+        print("Pipa PDF Renderer initialized with Render List interface.")
+
+    def _get_rasterizer(self) -> PipaImageRenderer:
+        # 延迟创建：流式导出时 layout_config 在 Layout Pass 开始后才可用
+        if self._rasterizer is None:
+            self._rasterizer = PipaImageRenderer(self.context, **self.image_options)
+        return self._rasterizer
+
+    def open_writer(self, pdf_path: str) -> StreamingPdfWriter:
+        return StreamingPdfWriter(pdf_path, dpi=self.dpi)
+
+    def page_sink(self, writer: StreamingPdfWriter) -> Callable[[List[Dict[str, Any]]], None]:
+        """返回页面接收器：光栅化一页、写入 PDF，之后该页即可被回收。"""
+        def sink(page_commands: List[Dict[str, Any]]):
+            page_image = self._get_rasterizer().render_page(page_commands, writer.page_count)
+            writer.add_image_page(page_image)
+            print(f"Appended page {writer.page_count} to {writer.path}")
+        return sink
+
+    def render(self, output_path: str) -> str:
+        """
+        公共入口：将 Render Artifact 的所有页面写入 output_path/<乐谱名>.pdf。
+
+        Returns:
+            PDF 文件路径。
+        """
+        render_artifact = self.context.render_artifact.get("png")
+        if not render_artifact:
+            print("Render Artifact is invalid or empty.")
+            return ""
+
+        try:
+            os.makedirs(output_path, exist_ok=True)
+        except OSError as e:
+            print(f"Error creating directory {output_path}: {e}")
+            return ""
+
+        pdf_path = os.path.join(output_path, f"{score_folder_name(render_artifact)}.pdf")
+        with self.open_writer(pdf_path) as writer:
+            sink = self.page_sink(writer)
+            for page_commands in render_artifact:
+                sink(page_commands)
+
+        print("--- Pipa PDF Rendering Completed ---")
+        return pdf_path
@@ -0,0 +1,204 @@
+import base64
+import functools
+import importlib.util
+import io
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, TextIO
+from xml.sax.saxutils import escape, quoteattr
+
+from ..config.layout_config import PipaLayoutConfig
+from ..core.pipeline_context import PipelineContext
+from .render_utils import TEMP_STYLES_MAP, command_glyphs, resolve_style, score_folder_name
+
+
+# 写文件时的缓冲区大小：命令逐条写入缓冲区，由缓冲区批量落盘
+SVG_WRITE_BUFFER_SIZE = 64 * 1024
+# 嵌入字体时按扩展名给出的 MIME 类型
+FONT_MIME_TYPES = {".ttf": "font/ttf", ".otf": "font/otf", ".woff": "font/woff", ".woff2": "font/woff2"}
+
+# 字体的写出方式
+FONTS_SUBSET = "subset"         # 每页嵌入只含本页字符的子集字体 (默认)
+FONTS_EMBED = "embed"           # 每页嵌入完整的字体文件
+FONTS_REFERENCE = "reference"   # 以 file:// 引用本机 data/fonts 下的字体文件
+FONT_MODES = (FONTS_SUBSET, FONTS_EMBED, FONTS_REFERENCE)
+# fontTools 子集化时对不认识的表逐个打印警告 (表被丢弃，不影响显示)
+logging.getLogger("fontTools.subset").setLevel(logging.ERROR)
+
+
+def _data_uri(font_path: str, data: bytes) -> str:
+    mime = FONT_MIME_TYPES.get(Path(font_path).suffix.lower(), "application/octet-stream")
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+@functools.lru_cache(maxsize=8)
+def _font_data_uri(font_path: str, size: int, mtime_ns: int) -> str:
+    """把字体文件编码为 base64 data: URI (按文件大小和修改时间缓存，字体更新后重新编码)。"""
+    with open(font_path, 'rb') as f:
+        return _data_uri(font_path, f.read())
+
+
+@functools.lru_cache(maxsize=256)
+def _subset_data_uri(font_path: str, size: int, mtime_ns: int, chars: FrozenSet[str]) -> str:
+    """
+    只保留 chars 的子集字体 (按字体文件和字符集缓存：字符相同的页面只做一次子集化)。
+    需要 fontTools；字符按码位保留，pipa.ttf 自定义的字形映射不受影响。
+    """
+    from fontTools import subset
+
+    options = subset.Options()
+    options.notdef_outline = True
+    options.layout_features = ["*"]
+    font = subset.load_font(font_path, options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=[ord(char) for char in chars])
+    subsetter.subset(font)
+    buffer = io.BytesIO()
+    subset.save_font(font, buffer, options)
+    return _data_uri(font_path, buffer.getvalue())
+
+
+class PipaSVGRenderer:
+    """
+    基于 Render List 命令的流式 SVG 渲染器。
+
+    每页的命令直接以 <text> 元素逐条写入带缓冲的文件，不在内存中构建 DOM；
+    TEMP_STYLES_MAP 中的样式映射为 CSS 类。
+    pipa.ttf 使用自定义的字形映射，换成其他字体会显示成错误的字形，因此字体必须随 SVG 一起提供。
+    fonts 决定字体的写出方式 (见 FONT_MODES)：
+    - subset (默认)：每页以 base64 嵌入只含该页字符的子集字体，页面可以单独分发，体积只随用到的字符增长；
+      没有安装 fontTools 时退回 embed；
+    - embed：嵌入完整的字体文件，CJK 字体可达数 MB，每页都要付出这个代价；
+    - reference：以 file:// 引用本机 data/fonts 下的字体文件，文件最小，只适合本机查看。
+    """
+    def __init__(self, context: PipelineContext, fonts: str = FONTS_SUBSET):
+        if fonts not in FONT_MODES:
+            raise ValueError(f"Unknown SVG font mode '{fonts}'; choose from {', '.join(FONT_MODES)}.")
+        if fonts == FONTS_SUBSET and importlib.util.find_spec("fontTools") is None:
+            print("Warning: fontTools is not installed, embedding whole fonts in SVG pages.")
+            fonts = FONTS_EMBED
+        self.context = context
+        self.fonts = fonts
+        self._stylesheet_text: Optional[str] = None
+        self.config: PipaLayoutConfig = self.context.layout_config
+        self.styles = TEMP_STYLES_MAP
+        self.page_width: int = int(self.config.page_dimensions[0])
+        self.page_height: int = int(self.config.page_dimensions[1])
+
+        print("Pipa SVG Renderer initialized with Render List interface.")
+
+    # -----------------------------------------------------------
+    # 样式表
+    # -----------------------------------------------------------
+
+    def _font_family(self, cmd_type: str) -> str:
+        """每个字体文件 (font_path_key: score / text) 对应一个 font-family。"""
+        return f"pipa-{self.styles.get(cmd_type, {}).get('font_path_key', 'text')}"
+
+    def _font_src(self, font_path: str, chars: FrozenSet[str]) -> str:
+        """@font-face 的 src：按 fonts 模式为子集/完整字体的 data: URI，读取失败或引用模式时为 file:// 引用。"""
+        if self.fonts != FONTS_REFERENCE:
+            try:
+                stat = os.stat(font_path)
+                if self.fonts == FONTS_SUBSET:
+                    return _subset_data_uri(font_path, stat.st_size, stat.st_mtime_ns, chars)
+                return _font_data_uri(font_path, stat.st_size, stat.st_mtime_ns)
+            except Exception as e:
+                print(f"Warning: Failed to embed font {font_path}, referencing it instead: {e}")
+        return Path(font_path).as_uri()
+
+    def _font_faces(self, page_commands: List[Dict[str, Any]]) -> str:
+        """本页用到的每个 font-family 一条 @font-face (子集模式下只包含本页的字符)。"""
+        family_paths: Dict[str, str] = {}
+        family_chars: Dict[str, set] = {}
+        for command in page_commands:
+            family = self._font_family(command['type'])
+            if family not in family_paths:
+                _, font_type, _ = resolve_style(self.styles, self.config, command['type'])
+                family_paths[family] = self.config.get_font_path(font_type)
+                family_chars[family] = set()
+            family_chars[family].update(char for char, _, _ in command_glyphs(command))
+
+        return "\n".join(
+            f'@font-face{{font-family:"{family}";src:url("{self._font_src(font_path, frozenset(family_chars[family]))}");}}'
+            for family, font_path in sorted(family_paths.items())
+        )
+
+    def _stylesheet(self) -> str:
+        """整页共用的 CSS 类 (每种命令类型一个，每个实例只生成一次)；@font-face 由 _font_faces 按页生成。"""
+        if self._stylesheet_text is not None:
+            return self._stylesheet_text
+        # 'ra' 锚点：x 为右边缘，y 为字形顶部
+        lines = ["text{text-anchor:end;dominant-baseline:text-before-edge;}"]
+        for cmd_type in self.styles:
+            font_size, _, color = resolve_style(self.styles, self.config, cmd_type)
+            lines.append(
+                f'.{cmd_type}{{font-family:"{self._font_family(cmd_type)}";font-size:{font_size:g}px;fill:{color};}}'
+            )
+        self._stylesheet_text = "\n".join(lines)
+        return self._stylesheet_text
+
+    # -----------------------------------------------------------
+    # 流式写出
+    # -----------------------------------------------------------
+
+    def _write_command(self, out: TextIO, command: Dict[str, Any]):
+        """按 Layout 给出的字形逐个写出 <text> 元素。"""
+        css_class = quoteattr(command['type'])
+
+        for char, x, y in command_glyphs(command):
+            out.write(f'<text class={css_class} x="{x:g}" y="{y:g}">{escape(char)}</text>\n')
+
+    def render_page(self, page_commands: List[Dict[str, Any]], out: TextIO, stylesheet: Optional[str] = None):
+        """将一页命令写为一个完整的 SVG 文档。"""
+        stylesheet = stylesheet if stylesheet is not None else self._stylesheet()
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out.write(
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.page_width}" height="{self.page_height}" '
+            f'viewBox="0 0 {self.page_width} {self.page_height}">\n'
+        )
+        out.write(f"<style>\n{self._font_faces(page_commands)}\n{stylesheet}\n</style>\n")
+        out.write(f'<rect width="{self.page_width}" height="{self.page_height}" fill="white"/>\n')
+
+        for command in page_commands:
+            try:
+                self._write_command(out, command)
+            except Exception as e:
+                print(f"Error processing command {command.get('type')}: {e}")
+
+        out.write("</svg>\n")
+
+    def render(self, output_path: str) -> str:
+        """
+        公共入口：将每页写为 output_path/<乐谱名>/page_NNN.svg。
+
+        Returns:
+            保存 SVG 的文件夹路径。
+        """
+        render_artifact = self.context.render_artifact.get("png")
+        if not render_artifact:
+            print("Render Artifact is invalid or empty.")
+            return ""
+
+        save_dir = os.path.join(output_path, score_folder_name(render_artifact))
+        try:
+            os.makedirs(save_dir, exist_ok=True)
+            print(f"Saving to directory: {save_dir}")
+        except OSError as e:
+            print(f"Error creating directory {save_dir}: {e}")
+            return ""
+
+        stylesheet = self._stylesheet()
+        for page_index, page_commands in enumerate(render_artifact):
+            file_name = f"page_{page_index + 1:03d}.svg"
+            page_save_path = os.path.join(save_dir, file_name)
+            try:
+                with open(page_save_path, 'w', encoding='utf-8', buffering=SVG_WRITE_BUFFER_SIZE) as out:
+                    self.render_page(page_commands, out, stylesheet)
+                print(f"Saved page {page_index + 1} to {page_save_path}")
+            except Exception as e:
+                print(f"Error saving SVG page {page_index + 1}: {e}")
+
+        print("--- Pipa SVG Rendering Completed ---")
+        return save_dir
@@ -0,0 +1,57 @@
+from typing import Any, Dict, List, Tuple
+
+from ..config.layout_config import PipaLayoutConfig
+
+
+# --- 临时配置替代品 (同上，用于快速验证) ---
+TEMP_STYLES_MAP = {
+    "DOCUMENT_TITLE": {"font_size_key": "title_size", "color": "darkblue", "font_type": "title", "font_path_key": "text"},
+    "SECTION_TITLE":  {"font_size_key": "title_size", "color": "darkblue", "font_type": "title", "font_path_key": "text"},
+    "MODE":           {"font_size_key": "mode_size", "color": "gray", "font_type": "mode", "font_path_key": "text"},
+    "MAIN_CHAR":      {"font_size_key": "main_char_size", "color": "black", "font_type": "main_char", "font_path_key": "score"},
+    "SMALL_MODIFIER": {"font_size_key": "small_char_size", "color": "black", "font_type": "small_char", "font_path_key": "score"},
+    "TEXT_BLOCK":     {"font_size_key": "textunit_size", "color": "black", "font_type": "textunit", "font_path_key": "text"},
+    "DOT_MARKER":     {"font_size_key": "main_char_size", "color": "red", "font_type": "main_char", "font_path_key": "score"},
+    "CIRCLE_MARKER":  {"font_size_key": "main_char_size", "color": "red", "font_type": "main_char", "font_path_key": "score"},
+    "LINE_MARKER":    {"font_size_key": "small_char_size", "color": "red", "font_type": "small_char", "font_path_key": "score"},
+    "CHECK_MARKER":   {"font_size_key": "small_char_size", "color": "red", "font_type": "small_char", "font_path_key": "score"},
+    "BAI_MARKER":     {"font_size_key": "small_char_size", "color": "red", "font_type": "small_char", "font_path_key": "score"},
+}
+
+# 一条命令对应的单个字形：(字符, x, y)，坐标为 'ra' 锚点
+Glyph = Tuple[str, float, float]
+
+
+def resolve_style(styles: Dict[str, Dict[str, Any]], config: PipaLayoutConfig, cmd_type: str) -> Tuple[float, str, str]:
+    """根据命令类型查找 (字号, 字体类型, 颜色)。"""
+    style = styles.get(cmd_type, {})
+    size_key = style.get('font_size_key', 'main_char_size')
+    font_type = style.get('font_type', 'title')
+    color = style.get('color', 'black')
+
+    font_size = getattr(config, size_key, config.main_char_size)
+    return font_size, font_type, color
+
+
+def command_glyphs(command: Dict[str, Any]) -> List[Glyph]:
+    """
+    取出一条 Render Command 的字形列表。Layout Pass 已在 metadata["glyphs"] 中给出逐字定位，
+    所有后端 (Pillow / SVG / PDF) 共用这一份几何；没有该字段的命令按单个字形处理。
+    """
+    glyphs = command.get('metadata', {}).get('glyphs')
+    if glyphs is None:
+        pos = command['position']
+        return [(command.get('text', ''), pos[0], pos[1])]
+    return [(char, x, y) for char, x, y in glyphs]
+
+
+def score_folder_name(render_artifact: List[List[Dict[str, Any]]]) -> str:
+    """确定输出文件夹名称（使用第一页第一个命令的 text 值，并清理非法字符）。"""
+    first_command = render_artifact[0][0]
+    folder_name = first_command.get('text', 'untitled_score').strip()
+
+    # 清理文件夹名中的非法字符
+    folder_name = "".join(c for c in folder_name if c.isalnum() or c in (' ', '_')).rstrip()
+    if not folder_name:
+        folder_name = 'untitled_score'
+    return folder_name
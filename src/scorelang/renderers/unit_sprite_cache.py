@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from PIL import Image
+
+from .glyph_atlas import GlyphEntry
+
+
+# 一个单元内的字形：(字形, 相对单元锚点的整数 x, y)
+PlacedGlyph = Tuple[GlyphEntry, int, int]
+
+
+@dataclass
+class UnitSprite:
+    """
+    整个谱字单元 (主字 + 小字 + 引/火 + 百/乐/只等标记) 预先合成的 RGBA 贴图。
+    offset 是贴图左上角相对单元锚点 (主字位置) 的整数偏移。
+    """
+    image: Image.Image
+    offset: Tuple[int, int]
+    _by_mode: Dict[str, Tuple[Image.Image, Image.Image]] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_glyphs(cls, glyphs: List[PlacedGlyph]) -> "UnitSprite":
+        """把单元内的所有字形按绘制顺序合成到一张透明底的 RGBA 贴图上。"""
+        boxes = [
+            (x + g.offset[0], y + g.offset[1], x + g.offset[0] + g.mask.width, y + g.offset[1] + g.mask.height)
+            for g, x, y in glyphs
+        ]
+        left = min(b[0] for b in boxes)
+        top = min(b[1] for b in boxes)
+        right = max(b[2] for b in boxes)
+        bottom = max(b[3] for b in boxes)
+
+        sprite = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+        for (glyph, _, _), box in zip(glyphs, boxes):
+            # 纯色图层 + 字形遮罩作为 alpha，再用 over 运算叠加，保证与直接绘制到白底上的结果一致
+            layer = Image.new('RGBA', glyph.mask.size, glyph.ink_for('RGB') + (0,))
+            layer.putalpha(glyph.mask)
+            sprite.alpha_composite(layer, (box[0] - left, box[1] - top))
+        return cls(image=sprite, offset=(left, top))
+
+    def paste_onto(self, canvas: Image.Image, x: int, y: int):
+        """以 alpha 为遮罩把贴图盖到画布上，(x, y) 为单元锚点的整数坐标。"""
+        source = self._by_mode.get(canvas.mode)
+        if source is None:
+            source = (self.image.convert(canvas.mode), self.image.getchannel('A'))
+            self._by_mode[canvas.mode] = source
+        color, alpha = source
+        canvas.paste(color, (x + self.offset[0], y + self.offset[1]), alpha)
+
+
+class UnitSpriteCache:
+    """
+    谱字单元贴图缓存：按单元签名 (字形、字体、颜色、相对位置) 缓存合成后的贴图，LRU 淘汰。
+    重复度高的乐谱中，每个单元只需一次贴图操作。
+    """
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, UnitSprite]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_build(self, signature: Hashable, build: Callable[[], List[PlacedGlyph]]) -> UnitSprite:
+        """查找单元贴图，未命中时调用 build() 取得字形并合成。"""
+        with self._lock:
+            sprite = self._entries.get(signature)
+            if sprite is not None:
+                self._entries.move_to_end(signature)
+                return sprite
+
+        sprite = UnitSprite.from_glyphs(build())
+
+        with self._lock:
+            self._entries[signature] = sprite
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return sprite
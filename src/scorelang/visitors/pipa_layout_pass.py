@@ -1,5 +1,4 @@
 import logging
-import math
 from typing import Dict
 
 from ..visitors.base_visitor import BaseVisitor
@@ -48,33 +47,40 @@ class PipaLayoutPass(BaseVisitor):
 
         self.scoreunit_height = effective_y_height/ self.layout.UNIT_NUM
         self.scoreunit_counter: int = 0  # 计数当前列已排版的单元数量
+        self.unit_index: int = 0 # 全文档递增的谱字单元编号，写入命令 metadata 的 unit_id
         self.time_counter: int = 0 # 用于排版的时值计数器
         self.unit_temp_y = 0
 
-        #计算每列可容纳最大内容文本字数
-        self.text_column = effective_y_height - (2 * self.layout.main_char_space[1])
-        self.max_text_per_column = math.floor(self.text_column / self.layout.textunit_space[1])
-
         #上一个字是否是乐谱的标志位
         self._is_score_unit = False
 
         self.all_page_render_lists = [] # 存储所有页面的主列表
         self.current_page_render_list = [] # 存储当前页面的绘制指令
         self.page_number = 1
-        self.command = RenderListBuilder(self.current_page_render_list)
+        self.command = RenderListBuilder(self.current_page_render_list, self.layout)
 
         self.current_display_mode = None
 
+        # 流式导出时 page_sink 会在排版过程中直接渲染页面，需要提前拿到布局配置
+        self.context.layout_config = self.layout
+
         print("PipaLayoutPass initialized.")
 
+    def _emit_page(self, page_commands):
+        """完成一页：有 page_sink 时立即交出 (不在内存中累积)，否则加入总列表。"""
+        if self.context.page_sink is not None:
+            self.context.page_sink(page_commands)
+        else:
+            self.all_page_render_lists.append(page_commands)
+
     def _do_page_break(self):
         # 1. 结束当前页，将指令列表添加到总列表
-        self.all_page_render_lists.append(list(self.current_page_render_list))
+        self._emit_page(list(self.current_page_render_list))
 
         # 2. 准备新页
         self.page_number += 1
         self.current_page_render_list = []
-        self.command = RenderListBuilder(self.current_page_render_list)
+        self.command = RenderListBuilder(self.current_page_render_list, self.layout)
 
         # 3. 重置 X/Y 流控到新页的顶部和右侧
         self.current_x = self.page_dimensions[0] - self.margin['right']
@@ -131,7 +137,7 @@ class PipaLayoutPass(BaseVisitor):
 
         # 确保将最后一页的指令列表也添加到总列表
         if self.current_page_render_list:
-            self.all_page_render_lists.append(list(self.current_page_render_list))
+            self._emit_page(list(self.current_page_render_list))
 
         print("--- Layout Completed ---")
         print(self.all_page_render_lists)
@@ -214,6 +220,10 @@ class PipaLayoutPass(BaseVisitor):
         # 尺寸：基于时值或固定单元宽度计算，并更新 self.last_element_height
         unit_height = self.scoreunit_height
         
+        # 本单元的所有命令 (主字/小字/引火/拍子符号) 归入同一个 unit_id
+        self.unit_index += 1
+        self.command.begin_unit(self.unit_index)
+
         # 添加命令
         main_char_pos = (unit_x, self.current_y)
         self.command.add_main_char(text=node.main_score_character,position=main_char_pos)
@@ -246,6 +256,8 @@ class PipaLayoutPass(BaseVisitor):
         else:
             self.current_y = small_mod_y
 
+        self.command.end_unit()
+
         # 处理底部符号位置
 
 
@@ -265,14 +277,12 @@ class PipaLayoutPass(BaseVisitor):
             text_indentation = self.current_y
 
         
-        # 添加命令
+        # 添加命令：换列由 RenderListBuilder 计算，这里按实际占用的列数向左推进
         text_pos = (self.current_x, text_indentation)
-        self.command.add_text_block(text=node.text,position=text_pos)
+        glyphs = self.command.add_text_block(text=node.text,position=text_pos)
 
-        total_texts = len(node.text)
-        total_columns = math.ceil(total_texts / self.max_text_per_column)
-        dimensions = (total_columns * self.layout.textunit_space[0], self.text_column)
-        self.current_x -= dimensions[0]
+        total_columns = len({x for _, x, _ in glyphs})
+        self.current_x -= total_columns * self.layout.textunit_space[0]
         return
     
  
@@ -1,4 +1,7 @@
-from typing import Literal, Optional, Tuple, Dict, Any, Union
+import math
+from typing import List, Literal, Optional, Tuple, Dict, Any, Union
+
+from ...config.layout_config import PipaLayoutConfig
 
 
 # 文本类渲染类型
@@ -31,6 +34,9 @@ Text_Map: Dict[MarkerType, str] = {
 # 所有渲染类型（联合类型）
 RenderType = Union[TextType, MarkerType]
 
+# 排版后的单个字形：[字符, x, y]，坐标为 'ra' 锚点 (列表形式，便于 JSON 序列化)
+Glyph = List[Any]
+
 # 避免循环引用，如果需要 PipaLayoutPass 实例的类型提示
 # if TYPE_CHECKING:
 #     from visitors.pipa_layout_pass import PipaLayoutPass 
@@ -44,10 +50,83 @@ class RenderListBuilder:
     负责封装所有 Render Command 生成逻辑的构建器类。
     它持有一个对 Layout Pass 实例的引用，以写入指令。
     """
-    def __init__(self, render_list):
+    def __init__(self, render_list, layout: Optional[PipaLayoutConfig] = None):
         """初始化时，保存对 Layout Pass 的引用，并直接访问指令列表。"""
         # 保存对指令列表的引用
         self._target_list = render_list
+        # 布局配置：用于把多字命令 (标题/调式/文本块) 展开为逐字定位的字形
+        self._layout = layout if layout is not None else PipaLayoutConfig()
+        # 当前所属的谱字单元编号 (None 表示不在单元内)
+        self._unit_id: Optional[int] = None
+
+    # --- 谱字单元分组 ---
+
+    def begin_unit(self, unit_id: int):
+        """开始一个谱字单元：之后的命令都会在 metadata 中带上 unit_id，供 Renderer 按单元分组。"""
+        self._unit_id = unit_id
+
+    def end_unit(self):
+        """结束当前谱字单元。"""
+        self._unit_id = None
+
+    # --- 字形展开 ---
+    # 多字命令 (标题/调式/文本块) 在 metadata["glyphs"] 中带上逐字定位的结果，
+    # Renderer (Pillow / SVG / PDF) 只需逐个绘制，Layout Pass 也按它推进列位置，换列只在这里计算一次；
+    # 单字命令的字形就是 (text, position)，不重复写入
+
+    def _vertical_glyphs(self, text: str, position: Tuple[float, float], y_space: float) -> List[Glyph]:
+        """将字符串中的每个字符从上到下逐个排列（用于标题/调式）。"""
+        x, y = position[0], position[1]
+        glyphs = []
+        for char in text:
+            glyphs.append([char, x, y])
+            # 更新 Y 轴：向下移动一个字符的 Y 空间
+            y += y_space
+        return glyphs
+
+    def _text_block_glyphs(self, text: str, position: Tuple[float, float]) -> List[Glyph]:
+        """排列具有换行特性的竖排注释文本块：写满一列 (到下边距为止) 后向左换列。"""
+        if not text: return []
+
+        start_x, start_y = position[0], position[1]
+        x_space, y_space = self._layout.textunit_space
+
+        available_height = self._layout.page_dimensions[1] - start_y - self._layout.margin["bottom"]
+        if available_height <= 0:
+            print("Warning: Not enough vertical space for text block.")
+            return []
+
+        # 计算每列最大字符数
+        max_chars_per_col = math.floor(available_height / y_space)
+        if max_chars_per_col <= 0:
+            print("Warning: Max chars per column is zero, skipping text block.")
+            return []
+
+        glyphs = []
+        current_x, current_y = start_x, start_y
+        char_count = 0
+        for char in text:
+            glyphs.append([char, current_x, current_y])
+
+            char_count += 1
+            current_y += y_space
+
+            # 检查是否达到列最大字符数
+            if char_count >= max_chars_per_col:
+                current_x -= x_space # 换列：X 坐标向左移动
+                current_y = start_y  # Y 坐标回到初始位置
+                char_count = 0
+        return glyphs
+
+    def _layout_glyphs(self, type: RenderType, position: Tuple[float, float], text: str) -> List[Glyph]:
+        """根据命令类型把 text 展开为字形列表；单字命令就是其本身。"""
+        if type == "TEXT_BLOCK":
+            return self._text_block_glyphs(text, position)
+        if type in ("DOCUMENT_TITLE", "SECTION_TITLE"):
+            return self._vertical_glyphs(text, position, self._layout.title_space[1])
+        if type == "MODE":
+            return self._vertical_glyphs(text, position, self._layout.mode_space[1])
+        return [[text, position[0], position[1]]]
 
     # --- A. 底层私有封装方法 (不包含 dimension) ---
 
@@ -57,17 +136,27 @@ class RenderListBuilder:
         position: Tuple[float, float],
         text: str = "",
         metadata: Optional[Dict[str, Any]] = None
-    ):
-        """将数据打包成 Render Command 字典并加入到目标列表。"""
+    ) -> List[Glyph]:
+        """将数据打包成 Render Command 字典并加入到目标列表，返回命令展开后的字形。"""
+        metadata = dict(metadata) if metadata else {}
+        if self._unit_id is not None:
+            metadata.setdefault("unit_id", self._unit_id)
+        glyphs = metadata.get("glyphs")
+        if glyphs is None:
+            glyphs = self._layout_glyphs(type, position, text)
+            if glyphs != [[text, position[0], position[1]]]:
+                metadata["glyphs"] = glyphs
+
         command = {
             "type": type,
             "position": list(position),
             "text": text,
             # 根据您的要求，不包含 dimension 字段
-            "metadata": metadata if metadata else {}
+            "metadata": metadata
         }
         
         self._target_list.append(command) # 直接写入目标列表
+        return glyphs
 
 
     # --- B. 对外公共语义API ---
@@ -135,10 +224,9 @@ class RenderListBuilder:
         text: str,
         position: Tuple[float, float], 
         metadata: Optional[Dict[str, Any]] = None
-    ):
-        """添加多行文本块命令 (type="TEXT_BLOCK")。"""
-        # metadata 通常需要包含 chars_per_column 等分列规则
-        self._add_raw_command(
+    ) -> List[Glyph]:
+        """添加多行文本块命令 (type="TEXT_BLOCK")，返回换列后的字形 (Layout Pass 据此推进 X)。"""
+        return self._add_raw_command(
             type="TEXT_BLOCK",
             position=position,
             text=text,
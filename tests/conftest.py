@@ -0,0 +1,71 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# 从任意目录运行 pytest 时都以项目根目录导入 src
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.scorelang.config.layout_config import PipaLayoutConfig  # noqa: E402
+
+
+# README 中的示例乐谱：覆盖标题、调式、元信息、插入文本、乐段和各类修饰符
+SAMPLE_SCORE = """# 乐谱数字化小测试
+@沙陀调
+% 来源：三五要录
+% 录入：冯氏羊肉馆
+=这里写插入文本，这一段文字足够长，会在排版时换列
+
+## 第一段
+@黄钟调
+{一/py}
+{二/py/pz}
+{三/py}
+{四/py/pz}
+{五/b}
+{六/py/pz}
+{七/py}
+{八/py/pz}
+{九/py}
+{十/py/pz}
+{丁/py/r}
+{引/b}
+
+## 修饰符号展示
+{一/py/h}
+{二/hh}
+{乙/ls/py}
+{三/le/pz}
+{四/f/py}
+{六/y/b/pz}
+{七（三七）/py}
+{卜（八）/h/py}
+{八/hh/pz}
+{十/r}
+"""
+
+
+def fonts_available() -> bool:
+    config = PipaLayoutConfig()
+    return all(os.path.exists(config.get_font_path(font_type)) for font_type in ("main_char", "text"))
+
+
+# 字体文件不随仓库分发 (data/fonts)，需要真实光栅化的测试在缺少字体时跳过
+requires_fonts = pytest.mark.skipif(not fonts_available(), reason="data/fonts/pipa.ttf and text.ttf are not installed")
+
+
+@pytest.fixture
+def compile_score():
+    """编译乐谱文本 (不使用编译缓存)，返回 PipelineContext。"""
+    from src.backend.app.services import ScoreService
+    from src.scorelang.core.pipeline_context import PipelineContext
+
+    def compile_text(text: str = SAMPLE_SCORE) -> PipelineContext:
+        context = PipelineContext()
+        context.set_raw_text(text)
+        return ScoreService(compile_cache=None).process_score(context, "pipa")
+
+    return compile_text
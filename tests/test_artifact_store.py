@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from src.backend.app.artifact_store import (
+    DEFAULT_ARTIFACT_STORE_DIR, GC_LOCK_NAME, GC_LOCK_STALE_SECONDS, TEMP_PREFIX, ArtifactStore
+)
+
+
+def _files(root):
+    return sorted(
+        os.path.relpath(os.path.join(dirpath, name), root)
+        for dirpath, _, names in os.walk(root) for name in names
+    )
+
+
+def _age(path, seconds):
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_default_dir_is_resolved_under_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = ArtifactStore()
+    monkeypatch.chdir(tmp_path.parent)
+
+    assert store.root == tmp_path / DEFAULT_ARTIFACT_STORE_DIR
+    assert store.root == tmp_path / "data" / ".cache"
+
+
+def test_round_trip(tmp_path):
+    store = ArtifactStore(tmp_path)
+    store.put_bytes("pass", "abcd", b"payload")
+    store.flush()
+
+    assert store.get_bytes("pass", "abcd") == b"payload"
+    assert store.get_bytes("pass", "abce") is None
+    assert _files(tmp_path) == [os.path.join("pass", "ab", "abcd.pkl")]
+
+
+def test_failed_write_leaves_no_entry_or_temp_file(tmp_path, monkeypatch):
+    store = ArtifactStore(tmp_path, write_behind=False)
+
+    def fail_replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", fail_replace)
+    store.put_bytes("pass", "abcd", b"payload")
+
+    assert store.get_bytes("pass", "abcd") is None
+    assert _files(tmp_path) == []
+
+    # 编码失败时连临时文件都不会创建
+    monkeypatch.undo()
+    store.put_image("pages", "abcd", None)
+    assert _files(tmp_path) == []
+
+
+def test_leftover_temp_files_are_never_read_and_collected_when_stale(tmp_path):
+    store = ArtifactStore(tmp_path, write_behind=False)
+    entry_dir = tmp_path / "pass" / "ab"
+    entry_dir.mkdir(parents=True)
+    stale = entry_dir / f"{TEMP_PREFIX}stale"
+    fresh = entry_dir / f"{TEMP_PREFIX}fresh"
+    stale.write_bytes(b"half")
+    fresh.write_bytes(b"half")
+    _age(stale, GC_LOCK_STALE_SECONDS * 2)
+
+    assert store.get_bytes("pass", "abcd") is None
+    store.gc()
+    # 仍在写入中的临时文件保留
+    assert not stale.exists()
+    assert fresh.exists()
+
+
+def test_gc_removes_least_recently_used_down_to_low_water(tmp_path):
+    store = ArtifactStore(tmp_path, write_behind=False)
+    keys = [f"{i:02d}key" for i in range(8)]
+    for age, key in zip(range(len(keys), 0, -1), keys):
+        store.put_bytes("pass", key, b"x" * 200)
+        _age(store._path("pass", key, ".pkl"), age * 10)
+    # 读取会刷新修改时间：最旧的条目变成最近使用的
+    assert store.get_bytes("pass", keys[0]) is not None
+
+    store.max_bytes = 1000
+    removed = store.gc()
+
+    remaining = [key for key in keys if store.get_bytes("pass", key) is not None]
+    assert removed == 200 * (len(keys) - len(remaining))
+    assert 200 * len(remaining) <= 800
+    assert remaining == [keys[0]] + keys[-3:]
+
+
+def test_gc_skips_while_another_process_holds_the_lock(tmp_path):
+    store = ArtifactStore(tmp_path, max_bytes=100, write_behind=False)
+    lock_path = tmp_path / GC_LOCK_NAME
+    lock_path.write_bytes(b"")
+    store.put_bytes("pass", "abcd", b"x" * 200)
+
+    assert store.gc() == 0
+    assert store.get_bytes("pass", "abcd") is not None
+
+    # 持锁进程已退出：过期的锁被清除，下一次回收正常进行
+    _age(lock_path, GC_LOCK_STALE_SECONDS * 2)
+    assert store.gc() == 0
+    assert not lock_path.exists()
+    assert store.gc() == 200
+    assert _files(tmp_path) == []
+
+
+@pytest.mark.parametrize("write_behind", [True, False])
+def test_existing_entry_is_not_rewritten(tmp_path, write_behind):
+    store = ArtifactStore(tmp_path, write_behind=write_behind)
+    store.put_bytes("pass", "abcd", b"first")
+    store.flush()
+    store.put_bytes("pass", "abcd", b"second")
+    store.flush()
+
+    assert store.get_bytes("pass", "abcd") == b"first"
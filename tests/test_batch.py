@@ -0,0 +1,66 @@
+from src.backend.app.batch import main
+
+from tests.conftest import SAMPLE_SCORE, requires_fonts
+
+
+# 解析失败的乐谱
+BROKEN_SCORE = "{一/zzz"
+
+
+def _write(path, text=SAMPLE_SCORE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def _run(input_dir, out, *options):
+    return main([str(input_dir), "--out", str(out), "--workers", "1", "--no-cache", *options])
+
+
+def test_exit_code_2_when_no_files_match(tmp_path):
+    (tmp_path / "scores").mkdir()
+    assert _run(tmp_path / "scores", tmp_path / "out", "--formats", "json") == 2
+
+
+def test_exit_code_0_and_json_keeps_relative_paths(tmp_path):
+    scores = tmp_path / "scores"
+    _write(scores / "a" / "piece.score")
+    _write(scores / "b" / "piece.score")
+
+    assert _run(scores, tmp_path / "out", "--formats", "json") == 0
+    assert (tmp_path / "out" / "a" / "piece.json").is_file()
+    assert (tmp_path / "out" / "b" / "piece.json").is_file()
+
+
+def test_exit_code_1_when_a_file_fails(tmp_path):
+    scores = tmp_path / "scores"
+    _write(scores / "good.score")
+    _write(scores / "broken.score", BROKEN_SCORE)
+
+    assert _run(scores, tmp_path / "out", "--formats", "json") == 1
+    assert (tmp_path / "out" / "good.json").is_file()
+    assert not (tmp_path / "out" / "broken.json").exists()
+
+
+def test_exit_code_1_on_output_collision(tmp_path):
+    scores = tmp_path / "scores"
+    _write(scores / "piece.score")
+    _write(scores / "piece.txt")
+
+    assert _run(scores, tmp_path / "out", "--formats", "json", "--pattern", "*") == 1
+    # 冲突在编译前检测，不写出任何结果
+    assert not (tmp_path / "out").exists()
+
+
+@requires_fonts
+def test_same_title_scores_do_not_overwrite_each_other(tmp_path):
+    scores = tmp_path / "scores"
+    # 三个文件的乐谱标题相同
+    _write(scores / "one.score")
+    _write(scores / "two.score")
+    _write(scores / "sub" / "one.score")
+
+    out = tmp_path / "out"
+    assert _run(scores, out, "--formats", "image,json") == 0
+    for name in ("one", "two", "sub/one"):
+        assert (out / name / "page_001.png").is_file()
+        assert (out / f"{name}.json").is_file()
@@ -0,0 +1,108 @@
+from PIL import Image
+
+from src.backend.app.compile_cache import STAGE_PAGES, STAGE_PASS, CompileCache, preview_compile_cache
+from src.backend.app.services import ScoreService
+from src.scorelang.core.pipeline_context import PipelineContext
+from src.scorelang.core.visitor_manager import VisitorManager
+
+from tests.conftest import SAMPLE_SCORE
+
+
+def _compile(cache, text=SAMPLE_SCORE):
+    context = PipelineContext()
+    context.set_raw_text(text)
+    return ScoreService(compile_cache=cache).process_score(context, "pipa")
+
+
+def _count_passes(monkeypatch):
+    ran = []
+    run_pass = VisitorManager.run_pass
+
+    def counting_run_pass(context, visitor_path):
+        ran.append(visitor_path)
+        return run_pass(context, visitor_path)
+    monkeypatch.setattr(VisitorManager, "run_pass", staticmethod(counting_run_pass))
+    return ran
+
+
+def test_evicts_least_recently_used_entries_by_size():
+    cache = CompileCache(max_bytes=300)
+    for key in ("a", "b", "c"):
+        cache.put(STAGE_PASS, key, b"x" * 80)
+    # 读取 a 之后，最久未使用的是 b
+    assert cache.get(STAGE_PASS, "a") is not None
+    cache.put(STAGE_PASS, "d", b"x" * 80)
+
+    assert cache.get(STAGE_PASS, "b") is None
+    assert all(cache.get(STAGE_PASS, key) is not None for key in ("a", "c", "d"))
+    assert cache.size_bytes <= cache.max_bytes
+
+    # 比整个容量还大的条目不保存，也不挤掉已有条目
+    cache.put(STAGE_PASS, "huge", b"x" * 1000)
+    assert cache.get(STAGE_PASS, "huge") is None
+    assert len(cache) == 3
+
+
+def test_returns_copies():
+    cache = CompileCache()
+    cache.put(STAGE_PASS, "key", {"values": [1, 2]})
+    cache.get(STAGE_PASS, "key")["values"].append(3)
+    assert cache.get(STAGE_PASS, "key") == {"values": [1, 2]}
+
+    cache.put_image("page", Image.new("L", (4, 4), 255))
+    cache.get_image("page").putpixel((0, 0), 0)
+    assert cache.get_image("page").getpixel((0, 0)) == 255
+
+
+def test_preview_cache_keeps_no_pages():
+    cache = preview_compile_cache(max_bytes=1024 * 1024)
+    cache.put_image("page", Image.new("L", (4, 4), 255))
+    cache.put(STAGE_PASS, "key", "value")
+
+    assert cache.get_image("page") is None
+    assert cache.get(STAGE_PASS, "key") == "value"
+    assert STAGE_PAGES not in cache.stats()
+    assert cache.store is None
+
+
+def test_default_cache_stays_in_memory():
+    assert ScoreService().compile_cache.store is None
+
+
+def test_hit_skips_every_pass(monkeypatch):
+    cache = CompileCache()
+    expected = _compile(cache).render_artifact
+
+    ran = _count_passes(monkeypatch)
+    context = _compile(cache)
+
+    assert ran == []
+    assert context.render_artifact == expected
+
+
+def test_resumes_after_last_cached_pass(monkeypatch):
+    cache = CompileCache()
+    expected = _compile(None).render_artifact
+    _compile(cache)
+    visitor_paths = VisitorManager.visitor_paths("pipa")
+
+    # 丢掉最后一个 Pass 的结果：从倒数第二个 Pass 的快照恢复，只重新运行最后一个 Pass
+    last_pass = [key for stage, key in cache._entries if stage == STAGE_PASS][-1]
+    del cache._entries[(STAGE_PASS, last_pass)]
+
+    ran = _count_passes(monkeypatch)
+    context = _compile(cache)
+
+    assert ran == visitor_paths[-1:]
+    assert context.render_artifact == expected
+
+
+def test_fingerprint_covers_pipeline_source(monkeypatch):
+    from src.backend.app import compile_cache
+    from src.scorelang.core import source_digest
+
+    fingerprint = compile_cache.config_fingerprint("pipa")
+    assert compile_cache.config_fingerprint("pipa") == fingerprint
+
+    monkeypatch.setattr(source_digest, "source_digest", lambda *dirs: "edited")
+    assert compile_cache.config_fingerprint("pipa") != fingerprint
@@ -0,0 +1,108 @@
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from src.scorelang.renderers.glyph_atlas import GlyphAtlas
+from src.scorelang.renderers.pipa_image_renderer import PipaImageRenderer, to_canvas
+from src.scorelang.renderers.render_utils import command_glyphs
+from src.scorelang.renderers.unit_sprite_cache import UnitSprite
+
+from tests.conftest import requires_fonts
+
+
+@pytest.fixture(scope="module")
+def font():
+    # Pillow 自带的 FreeType 字体，不依赖 data/fonts
+    return ImageFont.load_default(size=37)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+@pytest.mark.parametrize("color", ["black", "red", "#4060a0"])
+@pytest.mark.parametrize("position", [(100, 100), (57, 203), (0, 5)])
+def test_atlas_paste_matches_draw_text(font, mode, color, position):
+    atlas = GlyphAtlas()
+    for text in ("A", "g", "W", "%"):
+        expected = Image.new(mode, (300, 300), "white")
+        ImageDraw.Draw(expected).text(position, text, fill=color, font=font, anchor="ra")
+
+        actual = Image.new(mode, (300, 300), "white")
+        atlas.get(text, "test", 37, color, "ra", font).paste_onto(actual, *position)
+
+        assert actual.tobytes() == expected.tobytes(), (text, position)
+
+
+def test_to_canvas_rounds_to_nearest_pixel():
+    assert to_canvas(100.5, 1.0) == 101
+    assert to_canvas(100.49, 1.0) == 100
+    assert to_canvas(201, 0.5) == 101
+    assert to_canvas(200.7, 0.37) == 74
+    assert isinstance(to_canvas(3, 1.0), int)
+
+
+def test_unit_sprite_matches_drawing_each_glyph(font):
+    atlas = GlyphAtlas()
+    small = ImageFont.load_default(size=17)
+    placed = [
+        (atlas.get("A", "main", 37, "black", "ra", font), 0, 0),
+        (atlas.get("b", "small", 17, "red", "ra", small), -30, 12),
+        (atlas.get(".", "main", 37, "black", "ra", font), 8, 30),
+    ]
+    anchor = (150, 120)
+
+    expected = Image.new("RGB", (300, 300), "white")
+    draw = ImageDraw.Draw(expected)
+    for (glyph, dx, dy), (text, glyph_font, color) in zip(placed, [("A", font, "black"), ("b", small, "red"), (".", font, "black")]):
+        draw.text((anchor[0] + dx, anchor[1] + dy), text, fill=color, font=glyph_font, anchor="ra")
+
+    actual = Image.new("RGB", (300, 300), "white")
+    UnitSprite.from_glyphs(placed).paste_onto(actual, *anchor)
+
+    assert actual.tobytes() == expected.tobytes()
+
+
+def _reference_page(renderer: PipaImageRenderer, page_commands) -> Image.Image:
+    """逐字调用 ImageDraw.text 绘制的参考页面 (与渲染器相同的取整方式)。"""
+    canvas = Image.new("RGB", (renderer.page_width, renderer.page_height), "white")
+    draw = ImageDraw.Draw(canvas)
+    for command in page_commands:
+        font_size, font_type, color = renderer._resolve_style(command["type"])
+        font = renderer._get_font(font_size * renderer.scale, font_type)
+        for char, x, y in command_glyphs(command):
+            position = (to_canvas(x, renderer.scale), to_canvas(y, renderer.scale))
+            draw.text(position, char, fill=color, font=font, anchor="ra")
+    return canvas
+
+
+@requires_fonts
+@pytest.mark.parametrize("scale", [1.0, 0.5, 0.37])
+@pytest.mark.parametrize("options", [
+    {"batch_draw": False},
+    {"batch_draw": True},
+    {"use_unit_sprites": True},
+])
+def test_renderer_matches_draw_text(compile_score, scale, options):
+    context = compile_score()
+    renderer = PipaImageRenderer(context, glyph_atlas=GlyphAtlas(), scale=scale, **options)
+    page_commands = context.render_artifact["png"][0]
+
+    actual = renderer.render_page(page_commands)
+    expected = _reference_page(renderer, page_commands)
+
+    assert actual.tobytes() == expected.tobytes()
+
+
+@requires_fonts
+@pytest.mark.parametrize("output_profile", ["rgb", "gray", "palette"])
+@pytest.mark.parametrize("batch_draw", [False, True])
+def test_numpy_compositor_matches_pillow(compile_score, output_profile, batch_draw):
+    pytest.importorskip("numpy")
+    context = compile_score()
+    page_commands = context.render_artifact["png"][0]
+    options = {"glyph_atlas": GlyphAtlas(), "output_profile": output_profile, "batch_draw": batch_draw, "scale": 0.5}
+
+    expected = PipaImageRenderer(context, **options).render_page(page_commands)
+    actual = PipaImageRenderer(context, compositor="numpy", **options).render_page(page_commands)
+
+    assert actual.mode == expected.mode
+    assert actual.tobytes() == expected.tobytes()
+    if output_profile == "palette":
+        assert actual.getpalette() == expected.getpalette()
@@ -0,0 +1,93 @@
+import copy
+import os
+
+from src.scorelang.renderers.pipa_image_renderer import PAGE_MANIFEST_NAME, PipaImageRenderer
+
+from tests.conftest import SAMPLE_SCORE, requires_fonts
+
+
+# 足够排成多页的乐谱
+LONG_SCORE = SAMPLE_SCORE + "\n## 第三段\n" + "\n".join("{一/py}\n{二/pz}\n{三（七）/b}" for _ in range(120))
+
+
+def _page_files(save_dir):
+    return {
+        name: os.stat(os.path.join(save_dir, name)).st_mtime_ns
+        for name in os.listdir(save_dir) if name.startswith("page_")
+    }
+
+
+def _main_char_index(page_commands):
+    return next(i for i, command in enumerate(page_commands) if command["type"] == "MAIN_CHAR")
+
+
+def test_page_digest_ignores_unit_id(compile_score):
+    page = compile_score().render_artifact["png"][0]
+    renumbered = copy.deepcopy(page)
+    for command in renumbered:
+        if "unit_id" in command.get("metadata", {}):
+            command["metadata"]["unit_id"] += 1000
+
+    assert PipaImageRenderer._page_digest(page, "style") == PipaImageRenderer._page_digest(renumbered, "style")
+
+
+def test_page_digest_changes_with_content_and_style(compile_score):
+    page = compile_score().render_artifact["png"][0]
+    digest = PipaImageRenderer._page_digest(page, "style")
+
+    moved = copy.deepcopy(page)
+    moved[_main_char_index(moved)]["position"][1] += 1
+    retexted = copy.deepcopy(page)
+    retexted[_main_char_index(retexted)]["text"] = "九"
+
+    assert PipaImageRenderer._page_digest(moved, "style") != digest
+    assert PipaImageRenderer._page_digest(retexted, "style") != digest
+    assert PipaImageRenderer._page_digest(page, "other style") != digest
+
+
+def test_style_fingerprint_covers_scale_and_profile(compile_score):
+    context = compile_score()
+    base = PipaImageRenderer(context)._style_fingerprint()
+
+    assert PipaImageRenderer(context, scale=0.5)._style_fingerprint() != base
+    assert PipaImageRenderer(context, output_profile="gray")._style_fingerprint() != base
+    assert PipaImageRenderer(context)._style_fingerprint() == base
+
+
+@requires_fonts
+def test_render_rewrites_only_changed_pages(compile_score, tmp_path):
+    context = compile_score(LONG_SCORE)
+    artifact = context.render_artifact["png"]
+    assert len(artifact) >= 3
+
+    save_dir = PipaImageRenderer(context, encode_workers=0).render(str(tmp_path))
+    first = _page_files(save_dir)
+    assert len(first) == len(artifact)
+    assert os.path.exists(os.path.join(save_dir, PAGE_MANIFEST_NAME))
+
+    # 内容不变：没有页面被重写
+    PipaImageRenderer(context, encode_workers=0).render(str(tmp_path))
+    assert _page_files(save_dir) == first
+
+    # 只改第二页的一个谱字：只有 page_002.png 被重写
+    second_page = artifact[1]
+    second_page[_main_char_index(second_page)]["text"] = "九"
+    PipaImageRenderer(context, encode_workers=0).render(str(tmp_path))
+    after = _page_files(save_dir)
+    assert {name for name in first if after[name] != first[name]} == {"page_002.png"}
+
+    # 乐谱变短：多余的旧页面被删除
+    del artifact[2:]
+    PipaImageRenderer(context, encode_workers=0).render(str(tmp_path))
+    assert sorted(_page_files(save_dir)) == ["page_001.png", "page_002.png"]
+
+
+@requires_fonts
+def test_render_without_page_cache_rewrites_every_page(compile_score, tmp_path):
+    context = compile_score()
+    save_dir = PipaImageRenderer(context, encode_workers=0, use_page_cache=False).render(str(tmp_path))
+    first = _page_files(save_dir)
+
+    PipaImageRenderer(context, encode_workers=0, use_page_cache=False).render(str(tmp_path))
+    after = _page_files(save_dir)
+    assert all(after[name] != first[name] for name in first)
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from PIL import Image
+
+from src.backend.app.services import ScoreService
+from src.scorelang.core.pipeline_context import PipelineContext
+from src.scorelang.renderers.pdf_writer import StreamingPdfWriter
+
+from tests.conftest import SAMPLE_SCORE, requires_fonts
+
+
+def _leftovers(directory):
+    return [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+
+def test_writer_finalizes_on_success(tmp_path):
+    pdf_path = tmp_path / "score.pdf"
+    with StreamingPdfWriter(str(pdf_path)) as writer:
+        writer.add_image_page(Image.new("RGB", (40, 60), "white"))
+        writer.add_image_page(Image.new("L", (40, 60), "white"))
+        assert not pdf_path.exists()
+
+    data = pdf_path.read_bytes()
+    assert data.startswith(b"%PDF-1.4")
+    assert data.rstrip().endswith(b"%%EOF")
+    assert b"/Count 2" in data
+    assert _leftovers(tmp_path) == []
+
+
+def test_writer_discards_partial_file_on_error(tmp_path):
+    pdf_path = tmp_path / "score.pdf"
+    pdf_path.write_bytes(b"previous export")
+
+    with pytest.raises(ValueError, match="layout failed"):
+        with StreamingPdfWriter(str(pdf_path)) as writer:
+            writer.add_image_page(Image.new("RGB", (40, 60), "white"))
+            raise ValueError("layout failed")
+
+    assert pdf_path.read_bytes() == b"previous export"
+    assert _leftovers(tmp_path) == []
+
+
+def test_export_pdf_reports_pipeline_error(tmp_path):
+    pdf_path = tmp_path / "broken.pdf"
+    context = PipelineContext()
+    context.set_raw_text("{")
+
+    with pytest.raises(RuntimeError, match="Parsing failed"):
+        ScoreService(compile_cache=None).export_pdf(context, "pipa", str(pdf_path))
+
+    assert not pdf_path.exists()
+    assert _leftovers(tmp_path) == []
+
+
+@requires_fonts
+def test_export_pdf_writes_every_page(tmp_path):
+    pdf_path = tmp_path / "score.pdf"
+    context = PipelineContext()
+    context.set_raw_text(SAMPLE_SCORE)
+
+    ScoreService(compile_cache=None).export_pdf(context, "pipa", str(pdf_path), dpi=72)
+
+    assert b"/Count 1" in pdf_path.read_bytes()
+    assert _leftovers(tmp_path) == []
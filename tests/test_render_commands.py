@@ -0,0 +1,54 @@
+from src.scorelang.config.layout_config import PipaLayoutConfig
+from src.scorelang.renderers.render_utils import command_glyphs
+from src.scorelang.visitors.utils.render_commands import RenderListBuilder
+
+
+def test_single_glyph_commands_carry_no_glyph_runs():
+    commands = []
+    builder = RenderListBuilder(commands)
+    builder.add_main_char("一", (100, 200))
+    builder.add_dot_marker((120, 220))
+    builder.add_section_title("一", (300, 60))
+
+    assert all("glyphs" not in command["metadata"] for command in commands)
+    assert command_glyphs(commands[0]) == [("一", 100, 200)]
+
+
+def test_multi_glyph_commands_carry_glyph_runs():
+    layout = PipaLayoutConfig()
+    commands = []
+    builder = RenderListBuilder(commands, layout)
+    builder.add_document_title("最凉州", (2100, 60))
+
+    assert commands[0]["metadata"]["glyphs"] == [
+        ["最", 2100, 60],
+        ["凉", 2100, 60 + layout.title_space[1]],
+        ["州", 2100, 60 + 2 * layout.title_space[1]],
+    ]
+
+
+def test_text_block_wraps_at_bottom_margin():
+    layout = PipaLayoutConfig()
+    builder = RenderListBuilder([], layout)
+    start_y = layout.margin["top"]
+    per_column = int((layout.page_dimensions[1] - start_y - layout.margin["bottom"]) // layout.textunit_space[1])
+
+    glyphs = builder.add_text_block("文" * (per_column + 1), (1000, start_y))
+
+    assert len({x for _, x, _ in glyphs}) == 2
+    assert glyphs[per_column] == ["文", 1000 - layout.textunit_space[0], start_y]
+
+
+def test_layout_advances_past_every_text_block_column(compile_score):
+    layout = PipaLayoutConfig()
+    # 页首之后缩进的文本块每列放不下 29 个字，会换到第二列
+    for length in (29, 57, 200):
+        page = compile_score(f"# 标题\n@沙陀调\n={'长' * length}\n## 第一段\n{{一}}\n").render_artifact["png"][0]
+
+        block = next(command for command in page if command["type"] == "TEXT_BLOCK")
+        columns = sorted({x for _, x, _ in command_glyphs(block)})
+        following = page[page.index(block) + 1]
+
+        assert len(columns) > 1
+        # 文本块之后的内容从最后一列左边一列开始，不与文本重叠
+        assert following["position"][0] == columns[0] - layout.textunit_space[0], length
@@ -0,0 +1,28 @@
+import copy
+
+from src.scorelang.renderers.pipa_image_renderer import PipaImageRenderer
+
+from tests.conftest import requires_fonts
+from tests.test_page_cache import LONG_SCORE
+
+
+@requires_fonts
+def test_render_pages_diff_copies_only_repainted_pages(compile_score):
+    context = compile_score(LONG_SCORE)
+    renderer = PipaImageRenderer(context, scale=0.5)
+    previous_artifact = copy.deepcopy(context.render_artifact["png"])
+    previous_pages = renderer.render_pages()
+    previous_bytes = [page.tobytes() for page in previous_pages]
+
+    # 只改第二页的一个谱字
+    second_page = context.render_artifact["png"][1]
+    next(command for command in second_page if command["type"] == "MAIN_CHAR")["text"] = "九"
+    results = renderer.render_pages_diff(previous_artifact, previous_pages, in_place=False)
+
+    # 基准页面保持不变；没有变化的页面原样复用，只有第二页是新的副本
+    assert [page.tobytes() for page in previous_pages] == previous_bytes
+    assert [page is previous for (page, _), previous in zip(results, previous_pages)] == [
+        index != 1 for index in range(len(previous_pages))
+    ]
+    assert results[1][1] and not results[0][1]
+    assert results[1][0].tobytes() == PipaImageRenderer(context, scale=0.5).render_page(second_page, 1).tobytes()
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.backend.api import main as render_server
+from src.backend.api.main import HttpError, RenderServer
+
+
+class FakeRenderJob:
+    """代替工作进程中的 render_job：记录调用，并在 release 之前一直阻塞。"""
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, text, output_format, scale, score_type="pipa"):
+        self.calls.append((text, output_format, scale))
+        self.release.wait(10)
+        return [f"{text}@{scale}".encode("utf-8")]
+
+
+@pytest.fixture
+def fake_render_job(monkeypatch):
+    job = FakeRenderJob()
+    monkeypatch.setattr(render_server, "render_job", job)
+    yield job
+    job.release.set()
+
+
+def _start(server):
+    """与 RenderServer.start 相同，但用线程池代替进程池。"""
+    server.executor = ThreadPoolExecutor(max_workers=server.workers)
+    server._dispatchers = [asyncio.create_task(server._dispatch()) for _ in range(server.workers)]
+
+
+async def _wait_for(predicate):
+    for _ in range(500):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def _post(server, text, scale=1):
+    return asyncio.create_task(server.dispatch("POST", f"/render?format=png&scale={scale}", text.encode("utf-8")))
+
+
+def test_identical_requests_share_one_render(fake_render_job):
+    async def scenario():
+        server = RenderServer(workers=2, max_queue=4)
+        _start(server)
+        try:
+            same = [_post(server, "score") for _ in range(3)]
+            other = _post(server, "score", scale=0.5)
+            await _wait_for(lambda: len(fake_render_job.calls) == 2)
+            fake_render_job.release.set()
+            responses = await asyncio.gather(*same, other)
+        finally:
+            await server.close()
+        return server, responses
+
+    server, responses = asyncio.run(scenario())
+
+    assert sorted(fake_render_job.calls) == [("score", "png", 0.5), ("score", "png", 1.0)]
+    assert [body for _, _, body in responses] == [b"score@1.0"] * 3 + [b"score@0.5"]
+    assert server.counters["rendered"] == 2
+    assert server.counters["coalesced"] == 2
+    assert server.in_flight == {}
+
+
+def test_full_queue_rejects_new_content_with_503(fake_render_job):
+    async def scenario():
+        server = RenderServer(workers=1, max_queue=1)
+        _start(server)
+        try:
+            running = _post(server, "running")
+            await _wait_for(lambda: fake_render_job.calls)
+            queued = _post(server, "queued")
+            await _wait_for(lambda: server.queue.qsize() == 1)
+
+            with pytest.raises(HttpError) as rejected:
+                await server.dispatch("POST", "/render", b"rejected")
+            # 与排队中的任务内容相同的请求不占用队列，直接合并
+            coalesced = _post(server, "queued")
+            await _wait_for(lambda: server.counters["coalesced"] == 1)
+
+            fake_render_job.release.set()
+            responses = await asyncio.gather(running, queued, coalesced)
+        finally:
+            await server.close()
+        return server, rejected.value, responses
+
+    server, rejected, responses = asyncio.run(scenario())
+
+    assert rejected.status == 503
+    assert rejected.headers["Retry-After"] == str(render_server.RETRY_AFTER_SECONDS)
+    assert [body for _, _, body in responses] == [b"running@1.0", b"queued@1.0", b"queued@1.0"]
+    assert [call[0] for call in fake_render_job.calls] == ["running", "queued"]
+    assert server.counters["rejected"] == 1
+    assert server.counters["coalesced"] == 1
+    # 被拒绝的请求不计入延迟样本
+    assert server.stats()["latency_samples"] == 3
@@ -0,0 +1,64 @@
+import base64
+import io
+import os
+import re
+
+from src.scorelang.renderers.pipa_svg_renderer import PipaSVGRenderer
+from src.scorelang.renderers.render_utils import command_glyphs
+
+from tests.conftest import requires_fonts
+
+
+FONT_SRC = re.compile(r'@font-face\{font-family:"([^"]+)";src:url\("([^"]+)"\);\}')
+
+
+def _render_first_page(context, **options) -> str:
+    out = io.StringIO()
+    PipaSVGRenderer(context, **options).render_page(context.render_artifact["png"][0], out)
+    return out.getvalue()
+
+
+def _embedded_font(source: str) -> bytes:
+    mime, data = source.split(";base64,")
+    assert mime == "data:font/ttf"
+    return base64.b64decode(data)
+
+
+@requires_fonts
+def test_fonts_are_subset_per_page_by_default(compile_score):
+    from fontTools.ttLib import TTFont
+
+    context = compile_score()
+    page = context.render_artifact["png"][0]
+    svg = _render_first_page(context)
+
+    sources = dict(FONT_SRC.findall(svg))
+    assert set(sources) == {"pipa-score", "pipa-text"}
+    assert "file://" not in svg
+
+    font_path = context.layout_config.get_font_path("main_char")
+    subset = _embedded_font(sources["pipa-score"])
+    assert len(subset) < os.path.getsize(font_path) / 10
+    # 子集包含本页用到、且原字体中有的全部谱字
+    score_chars = {ord(char) for command in page if command["type"] == "MAIN_CHAR" for char, _, _ in command_glyphs(command)}
+    expected = score_chars & set(TTFont(font_path).getBestCmap())
+    assert set(TTFont(io.BytesIO(subset)).getBestCmap() or {}) == expected
+
+
+@requires_fonts
+def test_fonts_can_be_embedded_whole(compile_score):
+    context = compile_score()
+    svg = _render_first_page(context, fonts="embed")
+
+    font_path = context.layout_config.get_font_path("main_char")
+    with open(font_path, "rb") as f:
+        expected = f.read()
+    assert _embedded_font(dict(FONT_SRC.findall(svg))["pipa-score"]) == expected
+
+
+def test_fonts_can_be_referenced_instead(compile_score):
+    svg = _render_first_page(compile_score(), fonts="reference")
+
+    sources = dict(FONT_SRC.findall(svg))
+    assert all(src.startswith("file://") for src in sources.values())
+    assert "base64" not in svg